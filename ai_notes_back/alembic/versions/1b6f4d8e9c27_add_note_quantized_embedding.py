@@ -0,0 +1,79 @@
+"""add note quantized embedding
+
+Revision ID: 1b6f4d8e9c27
+Revises: e7b93f0c2a58
+Create Date: 2026-10-18 14:00:00.000000
+
+VECTOR_QUANTIZATION float16/int8 ise mevcut embedding'ler chunk'lar halinde
+sıkıştırılır. Backfill yapılmasa da index kurulurken eksik satırlar float32
+kolonundan çevrilir.
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1b6f4d8e9c27'
+down_revision: Union[str, Sequence[str], None] = 'e7b93f0c2a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+BACKFILL_CHUNK_SIZE = int(os.getenv("QUANTIZATION_BACKFILL_CHUNK_SIZE", "1000"))
+
+
+def _quantize(embedding: bytes) -> tuple[bytes, float]:
+    vector = np.frombuffer(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    vector = vector / norm if norm > 0 else vector
+    if VECTOR_QUANTIZATION == "int8":
+        peak = float(np.abs(vector).max()) or 1.0
+        scale = peak / 127.0
+        return np.round(vector / scale).astype(np.int8).tobytes(), scale
+    return vector.astype(np.float16).tobytes(), 1.0
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    columns = {c["name"] for c in sa.inspect(bind).get_columns("notes")}
+    if "embedding_quantized" not in columns:
+        op.add_column("notes", sa.Column("embedding_quantized", sa.LargeBinary(), nullable=True))
+    if "embedding_scale" not in columns:
+        op.add_column("notes", sa.Column("embedding_scale", sa.Float(), nullable=True))
+
+    if VECTOR_QUANTIZATION not in ("float16", "int8"):
+        return
+
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text(
+                "SELECT id, embedding FROM notes "
+                "WHERE id > :last_id AND embedding IS NOT NULL AND embedding_quantized IS NULL "
+                "ORDER BY id LIMIT :chunk"
+            ),
+            {"last_id": last_id, "chunk": BACKFILL_CHUNK_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+
+        params = []
+        for note_id, embedding in rows:
+            data, scale = _quantize(embedding)
+            params.append({"id": note_id, "data": data, "scale": scale})
+        bind.execute(
+            sa.text("UPDATE notes SET embedding_quantized = :data, embedding_scale = :scale WHERE id = :id"),
+            params
+        )
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("notes", "embedding_scale")
+    op.drop_column("notes", "embedding_quantized")
@@ -0,0 +1,32 @@
+"""add note embedding status
+
+Revision ID: 3f1c2a9d7b10
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d7b10'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Tablo Base.metadata.create_all ile yeni oluşturulduysa kolon zaten vardır
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("notes")}
+    if "embedding_status" not in columns:
+        op.add_column("notes", sa.Column("embedding_status", sa.String(), nullable=False, server_default="ready"))
+    op.execute("UPDATE notes SET embedding_status = 'pending' WHERE embedding IS NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("notes", "embedding_status")
@@ -0,0 +1,29 @@
+"""add notes user_id index
+
+Revision ID: 5d0a7c3e8f14
+Revises: 1b6f4d8e9c27
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0a7c3e8f14'
+down_revision: Union[str, Sequence[str], None] = '1b6f4d8e9c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Arama filtreleri ve index kurulumu her zaman user_id ile başlar
+    op.execute("CREATE INDEX IF NOT EXISTS ix_notes_user_id ON notes (user_id)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_notes_user_id")
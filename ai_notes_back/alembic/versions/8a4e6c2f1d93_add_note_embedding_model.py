@@ -0,0 +1,39 @@
+"""add note embedding model and dimension
+
+Revision ID: 8a4e6c2f1d93
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4e6c2f1d93'
+down_revision: Union[str, Sequence[str], None] = '3f1c2a9d7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("notes")}
+    if "embedding_model" not in columns:
+        op.add_column("notes", sa.Column("embedding_model", sa.String(), nullable=True))
+    if "embedding_dim" not in columns:
+        op.add_column("notes", sa.Column("embedding_dim", sa.Integer(), nullable=True))
+    # Bu revizyondan önceki tüm embedding'ler OpenAI text-embedding-3-small ile üretildi
+    op.execute(
+        "UPDATE notes SET embedding_model = 'openai:text-embedding-3-small', "
+        "embedding_dim = length(embedding) / 4 "
+        "WHERE embedding IS NOT NULL AND embedding_model IS NULL"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("notes", "embedding_dim")
+    op.drop_column("notes", "embedding_model")
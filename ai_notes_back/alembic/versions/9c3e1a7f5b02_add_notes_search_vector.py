@@ -0,0 +1,65 @@
+"""add notes full-text search vector
+
+Revision ID: 9c3e1a7f5b02
+Revises: 5d0a7c3e8f14
+Create Date: 2026-10-18 16:00:00.000000
+
+Sadece Postgres'te şema değiştirir; diğer veritabanlarında keyword arama LIKE ile çalışır.
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e1a7f5b02'
+down_revision: Union[str, Sequence[str], None] = '5d0a7c3e8f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FULLTEXT_CONFIG = os.getenv("FULLTEXT_CONFIG", "simple")
+BACKFILL_CHUNK_SIZE = int(os.getenv("FULLTEXT_BACKFILL_CHUNK_SIZE", "1000"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    columns = {c["name"] for c in sa.inspect(bind).get_columns("notes")}
+    if "search_vector" not in columns:
+        op.add_column("notes", sa.Column("search_vector", postgresql.TSVECTOR(), nullable=True))
+
+    # Tablo tek UPDATE ile kilitlenmesin diye id üzerinden chunk'lar halinde doldurulur
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text(
+                "UPDATE notes SET search_vector = to_tsvector(CAST(:config AS regconfig), "
+                "coalesce(title, '') || ' ' || coalesce(content, '')) "
+                "WHERE id IN (SELECT id FROM notes WHERE id > :last_id ORDER BY id LIMIT :chunk) "
+                "RETURNING id"
+            ),
+            {"config": FULLTEXT_CONFIG, "last_id": last_id, "chunk": BACKFILL_CHUNK_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        last_id = max(note_id for note_id, in rows)
+
+    op.execute("CREATE INDEX IF NOT EXISTS ix_notes_search_vector ON notes USING gin (search_vector)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    columns = {c["name"] for c in sa.inspect(bind).get_columns("notes")}
+    if "search_vector" in columns:
+        op.execute("DROP INDEX IF EXISTS ix_notes_search_vector")
+        op.drop_column("notes", "search_vector")
@@ -0,0 +1,37 @@
+"""add note embedding content hash
+
+Revision ID: c52d8e7a4b61
+Revises: 8a4e6c2f1d93
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52d8e7a4b61'
+down_revision: Union[str, Sequence[str], None] = '8a4e6c2f1d93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("notes")}
+    if "embedding_hash" not in columns:
+        op.add_column("notes", sa.Column("embedding_hash", sa.String(length=64), nullable=True))
+    # Mevcut embedding'ler notun şu anki içeriğinden üretildi (update embedding'i yenilemiyordu,
+    # bu yüzden güncellenmiş notlarda hash bilinmiyor sayılır ve bir sonraki yazmada yenilenir)
+    op.execute(
+        "UPDATE notes SET embedding_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex') "
+        "WHERE embedding IS NOT NULL AND embedding_hash IS NULL "
+        "AND NOT EXISTS (SELECT 1 FROM note_versions v WHERE v.note_id = notes.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("notes", "embedding_hash")
@@ -0,0 +1,35 @@
+"""add note embedding updated_at
+
+Revision ID: d4a1f6b2c839
+Revises: 9c3e1a7f5b02
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a1f6b2c839'
+down_revision: Union[str, Sequence[str], None] = '9c3e1a7f5b02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("notes")}
+    if "embedding_updated_at" not in columns:
+        op.add_column("notes", sa.Column("embedding_updated_at", sa.DateTime(timezone=True), nullable=True))
+    # Mevcut embedding'ler en geç notun son güncellemesinde yazılmıştır
+    op.execute(
+        "UPDATE notes SET embedding_updated_at = updated_at "
+        "WHERE embedding IS NOT NULL AND embedding_updated_at IS NULL"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("notes", "embedding_updated_at")
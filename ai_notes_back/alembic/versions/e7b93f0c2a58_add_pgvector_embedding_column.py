@@ -0,0 +1,87 @@
+"""add pgvector embedding column
+
+Revision ID: e7b93f0c2a58
+Revises: c52d8e7a4b61
+Create Date: 2026-10-18 13:00:00.000000
+
+Sadece VECTOR_BACKEND=pgvector iken şema değiştirir; aksi halde no-op'tur.
+pgvector sonradan açılırsa bu revizyona downgrade edip tekrar upgrade edin.
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b93f0c2a58'
+down_revision: Union[str, Sequence[str], None] = 'c52d8e7a4b61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "memory")
+PGVECTOR_DIM = int(os.getenv("PGVECTOR_DIM", "1536"))
+PGVECTOR_INDEX = os.getenv("PGVECTOR_INDEX", "hnsw")
+BACKFILL_CHUNK_SIZE = int(os.getenv("PGVECTOR_BACKFILL_CHUNK_SIZE", "1000"))
+
+
+def _backfill(bind) -> None:
+    # bytea -> vector dönüşümü chunk'lar halinde, id üzerinden keyset pagination ile
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text(
+                "SELECT id, embedding FROM notes "
+                "WHERE id > :last_id AND embedding IS NOT NULL AND embedding_vector IS NULL "
+                "AND embedding_dim = :dim ORDER BY id LIMIT :chunk"
+            ),
+            {"last_id": last_id, "dim": PGVECTOR_DIM, "chunk": BACKFILL_CHUNK_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+
+        params = [
+            {
+                "id": note_id,
+                "vector": "[" + ",".join(map(str, np.frombuffer(embedding, dtype=np.float32).tolist())) + "]"
+            }
+            for note_id, embedding in rows
+        ]
+        bind.execute(sa.text("UPDATE notes SET embedding_vector = CAST(:vector AS vector) WHERE id = :id"), params)
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if VECTOR_BACKEND != "pgvector":
+        return
+
+    bind = op.get_bind()
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    columns = {c["name"] for c in sa.inspect(bind).get_columns("notes")}
+    if "embedding_vector" not in columns:
+        op.execute(f"ALTER TABLE notes ADD COLUMN embedding_vector vector({PGVECTOR_DIM})")
+
+    _backfill(bind)
+
+    # Index backfill'den sonra kurulur; satır satır index güncellemekten çok daha hızlı
+    if PGVECTOR_INDEX == "hnsw":
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_notes_embedding_vector ON notes "
+            "USING hnsw (embedding_vector vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+        )
+    else:
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_notes_embedding_vector ON notes "
+            "USING ivfflat (embedding_vector vector_cosine_ops) WITH (lists = 100)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("notes")}
+    if "embedding_vector" in columns:
+        op.execute("DROP INDEX IF EXISTS ix_notes_embedding_vector")
+        op.drop_column("notes", "embedding_vector")
@@ -0,0 +1,37 @@
+"""add embedding migration claim
+
+Revision ID: f2c8a4d6e913
+Revises: d4a1f6b2c839
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8a4d6e913'
+down_revision: Union[str, Sequence[str], None] = 'd4a1f6b2c839'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    # Tablo henüz yoksa uygulama açılışında create_all ile bu kolonlarla oluşturulur
+    if "embedding_migrations" not in inspector.get_table_names():
+        return
+    columns = {c["name"] for c in inspector.get_columns("embedding_migrations")}
+    if "claimed_by" not in columns:
+        op.add_column("embedding_migrations", sa.Column("claimed_by", sa.String(length=64), nullable=True))
+    if "heartbeat_at" not in columns:
+        op.add_column("embedding_migrations", sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("embedding_migrations", "heartbeat_at")
+    op.drop_column("embedding_migrations", "claimed_by")
@@ -1,12 +1,14 @@
-import openai
-import os
-from dotenv import load_dotenv
+import json
+import re
 
-load_dotenv()
+from app.api.llm_client import llm_client
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Prompt değiştiğinde artırılır; önbellekteki eski sonuçlar geçersiz sayılır
+PROMPT_VERSION = "1"
 
-def generate_tags(title: str, content: str, tags: list[str]):
+_JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+async def generate_tags(title: str, content: str, tags: list[str]):
     tags_str = ", ".join(tags) if tags else "none"
 
     prompt = f"""
@@ -19,9 +21,8 @@ Content:
 {content}
 """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4o-mini",     # veya gpt-4o
-        messages=[
+    raw_tags = await llm_client.chat(
+        [
             {"role": "system", "content": "You are an assistant that suggests concise tags for notes."},
             {"role": "user", "content": prompt}
         ],
@@ -29,7 +30,49 @@ Content:
         max_tokens=60
     )
 
-    raw_tags = response["choices"][0]["message"]["content"].strip()
     tags_list = [t.strip() for t in raw_tags.split(",") if t.strip()]
 
     return {"tags": tags_list}
+
+
+async def generate_tags_batch(notes: list[tuple[int, str, str]], max_tags: int = 5, max_chars: int = 1500):
+    # Birden fazla not tek prompt'ta etiketlenir; yanıt not id'sinden tag listesine JSON nesnesidir
+    blocks = "\n\n".join(
+        f"Note {note_id}:\nTitle: {title}\nContent:\n{content[:max_chars]}"
+        for note_id, title, content in notes
+    )
+    prompt = f"""
+Suggest up to {max_tags} relevant tags for each of the following notes.
+Return only a JSON object that maps each note id to a list of tags, for example {{"12": ["python", "async"]}}.
+
+{blocks}
+"""
+
+    raw = await llm_client.chat(
+        [
+            {"role": "system", "content": "You are an assistant that suggests concise tags for notes."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.3,
+        max_tokens=40 * len(notes) + 20
+    )
+
+    match = _JSON_RE.search(raw)
+    try:
+        parsed = json.loads(match.group(0)) if match else {}
+    except ValueError:
+        parsed = {}
+    if not isinstance(parsed, dict):
+        parsed = {}
+
+    requested = {note_id for note_id, _, _ in notes}
+    result = {}
+    for key, tags in parsed.items():
+        try:
+            note_id = int(key)
+        except (TypeError, ValueError):
+            continue
+        if note_id not in requested or not isinstance(tags, list):
+            continue
+        result[note_id] = [str(tag).strip().lstrip("#").strip() for tag in tags if str(tag).strip()][:max_tags]
+    return result
@@ -1,21 +1,174 @@
-import openai
 import os
+import time
+import hashlib
+import threading
 import numpy as np
+from collections import OrderedDict
 from dotenv import load_dotenv
 
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.api.embedding_providers import EmbeddingProvider, get_provider
+from app.core.database import SessionLocal
+from app.core.model import EmbeddingCache
+
 load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
 
-def get_embedding(text: str, model: str = "text-embedding-3-small") -> bytes:
-    if not text:
-        return b""
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class EmbeddingLRUCache:
+    """(provider key, sha256(text)) -> embedding byte'ları için TTL'li bellek içi LRU."""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value: bytes):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = sum(self.stats.values())
+            hits = self.stats["memory_hits"] + self.stats["db_hits"]
+            return {
+                **self.stats,
+                "size": len(self._data),
+                "hit_rate": (hits / lookups) if lookups > 0 else 0.0
+            }
+
+
+embedding_cache = EmbeddingLRUCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# IN listesindeki parametre sayısı veritabanı sınırlarının altında tutulur
+_CACHE_QUERY_CHUNK = 500
 
-    response = openai.Embedding.create(
-        model=model,
-        input=text
-    )
 
-    embedding_list = response.data[0].embedding
-    embedding_array = np.array(embedding_list, dtype=np.float32)
-    return embedding_array.tobytes()
+def _load_cached_embeddings(model: str, text_hashes: list[str]) -> dict[str, bytes]:
+    # Tüm eksikler tek oturum ve (parça başına) tek sorguyla okunur
+    db = SessionLocal()
+    try:
+        found = {}
+        for start in range(0, len(text_hashes), _CACHE_QUERY_CHUNK):
+            found.update(db.query(EmbeddingCache.text_hash, EmbeddingCache.embedding).filter(
+                EmbeddingCache.model.__eq__(model),
+                EmbeddingCache.text_hash.in_(text_hashes[start:start + _CACHE_QUERY_CHUNK])
+            ).all())
+        return found
+    except Exception as err:
+        print(f"Embedding cache read failed: {err}")
+        return {}
+    finally:
+        db.close()
+
+
+def _store_cached_embeddings(model: str, embeddings: dict[str, bytes]):
+    db = SessionLocal()
+    try:
+        insert = _INSERTS.get(db.get_bind().dialect.name)
+        rows = [{"model": model, "text_hash": text_hash, "embedding": embedding}
+                for text_hash, embedding in embeddings.items()]
+        if insert is not None:
+            # Aynı anahtar başka bir istek tarafından yazılmış olabilir; o satırlar atlanır
+            db.execute(insert(EmbeddingCache).on_conflict_do_nothing(index_elements=["model", "text_hash"]), rows)
+        else:
+            db.execute(EmbeddingCache.__table__.insert(), rows)
+        db.commit()
+    except Exception as err:
+        db.rollback()
+        print(f"Embedding cache write skipped: {err}")
+    finally:
+        db.close()
+
+
+def active_embedding_model() -> str:
+    return get_provider().key
+
+
+def get_embeddings(texts: list[str], provider: EmbeddingProvider = None) -> list[bytes]:
+    provider = provider or get_provider()
+    if not provider.cacheable:
+        return [np.asarray(v, dtype=np.float32).tobytes() if text else b""
+                for text, v in zip(texts, provider.embed(texts))]
+
+    model = provider.key
+    results = [b""] * len(texts)
+    # text_hash -> (text, pozisyonlar)
+    pending = {}
+
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+
+        text_hash = content_hash(text)
+        cached = embedding_cache.get((model, text_hash))
+        if cached is not None:
+            embedding_cache.count("memory_hits")
+            results[i] = cached
+            continue
+        pending.setdefault(text_hash, (text, []))[1].append(i)
+
+    stored = _load_cached_embeddings(model, list(pending)) if pending else {}
+    missing = {}
+    for text_hash, (text, positions) in pending.items():
+        embedding_bytes = stored.get(text_hash)
+        if embedding_bytes:
+            embedding_cache.set((model, text_hash), embedding_bytes)
+            for i in positions:
+                embedding_cache.count("db_hits")
+                results[i] = embedding_bytes
+            continue
+        for _ in positions:
+            embedding_cache.count("misses")
+        missing[text_hash] = (text, positions)
+
+    if missing:
+        batch = list(missing.items())
+        vectors = provider.embed([text for _, (text, _) in batch])
+        created = {}
+        for (text_hash, (_, positions)), vector in zip(batch, vectors):
+            embedding_bytes = np.asarray(vector, dtype=np.float32).tobytes()
+            embedding_cache.set((model, text_hash), embedding_bytes)
+            created[text_hash] = embedding_bytes
+            for i in positions:
+                results[i] = embedding_bytes
+        _store_cached_embeddings(model, created)
+
+    return results
+
+
+def get_embedding(text: str, provider: EmbeddingProvider = None) -> bytes:
+    if not text:
+        return b""
+    return get_embeddings([text], provider=provider)[0]
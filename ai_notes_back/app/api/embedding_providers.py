@@ -0,0 +1,172 @@
+import openai
+import os
+import re
+import hashlib
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# "openai", "hashing" (tamamen lokal, CPU) ya da "fake" (testler için)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "512"))
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", "64"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class EmbeddingProvider:
+    """Embedding sağlayıcıları için ortak arayüz.
+
+    `key` hem provider'ı hem modeli/boyutu tanımlar ve notlarla birlikte
+    saklanır; farklı key ile üretilmiş vektörler asla aynı aramada
+    karşılaştırılmaz.
+    """
+
+    name = ""
+    model = ""
+    dim = 0
+    # Lokal provider'larda hesaplama cache'e gidip gelmekten daha ucuz
+    cacheable = False
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    @classmethod
+    def from_model(cls, model: str) -> "EmbeddingProvider":
+        # Saklanan key'in model kısmından provider'ı yeniden kurar
+        raise NotImplementedError
+
+    def embed(self, texts: list[str]) -> list[np.ndarray]:
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    name = "openai"
+    cacheable = True
+
+    def __init__(self, model: str = OPENAI_EMBEDDING_MODEL):
+        self.model = model
+        self.dim = 3072 if model.endswith("-large") else 1536
+
+    @classmethod
+    def from_model(cls, model: str) -> "OpenAIEmbeddingProvider":
+        return cls(model)
+
+    def embed(self, texts: list[str]) -> list[np.ndarray]:
+        # Embeddings API tek istekte birden fazla input kabul ediyor
+        response = openai.Embedding.create(
+            model=self.model,
+            input=texts
+        )
+
+        data = sorted(response.data, key=lambda item: item.index)
+        return [np.array(item.embedding, dtype=np.float32) for item in data]
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Ağ gerektirmeyen hashing vectorizer.
+
+    Kelimeler, kelime ikilileri ve karakter üçlüleri işaretli hash ile `dim`
+    kovaya dağıtılır, sublinear tf uygulanır ve vektör normalize edilir.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = HASHING_EMBEDDING_DIM):
+        self.dim = dim
+        self.model = f"hashing-v1-{dim}"
+
+    @classmethod
+    def from_model(cls, model: str) -> "HashingEmbeddingProvider":
+        return cls(int(model.rsplit("-", 1)[1]))
+
+    @staticmethod
+    def _features(text: str) -> list[str]:
+        words = _TOKEN_RE.findall(text.lower())
+        features = [f"w:{w}" for w in words]
+        features += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+        for w in words:
+            padded = f"<{w}>"
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return features
+
+    def _vectorize(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features = self._features(text)
+        if not features:
+            return vector
+
+        # Python'un hash()'i process'e göre değiştiği için sabit bir hash kullanılır
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "little") for f in features],
+            dtype=np.uint64
+        )
+        buckets = (hashes % np.uint64(self.dim)).astype(np.int64)
+        signs = np.where((hashes >> np.uint64(63)) == 0, 1.0, -1.0).astype(np.float32)
+        np.add.at(vector, buckets, signs)
+
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed(self, texts: list[str]) -> list[np.ndarray]:
+        return [self._vectorize(text) for text in texts]
+
+
+class FakeEmbeddingProvider(EmbeddingProvider):
+    """Metnin hash'inden türetilen deterministik rastgele vektörler (offline testler için)."""
+
+    name = "fake"
+
+    def __init__(self, dim: int = FAKE_EMBEDDING_DIM):
+        self.dim = dim
+        self.model = f"fake-{dim}"
+
+    @classmethod
+    def from_model(cls, model: str) -> "FakeEmbeddingProvider":
+        return cls(int(model.rsplit("-", 1)[1]))
+
+    def embed(self, texts: list[str]) -> list[np.ndarray]:
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vectors.append(np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32))
+        return vectors
+
+
+PROVIDERS = {
+    "openai": OpenAIEmbeddingProvider,
+    "hashing": HashingEmbeddingProvider,
+    "fake": FakeEmbeddingProvider,
+}
+
+_provider = None
+
+
+def get_provider() -> EmbeddingProvider:
+    global _provider
+    if _provider is None:
+        if EMBEDDING_PROVIDER not in PROVIDERS:
+            raise ValueError(f"Unknown EMBEDDING_PROVIDER: {EMBEDDING_PROVIDER}")
+        _provider = PROVIDERS[EMBEDDING_PROVIDER]()
+    return _provider
+
+
+_providers_by_key = {}
+
+
+def provider_for_key(key: str) -> EmbeddingProvider:
+    # Model migration sırasında eski modelle sorgu embed etmek için kullanılır
+    if key == get_provider().key:
+        return get_provider()
+    if key not in _providers_by_key:
+        name, _, model = key.partition(":")
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown embedding provider in key: {key}")
+        _providers_by_key[key] = PROVIDERS[name].from_model(model)
+    return _providers_by_key[key]
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import random
+import time
+
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+openai.api_key = os.getenv("OPENAI_API_KEY")
+# Lokal stub sunucu (app.api.llm_stub) ya da OpenAI uyumlu başka bir uç nokta için
+if os.getenv("OPENAI_API_BASE"):
+    openai.api_base = os.getenv("OPENAI_API_BASE")
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+# Aynı anda provider'a giden en fazla istek
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Slot bekleyen istek sayısı bunu aşarsa ya da bekleme LLM_QUEUE_TIMEOUT'u geçerse 503 dönülür
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "2"))
+# Tek bir completion denemesi için süre sınırı (saniye)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+# Art arda bu kadar başarısız çağrıdan sonra devre açılır ve LLM_BREAKER_COOLDOWN saniye istek gönderilmez
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Yeniden denemeye değer hatalar; geçersiz istek ya da yetki hataları hemen döner
+_RETRYABLE = (
+    asyncio.TimeoutError,
+    openai.error.Timeout,
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+)
+
+
+class LLMUnavailable(Exception):
+    """LLM şu an istek kabul etmiyor (kuyruk dolu, devre açık ya da denemeler tükendi)."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """closed -> (art arda hatalar) -> open -> (cooldown) -> half-open -> tek deneme.
+
+    half-open durumunda sadece bir istek geçer; başarılıysa devre kapanır,
+    değilse cooldown baştan başlar.
+    """
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(1.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def end_probe(self):
+        # Deneme sonuçlanmadan bittiyse (iptal, kuyruk reddi) bir sonraki istek tekrar deneyebilir
+        self._probing = False
+
+
+class LLMClient:
+    """Chat completion çağrıları için async istemci.
+
+    Çağrılar event loop'u bloklamaz; eşzamanlılık semaphore ile sınırlanır,
+    slot beklemesi uzarsa istek sıraya yığılmak yerine LLMUnavailable ile
+    reddedilir. Geçici hatalar jitter'lı üstel bekleme ile yeniden denenir.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.breaker = CircuitBreaker()
+        self._semaphore = None
+        self._waiting = 0
+        self._in_flight = 0
+        self.stats = {"calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "timeouts": 0, "rejected": 0, "cancelled": 0}
+
+    async def _acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise LLMUnavailable("LLM queue is full")
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), LLM_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise LLMUnavailable("LLM is busy, try again later")
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+
+    def _release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    async def _attempt(self, messages: list[dict], temperature: float, max_tokens: int) -> str:
+        await self._acquire()
+        try:
+            response = await asyncio.wait_for(
+                openai.ChatCompletion.acreate(
+                    model=LLM_MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    request_timeout=LLM_TIMEOUT
+                ),
+                LLM_TIMEOUT
+            )
+        finally:
+            self._release()
+        return response["choices"][0]["message"]["content"].strip()
+
+    async def chat(self, messages: list[dict], temperature: float = 0.2, max_tokens: int = 256) -> str:
+        self.stats["calls"] += 1
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            if not self.breaker.allow():
+                self.stats["rejected"] += 1
+                raise LLMUnavailable("LLM circuit is open", retry_after=self.breaker.retry_after())
+            try:
+                content = await self._attempt(messages, temperature, max_tokens)
+                self.breaker.record_success()
+                self.stats["succeeded"] += 1
+                return content
+            except LLMUnavailable:
+                raise
+            except _RETRYABLE as err:
+                self.breaker.record_failure()
+                if isinstance(err, (asyncio.TimeoutError, openai.error.Timeout)):
+                    self.stats["timeouts"] += 1
+                if attempt == LLM_MAX_RETRIES:
+                    self.stats["failed"] += 1
+                    raise LLMUnavailable(f"LLM request failed: {err}")
+                self.stats["retries"] += 1
+                # Full jitter: aynı anda düşen istekler aynı anda yeniden denemez
+                await asyncio.sleep(random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt)))
+            except Exception:
+                self.stats["failed"] += 1
+                raise
+            finally:
+                self.breaker.end_probe()
+
+    async def stream(self, messages: list[dict], temperature: float = 0.2, max_tokens: int = 256):
+        """Completion'ı token parçaları halinde döner (async generator).
+
+        Slot, stream bitene ya da tüketici bırakana kadar tutulur; generator
+        kapatıldığında (istemci bağlantıyı kestiğinde) upstream bağlantı da
+        kapatılır. İlk parça gelmeden önceki hatalar yeniden denenir, sonrasında
+        kısmi yanıt tekrarlanamayacağı için LLMUnavailable fırlatılır.
+        LLM_TIMEOUT her parça için ayrı uygulanır.
+        """
+        self.stats["calls"] += 1
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            if not self.breaker.allow():
+                self.stats["rejected"] += 1
+                raise LLMUnavailable("LLM circuit is open", retry_after=self.breaker.retry_after())
+            started = False
+            try:
+                await self._acquire()
+                try:
+                    async with asyncio.timeout(LLM_TIMEOUT):
+                        chunks = await openai.ChatCompletion.acreate(
+                            model=LLM_MODEL,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            request_timeout=LLM_TIMEOUT,
+                            stream=True
+                        )
+                    try:
+                        while True:
+                            try:
+                                async with asyncio.timeout(LLM_TIMEOUT):
+                                    chunk = await anext(chunks)
+                            except StopAsyncIteration:
+                                break
+                            delta = chunk["choices"][0].get("delta", {}).get("content")
+                            if not delta:
+                                continue
+                            if not started:
+                                started = True
+                                self.breaker.record_success()
+                            yield delta
+                    finally:
+                        await chunks.aclose()
+                finally:
+                    self._release()
+                self.breaker.record_success()
+                self.stats["succeeded"] += 1
+                return
+            except LLMUnavailable:
+                raise
+            except (asyncio.CancelledError, GeneratorExit):
+                self.stats["cancelled"] += 1
+                raise
+            except _RETRYABLE as err:
+                self.breaker.record_failure()
+                if isinstance(err, (asyncio.TimeoutError, openai.error.Timeout)):
+                    self.stats["timeouts"] += 1
+                if started or attempt == LLM_MAX_RETRIES:
+                    self.stats["failed"] += 1
+                    raise LLMUnavailable(f"LLM request failed: {err}")
+                self.stats["retries"] += 1
+                await asyncio.sleep(random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt)))
+            except Exception:
+                self.stats["failed"] += 1
+                raise
+            finally:
+                self.breaker.end_probe()
+
+    def free_slots(self) -> int:
+        # Arka plan işleri interaktif isteklere yer bırakmak için buna bakar
+        if self.breaker.state != "closed":
+            return 0
+        return max(0, self.max_concurrency - self._in_flight - self._waiting)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "circuit": self.breaker.state
+        }
+
+
+llm_client = LLMClient()
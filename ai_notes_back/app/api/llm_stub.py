@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+# OpenAI chat completion API'sini taklit eden lokal sunucu; gerçek anahtar ve ağ olmadan
+# LLM istemcisinin gecikme, hata ve eşzamanlılık davranışını denemek için kullanılır.
+#   uvicorn app.api.llm_stub:app --port 8001
+#   OPENAI_API_BASE=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub uvicorn app.main:app
+
+# Her yanıttan önce beklenen süre (saniye) ve 500 dönme olasılığı
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0.2"))
+LLM_STUB_FAILURE_RATE = float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+# stream=True isteklerinde parçalar arası bekleme
+LLM_STUB_TOKEN_DELAY = float(os.getenv("LLM_STUB_TOKEN_DELAY", "0.05"))
+
+_WORD_RE = re.compile(r"\w{4,}", re.UNICODE)
+_NOTE_RE = re.compile(r"^Note (\d+):$", re.MULTILINE)
+
+app = FastAPI()
+app.state.requests = 0
+app.state.in_flight = 0
+app.state.max_in_flight = 0
+app.state.disconnects = 0
+
+
+def _top_words(text: str) -> list[str]:
+    text = text.replace("Title:", "").replace("Content:", "")
+    words = Counter(word.lower() for word in _WORD_RE.findall(text))
+    return [word for word, _ in words.most_common(5)]
+
+
+def _reply(prompt: str) -> str:
+    # Toplu tag prompt'unda ("Note <id>:" blokları) her not için JSON, diğerlerinde notun
+    # en sık kelimeleri virgülle döner; hem özet hem tag yanıtı olarak kullanılabilir
+    blocks = _NOTE_RE.split(prompt)
+    if len(blocks) > 1:
+        return json.dumps({note_id: _top_words(block) for note_id, block in zip(blocks[1::2], blocks[2::2])})
+    return ", ".join(_top_words(prompt.split("Content:", 1)[-1])) or "stub"
+
+
+async def _stream(body: dict, reply: str):
+    # OpenAI stream formatı: her parça bir "data:" satırı, sonunda [DONE]
+    app.state.in_flight += 1
+    app.state.max_in_flight = max(app.state.max_in_flight, app.state.in_flight)
+    try:
+        for index, token in enumerate(reply.split(" ")):
+            await asyncio.sleep(LLM_STUB_TOKEN_DELAY)
+            chunk = {
+                "id": f"chatcmpl-stub-{app.state.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {"content": token if index == 0 else " " + token}, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+    except asyncio.CancelledError:
+        app.state.disconnects += 1
+        raise
+    finally:
+        app.state.in_flight -= 1
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests += 1
+    if body.get("stream"):
+        await asyncio.sleep(LLM_STUB_LATENCY)
+        if random.random() < LLM_STUB_FAILURE_RATE:
+            raise HTTPException(status_code=500, detail="stub failure")
+        return StreamingResponse(_stream(body, _reply(body["messages"][-1]["content"])), media_type="text/event-stream")
+
+    app.state.in_flight += 1
+    app.state.max_in_flight = max(app.state.max_in_flight, app.state.in_flight)
+    try:
+        await asyncio.sleep(LLM_STUB_LATENCY)
+        if random.random() < LLM_STUB_FAILURE_RATE:
+            raise HTTPException(status_code=500, detail="stub failure")
+        prompt = body["messages"][-1]["content"]
+        return {
+            "id": f"chatcmpl-stub-{app.state.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": _reply(prompt)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+    finally:
+        app.state.in_flight -= 1
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "requests": app.state.requests,
+        "in_flight": app.state.in_flight,
+        "max_in_flight": app.state.max_in_flight,
+        "disconnects": app.state.disconnects
+    }
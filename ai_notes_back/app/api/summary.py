@@ -1,12 +1,9 @@
-import openai
-import os
-from dotenv import load_dotenv
+from app.api.llm_client import llm_client
 
-load_dotenv()
+# Prompt değiştiğinde artırılır; önbellekteki eski sonuçlar geçersiz sayılır
+PROMPT_VERSION = "1"
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-def generate_summary(title: str, content: str, tags: list[str]):
+def _messages(title: str, content: str, tags: list[str]):
     tags_str = ", ".join(tags) if tags else "none"
 
     prompt = f"""
@@ -32,14 +29,26 @@ Content:
 {content}
 """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4o-mini",     # veya gpt-4o
-        messages=[
-            {"role": "system", "content": "You summarize user notes."},
-            {"role": "user", "content": prompt}
-        ],
+    return [
+        {"role": "system", "content": "You summarize user notes."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def generate_summary(title: str, content: str, tags: list[str]):
+    summary = await llm_client.chat(
+        _messages(title, content, tags),
         temperature=0.2,
         max_tokens=256
     )
 
-    return response["choices"][0]["message"]["content"].strip()
+    return summary
+
+
+def stream_summary(title: str, content: str, tags: list[str]):
+    # Özet parçaları modelden geldikçe döner
+    return llm_client.stream(
+        _messages(title, content, tags),
+        temperature=0.2,
+        max_tokens=256
+    )
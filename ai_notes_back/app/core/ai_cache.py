@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timezone, timedelta
+
+from dotenv import load_dotenv
+
+from app.api import summary as summary_prompt, ai_tags as tags_prompt
+from app.api.embedding import content_hash
+from app.api.llm_client import llm_client, LLM_MODEL, LLMUnavailable
+from app.core.database import SessionLocal
+from app.core.model import Notes, NoteAIResults
+
+load_dotenv()
+
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+# Son düzenlenen notların özetleri arka planda önceden üretilir
+AI_SUMMARY_PRECOMPUTE = os.getenv("AI_SUMMARY_PRECOMPUTE", "false").lower() == "true"
+AI_PRECOMPUTE_INTERVAL = int(os.getenv("AI_PRECOMPUTE_INTERVAL", "300"))
+# Son kaç dakikada düzenlenen notlar aday sayılır
+AI_PRECOMPUTE_WINDOW = int(os.getenv("AI_PRECOMPUTE_WINDOW", "60"))
+AI_PRECOMPUTE_BATCH = int(os.getenv("AI_PRECOMPUTE_BATCH", "20"))
+# Arka plan işi, interaktif istekler için bu kadar LLM slotunu boş bırakır
+AI_PRECOMPUTE_RESERVED_SLOTS = int(os.getenv("AI_PRECOMPUTE_RESERVED_SLOTS", "2"))
+
+SUMMARY = "summary"
+TAGS = "tags"
+_PROMPT_VERSIONS = {SUMMARY: summary_prompt.PROMPT_VERSION, TAGS: tags_prompt.PROMPT_VERSION}
+
+
+def input_hash(title: str, content: str, tags: list[str]) -> str:
+    # Prompt'a giren her alan hash'e dahildir; tag sırası sonucu değiştirmez
+    return content_hash(json.dumps([title, content, sorted(tags)], ensure_ascii=False))
+
+
+def note_hash(note: Notes) -> str:
+    return input_hash(note.title, note.content, [t.name for t in note.tags])
+
+
+def lookup(db, note_id: int, kind: str, text_hash: str) -> str | None:
+    if not AI_CACHE_ENABLED:
+        return None
+    row = db.query(NoteAIResults.result).filter(
+        NoteAIResults.note_id.__eq__(note_id),
+        NoteAIResults.kind.__eq__(kind),
+        NoteAIResults.content_hash.__eq__(text_hash),
+        NoteAIResults.prompt_version.__eq__(_PROMPT_VERSIONS[kind]),
+        NoteAIResults.model.__eq__(LLM_MODEL)
+    ).first()
+    return row[0] if row else None
+
+
+def store(db, note_id: int, user_id: int, kind: str, text_hash: str, result: str):
+    # Not başına tür başına tek satır tutulur; yeni sonuç eskisinin yerine geçer
+    if not AI_CACHE_ENABLED:
+        return
+    db.merge(NoteAIResults(
+        note_id=note_id,
+        kind=kind,
+        user_id=user_id,
+        content_hash=text_hash,
+        prompt_version=_PROMPT_VERSIONS[kind],
+        model=LLM_MODEL,
+        result=result,
+        created_at=datetime.now(timezone.utc)
+    ))
+    db.commit()
+
+
+def _prompt_inputs(note: Notes) -> tuple[str, str, list[str]]:
+    return note.title, note.content, [t.name for t in note.tags]
+
+
+async def get_summary(db, note: Notes) -> tuple[str, bool]:
+    # (özet, önbellekten mi); sync session thread'de kullanılır, event loop sadece LLM'i bekler
+    title, content, tags = await asyncio.to_thread(_prompt_inputs, note)
+    text_hash = input_hash(title, content, tags)
+    cached = await asyncio.to_thread(lookup, db, note.id, SUMMARY, text_hash)
+    if cached is not None:
+        return cached, True
+    summary = await summary_prompt.generate_summary(title=title, content=content, tags=tags)
+    await asyncio.to_thread(store, db, note.id, note.user_id, SUMMARY, text_hash, summary)
+    return summary, False
+
+
+async def get_tags(db, note: Notes) -> tuple[list[str], bool]:
+    title, content, tags = await asyncio.to_thread(_prompt_inputs, note)
+    text_hash = input_hash(title, content, tags)
+    cached = await asyncio.to_thread(lookup, db, note.id, TAGS, text_hash)
+    if cached is not None:
+        return json.loads(cached), True
+    result = await tags_prompt.generate_tags(title=title, content=content, tags=tags)
+    await asyncio.to_thread(store, db, note.id, note.user_id, TAGS, text_hash,
+                            json.dumps(result["tags"], ensure_ascii=False))
+    return result["tags"], False
+
+
+class SummaryPrecomputer:
+    """Son düzenlenen notların özetlerini boşta kalan LLM kapasitesiyle üretir.
+
+    Uygulamanın event loop'unda çalışır, böylece interaktif isteklerle aynı
+    semaphore ve circuit breaker'ı paylaşır; boş slot azsa tur atlanır.
+    """
+
+    def __init__(self):
+        self._task = None
+        self.stats = {"runs": 0, "precomputed": 0, "skipped_busy": 0, "errors": 0}
+
+    def start(self):
+        if not AI_SUMMARY_PRECOMPUTE or not AI_CACHE_ENABLED:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def _candidates(self) -> list[tuple[int, int, str, str, list[str]]]:
+        db = SessionLocal()
+        try:
+            since = datetime.now(timezone.utc) - timedelta(minutes=AI_PRECOMPUTE_WINDOW)
+            notes = db.query(Notes).filter(
+                Notes.updated_at >= since,
+                Notes.deleted_at.__eq__(None)
+            ).order_by(Notes.updated_at.desc()).limit(AI_PRECOMPUTE_BATCH * 4).all()
+            hashes = {note.id: note_hash(note) for note in notes}
+            valid = {
+                note_id
+                for note_id, text_hash in db.query(NoteAIResults.note_id, NoteAIResults.content_hash).filter(
+                    NoteAIResults.note_id.in_(list(hashes)),
+                    NoteAIResults.kind.__eq__(SUMMARY),
+                    NoteAIResults.prompt_version.__eq__(summary_prompt.PROMPT_VERSION),
+                    NoteAIResults.model.__eq__(LLM_MODEL)
+                ).all()
+                if hashes.get(note_id) == text_hash
+            }
+            return [
+                (note.id, note.user_id, note.title, note.content, [t.name for t in note.tags])
+                for note in notes if note.id not in valid
+            ][:AI_PRECOMPUTE_BATCH]
+        finally:
+            db.close()
+
+    def _store(self, note_id: int, user_id: int, text_hash: str, summary: str):
+        db = SessionLocal()
+        try:
+            store(db, note_id, user_id, SUMMARY, text_hash, summary)
+        finally:
+            db.close()
+
+    async def run_once(self):
+        self.stats["runs"] += 1
+        for note_id, user_id, title, content, tags in await asyncio.to_thread(self._candidates):
+            if llm_client.free_slots() <= AI_PRECOMPUTE_RESERVED_SLOTS:
+                self.stats["skipped_busy"] += 1
+                return
+            try:
+                summary = await summary_prompt.generate_summary(title=title, content=content, tags=tags)
+            except LLMUnavailable:
+                self.stats["skipped_busy"] += 1
+                return
+            await asyncio.to_thread(self._store, note_id, user_id, input_hash(title, content, tags), summary)
+            self.stats["precomputed"] += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self.stats["errors"] += 1
+                print(f"Summary precompute failed ({err})")
+            await asyncio.sleep(AI_PRECOMPUTE_INTERVAL)
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "enabled": AI_SUMMARY_PRECOMPUTE and AI_CACHE_ENABLED}
+
+
+summary_precomputer = SummaryPrecomputer()
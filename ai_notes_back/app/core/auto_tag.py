@@ -0,0 +1,286 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import exists, func, or_
+
+from app.api.ai_tags import generate_tags_batch
+from app.api.llm_client import llm_client, LLMUnavailable
+from app.core.database import SessionLocal
+from app.core.model import Notes, Tag, note_tags, AutoTagJobs
+
+load_dotenv()
+
+# Tek prompt'ta etiketlenen not sayısı ve prompt'a giren içerik uzunluğu
+AUTO_TAG_BATCH_SIZE = int(os.getenv("AUTO_TAG_BATCH_SIZE", "8"))
+AUTO_TAG_MAX_CHARS = int(os.getenv("AUTO_TAG_MAX_CHARS", "1500"))
+AUTO_TAG_MAX_TAGS = int(os.getenv("AUTO_TAG_MAX_TAGS", "5"))
+# İstek bütçesi: dakikadaki LLM isteği ve iş başına toplam istek (0 -> sınırsız)
+AUTO_TAG_REQUESTS_PER_MINUTE = float(os.getenv("AUTO_TAG_REQUESTS_PER_MINUTE", "20"))
+AUTO_TAG_MAX_REQUESTS = int(os.getenv("AUTO_TAG_MAX_REQUESTS", "0"))
+# İş, interaktif istekler için bu kadar LLM slotunu boş bırakır
+AUTO_TAG_RESERVED_SLOTS = int(os.getenv("AUTO_TAG_RESERVED_SLOTS", "2"))
+# Bu süre güncellenmeyen "running" iş, çöken bir worker'dan kalmış sayılır ve yeniden alınır
+_STALE_AFTER = timedelta(minutes=5)
+# Bekleyen iş updated_at'i bu aralıkla yeniler; _STALE_AFTER'dan kısa olmalı
+_HEARTBEAT_EVERY = 30.0
+
+
+def _untagged(db, user_id: int):
+    return db.query(Notes).filter(
+        Notes.user_id.__eq__(user_id),
+        Notes.deleted_at.__eq__(None),
+        ~exists().where(note_tags.c.note_id.__eq__(Notes.id))
+    )
+
+
+def create_job(db, user_id: int, max_requests: int = None) -> AutoTagJobs:
+    # Kullanıcının bitmemiş işi varsa yenisi açılmaz, mevcut iş döner
+    job = db.query(AutoTagJobs).filter(
+        AutoTagJobs.user_id.__eq__(user_id),
+        AutoTagJobs.status.in_(["pending", "running"])
+    ).first()
+    if job is not None:
+        return job
+    job = AutoTagJobs(
+        user_id=user_id,
+        total=_untagged(db, user_id).count(),
+        max_requests=max_requests or AUTO_TAG_MAX_REQUESTS or None
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    auto_tagger.notify()
+    return job
+
+
+def job_status(job: AutoTagJobs) -> dict:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "processed": job.processed,
+        "tagged": job.tagged,
+        "progress": min(1.0, round(job.processed / job.total, 3)) if job.total else 1.0,
+        "llm_requests": job.llm_requests,
+        "max_requests": job.max_requests,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at
+    }
+
+
+def upsert_tags(db, user_id: int, tags_by_note: dict[int, list[str]]) -> int:
+    """Tag'leri toplu olarak oluşturur ve notlara bağlar; etiketlenen not sayısını döner.
+
+    İsimler kullanıcının ve global tag'lerle büyük/küçük harf duyarsız eşlenir,
+    eksikler tek flush ile eklenir. Bu arada elle tag almış notlar atlanır.
+    """
+    names = {name.lower(): name for tags in tags_by_note.values() for name in tags if name}
+    if not names:
+        return 0
+    existing = {
+        name.lower(): tag_id
+        for tag_id, name in db.query(Tag.id, Tag.name).filter(
+            or_(Tag.user_id.__eq__(user_id), Tag.is_global.__eq__(True)),
+            func.lower(Tag.name).in_(list(names))
+        ).all()
+    }
+    created = [Tag(name=names[key], user_id=user_id) for key in names if key not in existing]
+    if created:
+        db.add_all(created)
+        db.flush()
+        existing.update({tag.name.lower(): tag.id for tag in created})
+
+    already_tagged = {
+        note_id for note_id, in db.query(note_tags.c.note_id).filter(note_tags.c.note_id.in_(list(tags_by_note))).distinct()
+    }
+    rows = {
+        (note_id, existing[name.lower()])
+        for note_id, tags in tags_by_note.items() if note_id not in already_tagged
+        for name in tags if name.lower() in existing
+    }
+    if rows:
+        db.execute(note_tags.insert(), [{"note_id": note_id, "tag_id": tag_id} for note_id, tag_id in rows])
+    return len({note_id for note_id, _ in rows})
+
+
+class AutoTagger:
+    """Toplu etiketleme işlerini sırayla çalıştırır.
+
+    Uygulamanın event loop'unda çalışır ve LLM istemcisinin semaphore'unu
+    paylaşır. İstekler AUTO_TAG_REQUESTS_PER_MINUTE hızına yayılır; boş LLM
+    slotu azsa iş bekler. İlerleme (last_note_id) her batch'te commit
+    edildiği için yarıda kalan iş kaldığı yerden devam eder.
+    """
+
+    def __init__(self):
+        self._task = None
+        self._wake = None
+        self._loop = None
+        self._next_at = 0.0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+            self._task = self._loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def notify(self):
+        # create_job threadpool'da çağrılabilir; asyncio.Event sadece kendi loop'unda set edilir
+        if self._wake is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _claim(self) -> int | None:
+        # Koşullu UPDATE ile aynı işi iki worker'ın alması engellenir
+        db = SessionLocal()
+        try:
+            stale = datetime.now(timezone.utc) - _STALE_AFTER
+            candidates = db.query(AutoTagJobs.id).filter(
+                or_(
+                    AutoTagJobs.status.__eq__("pending"),
+                    (AutoTagJobs.status.__eq__("running")) & (AutoTagJobs.updated_at < stale)
+                )
+            ).order_by(AutoTagJobs.id).limit(5).all()
+            for job_id, in candidates:
+                claimed = db.query(AutoTagJobs).filter(
+                    AutoTagJobs.id.__eq__(job_id),
+                    or_(
+                        AutoTagJobs.status.__eq__("pending"),
+                        (AutoTagJobs.status.__eq__("running")) & (AutoTagJobs.updated_at < stale)
+                    )
+                ).update({"status": "running", "updated_at": datetime.now(timezone.utc)}, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    return job_id
+            return None
+        finally:
+            db.close()
+
+    def _next_batch(self, job_id: int):
+        db = SessionLocal()
+        try:
+            job = db.query(AutoTagJobs).filter(AutoTagJobs.id.__eq__(job_id)).first()
+            if job is None or job.status != "running":
+                return None, []
+            if job.max_requests and job.llm_requests >= job.max_requests:
+                return job.user_id, None
+            notes = _untagged(db, job.user_id).filter(
+                Notes.id > job.last_note_id
+            ).order_by(Notes.id).limit(AUTO_TAG_BATCH_SIZE).all()
+            return job.user_id, [(note.id, note.title, note.content) for note in notes]
+        finally:
+            db.close()
+
+    def _apply(self, job_id: int, user_id: int, batch: list[tuple[int, str, str]], tags_by_note: dict[int, list[str]]):
+        db = SessionLocal()
+        try:
+            tagged = upsert_tags(db, user_id, tags_by_note)
+            job = db.query(AutoTagJobs).filter(AutoTagJobs.id.__eq__(job_id)).first()
+            job.processed += len(batch)
+            job.tagged += tagged
+            job.llm_requests += 1
+            # Yanıtta tag gelmeyen notlar da geçilir; iş aynı notlarda dönmez
+            job.last_note_id = batch[-1][0]
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _heartbeat(self, job_id: int):
+        db = SessionLocal()
+        try:
+            db.query(AutoTagJobs).filter(
+                AutoTagJobs.id.__eq__(job_id),
+                AutoTagJobs.status.__eq__("running")
+            ).update({"updated_at": datetime.now(timezone.utc)}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _wait(self, job_id: int, seconds: float):
+        # Uzun beklemelerde iş canlı işaretlenir; aksi halde başka bir worker onu yeniden alır
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, _HEARTBEAT_EVERY))
+            await asyncio.to_thread(self._heartbeat, job_id)
+
+    def _finish(self, job_id: int, status: str, error: str = None):
+        db = SessionLocal()
+        try:
+            db.query(AutoTagJobs).filter(AutoTagJobs.id.__eq__(job_id)).update(
+                {"status": status, "error": error, "finished_at": datetime.now(timezone.utc)},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def _throttle(self, job_id: int):
+        now = time.monotonic()
+        if self._next_at > now:
+            await self._wait(job_id, self._next_at - now)
+        self._next_at = max(now, self._next_at) + 60.0 / AUTO_TAG_REQUESTS_PER_MINUTE
+        waited = 0.0
+        while llm_client.free_slots() <= AUTO_TAG_RESERVED_SLOTS:
+            await asyncio.sleep(1)
+            waited += 1
+            if waited >= _HEARTBEAT_EVERY:
+                await asyncio.to_thread(self._heartbeat, job_id)
+                waited = 0.0
+
+    async def run_job(self, job_id: int):
+        while True:
+            user_id, batch = await asyncio.to_thread(self._next_batch, job_id)
+            if user_id is None:
+                return
+            if batch is None:
+                await asyncio.to_thread(self._finish, job_id, "budget_exhausted")
+                return
+            if not batch:
+                await asyncio.to_thread(self._finish, job_id, "done")
+                return
+            await self._throttle(job_id)
+            try:
+                tags_by_note = await generate_tags_batch(batch, max_tags=AUTO_TAG_MAX_TAGS, max_chars=AUTO_TAG_MAX_CHARS)
+            except LLMUnavailable as err:
+                # LLM geçici olarak kapalı; batch ilerletilmeden sonra tekrar denenir
+                await self._wait(job_id, max(5.0, err.retry_after))
+                continue
+            await asyncio.to_thread(self._apply, job_id, user_id, batch, tags_by_note)
+
+    async def _run(self):
+        while True:
+            try:
+                job_id = await asyncio.to_thread(self._claim)
+            except Exception as err:
+                print(f"Auto-tag job claim failed ({err})")
+                job_id = None
+            if job_id is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), 60)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                print(f"Auto-tag job {job_id} failed ({err})")
+                await asyncio.to_thread(self._finish, job_id, "failed", str(err))
+
+
+auto_tagger = AutoTagger()
@@ -0,0 +1,155 @@
+import os
+import re
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.api.embedding import get_embeddings, content_hash
+from app.api.embedding_providers import EmbeddingProvider
+from app.core.model import Notes, NoteChunks
+
+load_dotenv()
+
+# Açıkken notlar parçalara bölünür, her parça ayrı embedding alır ve arama parça bazında yapılır
+NOTE_CHUNKING = os.getenv("NOTE_CHUNKING", "false").lower() == "true"
+NOTE_CHUNK_SIZE = int(os.getenv("NOTE_CHUNK_SIZE", "1500"))
+# Bundan kısa paragraflar bir sonraki paragrafla birleştirilir
+NOTE_CHUNK_MIN_SIZE = int(os.getenv("NOTE_CHUNK_MIN_SIZE", "200"))
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _split_long(paragraph: str) -> list[str]:
+    if len(paragraph) <= NOTE_CHUNK_SIZE:
+        return [paragraph]
+
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_RE.split(paragraph):
+        # Tek cümle bile sınırı aşıyorsa karakter bazında bölünür
+        while len(sentence) > NOTE_CHUNK_SIZE:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:NOTE_CHUNK_SIZE])
+            sentence = sentence[NOTE_CHUNK_SIZE:]
+        if current and len(current) + len(sentence) + 1 > NOTE_CHUNK_SIZE:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_chunks(text: str) -> list[str]:
+    """Notu paragraf sınırlarında parçalara böler.
+
+    Sınırlar sadece paragraf içeriğine bağlı olduğu için bir paragraftaki
+    değişiklik en fazla o paragrafın (ve kısa ise birleştiği komşusunun)
+    parçalarını değiştirir; diğer parçaların hash'i aynı kalır.
+    """
+    paragraphs = [p.strip() for p in _PARAGRAPH_RE.split(text or "") if p.strip()]
+
+    chunks = []
+    carry = ""
+    for paragraph in paragraphs:
+        if carry:
+            paragraph = f"{carry}\n\n{paragraph}"
+            carry = ""
+        if len(paragraph) < NOTE_CHUNK_MIN_SIZE:
+            carry = paragraph
+            continue
+        chunks.extend(_split_long(paragraph))
+    if carry:
+        chunks.append(carry)
+    return chunks
+
+
+def _mean_embedding(vectors: list[np.ndarray]) -> bytes:
+    # Not seviyesindeki embedding, parçaların normalize ortalamasıdır
+    matrix = np.stack(vectors).astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    mean = (matrix / norms).mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return (mean / norm if norm > 0 else mean).astype(np.float32).tobytes()
+
+
+def sync_note_chunks(db, notes: list[Notes], provider: EmbeddingProvider, stats: dict,
+                     prune_other_models: bool = True):
+    """Notların parçalarını günceller ve sadece hash'i değişen parçaları embed eder.
+
+    Not başına (not seviyesindeki embedding) listesi ile commit sonrası
+    index'e yazılacak (user_id, note_id, [(chunk_id, embedding)]) listesini döner.
+    Model geçişi sürerken prune_other_models=False verilir; eski ve yeni modelin
+    parçaları yan yana durur, her çağrı sadece kendi modelinin parçalarına dokunur.
+    """
+    model = provider.key
+    existing = {}
+    for chunk in db.query(NoteChunks).filter(NoteChunks.note_id.in_([note.id for note in notes])).all():
+        if not prune_other_models and chunk.embedding_model not in (model, None):
+            continue
+        existing.setdefault(chunk.note_id, []).append(chunk)
+
+    plans = []
+    to_embed = {}
+    for note in notes:
+        texts = split_chunks(note.content)
+        reusable = {}
+        for chunk in existing.get(note.id, []):
+            if chunk.embedding_model == model and chunk.embedding:
+                reusable.setdefault(chunk.content_hash, []).append(chunk)
+
+        plan = []
+        for position, text in enumerate(texts):
+            text_hash = content_hash(text)
+            candidates = reusable.get(text_hash)
+            if candidates:
+                plan.append((position, text_hash, candidates.pop()))
+                stats["chunks_reused"] += 1
+            else:
+                plan.append((position, text_hash, None))
+                to_embed[text_hash] = text
+        plans.append((note, plan, reusable))
+
+    embedded = {}
+    if to_embed:
+        hashes = list(to_embed)
+        for text_hash, embedding in zip(hashes, get_embeddings([to_embed[h] for h in hashes], provider=provider)):
+            embedded[text_hash] = embedding
+        stats["chunks_embedded"] += len(hashes)
+
+    note_embeddings = []
+    updates = []
+    for note, plan, leftovers in plans:
+        for chunks in leftovers.values():
+            for chunk in chunks:
+                db.delete(chunk)
+        for chunk in existing.get(note.id, []):
+            if chunk.embedding_model != model or not chunk.embedding:
+                db.delete(chunk)
+
+        rows = []
+        for position, text_hash, chunk in plan:
+            if chunk is None:
+                chunk = NoteChunks(
+                    note_id=note.id,
+                    user_id=note.user_id,
+                    content_hash=text_hash,
+                    embedding=embedded[text_hash] or None,
+                    embedding_model=model
+                )
+                db.add(chunk)
+            chunk.position = position
+            rows.append(chunk)
+        db.flush()
+
+        chunk_vectors = [(chunk.id, chunk.embedding) for chunk in rows if chunk.embedding]
+        updates.append((note.user_id, note.id, chunk_vectors))
+        note_embeddings.append(
+            _mean_embedding([np.frombuffer(emb, dtype=np.float32) for _, emb in chunk_vectors]) if chunk_vectors else b""
+        )
+
+    return note_embeddings, updates
@@ -1,12 +1,51 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base,sessionmaker
+from app.core.db_pool import InstrumentedQueuePool, InstrumentedAsyncQueuePool
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("POSTGRES_SQL_DB_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# "memory": embedding'ler bytea olarak saklanır, arama uygulama içi index ile yapılır
+# "pgvector": embedding'ler ayrıca vector(N) kolonunda tutulur, kNN Postgres'te çalışır
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "memory")
+PGVECTOR_DIM = int(os.getenv("PGVECTOR_DIM", "1536"))
+# "hnsw" ya da "ivfflat"
+PGVECTOR_INDEX = os.getenv("PGVECTOR_INDEX", "hnsw")
+
+# Not gövdeleri için tsvector'ün hangi text search config ile üretileceği
+FULLTEXT_CONFIG = os.getenv("FULLTEXT_CONFIG", "simple")
+
+# Bağlantı havuzu; sync ve async engine'in her biri bu ayarlarla ayrı bir havuz açar
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Havuz doluyken bağlantı için beklenecek en uzun süre (saniye); aşılırsa istek 503 döner
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Bu kadar saniyeden eski bağlantılar yeniden açılır (-1 -> kapalı)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+
+def _pool_options(url: str, pool_class) -> dict:
+    # In-memory SQLite tek bağlantılı kendi havuzunu kullanır; boyut ayarları ona uygulanamaz
+    if url.startswith("sqlite") and (":memory:" in url or url.split("://", 1)[1] in ("", "/")):
+        return {}
+    return {
+        "poolclass": pool_class,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE
+    }
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_pool_options(SQLALCHEMY_DATABASE_URL, InstrumentedQueuePool))
+
+# tsvector kolonu ve GIN index sadece Postgres'te var; diğer veritabanlarında keyword arama LIKE'a düşer
+FULLTEXT_ENABLED = engine.dialect.name == "postgresql"
 
 SessionLocal = sessionmaker(autoflush=False,autocommit=False,bind=engine)
 
@@ -15,7 +54,32 @@ Base = declarative_base()
 def get_db():
     db = SessionLocal()
     try:
+        # Bağlantı handler'dan önce, threadpool'da alınır: havuz beklemesi event loop'u
+        # bloklamaz ve timeout handler'ın kendi hata yakalamasına takılmadan 503'e döner
+        db.connection()
         yield db
     finally:
         db.close()
 
+
+def _async_url(url: str) -> str:
+    # Aynı veritabanına async driver ile bağlanılır: Postgres -> asyncpg, SQLite -> aiosqlite
+    scheme, rest = url.split("://", 1)
+    driver = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+    return f"{driver.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+# asyncpg libpq parametrelerini (sslmode vb.) tanımaz; gerekiyorsa ayrı URL verilebilir
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DB_URL") or _async_url(SQLALCHEMY_DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options(ASYNC_DATABASE_URL, InstrumentedAsyncQueuePool))
+
+# Commit sonrası nesneler expire edilmez; async'te lazy load yapılamadığı için response'ta tekrar okunabilirler
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        await db.connection()
+        yield db
+
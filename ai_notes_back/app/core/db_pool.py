@@ -0,0 +1,93 @@
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Bağlantı bekleme süresi histogramının üst sınırları (ms); son kova bunların üstü
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolStats:
+    """Havuzdan bağlantı alma süreleri, timeout ve overflow sayaçları."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.overflow_events = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._buckets[bisect_left(WAIT_BUCKETS_MS, seconds * 1000)] += 1
+
+    def record_overflow(self):
+        with self._lock:
+            self.overflow_events += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [f"<={bound}ms" for bound in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+            waits = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "overflow_events": self.overflow_events,
+                "avg_wait_ms": round(self.wait_total / waits * 1000, 3) if waits else 0.0,
+                "max_wait_ms": round(self.wait_max * 1000, 3),
+                "wait_histogram": dict(zip(labels, self._buckets))
+            }
+
+
+class _InstrumentedPool:
+    # Sayaçlar sınıf seviyesinde tutulur; engine.dispose() havuzu yeniden oluştursa da kaybolmaz
+    stats: PoolStats
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - start)
+        return connection
+
+    def _inc_overflow(self) -> bool:
+        # _overflow -pool_size'dan başlar; sıfırın üstü pool_size dışında açılan bağlantıdır
+        created = super()._inc_overflow()
+        if created and self._overflow > 0:
+            self.stats.record_overflow()
+        return created
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    stats = PoolStats()
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+
+def pool_snapshot(pool) -> dict:
+    if not isinstance(pool, _InstrumentedPool):
+        return {"pool": type(pool).__name__}
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": pool._max_overflow,
+        "timeout": pool.timeout(),
+        **pool.stats.snapshot()
+    }
@@ -0,0 +1,209 @@
+import os
+import re
+import hashlib
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_
+
+from app.api.embedding import content_hash
+from app.core.database import SessionLocal
+from app.core.model import Notes, NoteSignatures, NoteLSHBuckets, NoteDuplicates
+
+load_dotenv()
+
+# "off", "flag" (kaydedilir, yanıtta benzer notlar döner) ya da "reject" (409)
+DUPLICATE_DETECTION = os.getenv("DUPLICATE_DETECTION", "flag")
+# Tahmini Jaccard benzerliği bunun üzerindeyse not near-duplicate sayılır
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "128"))
+# bands * rows = permutations; eşik yaklaşık (1 / bands) ** (1 / rows) -> 32 x 4 için ~0.42
+MINHASH_BANDS = int(os.getenv("MINHASH_BANDS", "32"))
+SHINGLE_SIZE = int(os.getenv("SHINGLE_SIZE", "3"))
+# Bu kadardan kalabalık kovalarda üyeler sadece kovanın ilk notuyla karşılaştırılır
+DUPLICATE_MAX_BUCKET = int(os.getenv("DUPLICATE_MAX_BUCKET", "50"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# 2^32'den büyük asal; a * x + b uint64'e sığar
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(42)
+_A = _rng.integers(1, 2 ** 32, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 32, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_ROWS = MINHASH_PERMUTATIONS // MINHASH_BANDS
+# İmza shingle hash'leri üzerinde bu genişlikte bloklarla hesaplanır; ara matris permutations x blok olur
+_SIGNATURE_BLOCK = 1024
+
+
+def is_enabled() -> bool:
+    return DUPLICATE_DETECTION in ("flag", "reject")
+
+
+def shingles(text: str) -> set[str]:
+    words = _TOKEN_RE.findall((text or "").lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def signature(text: str) -> np.ndarray | None:
+    items = shingles(text)
+    if not items:
+        return None
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in items],
+        dtype=np.uint64
+    )
+    # Her permütasyon için min((a * x + b) mod p); uzun notlarda bellek blok boyutuyla sınırlı kalır
+    result = np.full(MINHASH_PERMUTATIONS, _PRIME, dtype=np.uint64)
+    for start in range(0, len(hashes), _SIGNATURE_BLOCK):
+        block = hashes[None, start:start + _SIGNATURE_BLOCK]
+        np.minimum(result, ((_A[:, None] * block + _B[:, None]) % _PRIME).min(axis=1), out=result)
+    return result.astype(np.uint32)
+
+
+def band_buckets(sig: np.ndarray) -> list[int]:
+    return [
+        int.from_bytes(hashlib.blake2b(sig[band * _ROWS:(band + 1) * _ROWS].tobytes(), digest_size=8).digest(),
+                       "little", signed=True)
+        for band in range(MINHASH_BANDS)
+    ]
+
+
+def _signatures(db, note_ids) -> dict[int, np.ndarray]:
+    # Silinmiş ya da soft-delete edilmiş notların imzaları karşılaştırmaya girmez
+    rows = db.query(NoteSignatures.note_id, NoteSignatures.signature).join(
+        Notes, Notes.id.__eq__(NoteSignatures.note_id)
+    ).filter(
+        NoteSignatures.note_id.in_(note_ids),
+        Notes.deleted_at.__eq__(None)
+    ).all()
+    return {
+        note_id: np.frombuffer(sig, dtype=np.uint32)
+        for note_id, sig in rows
+        if len(sig) == MINHASH_PERMUTATIONS * 4
+    }
+
+
+def find_duplicates(db, user_id: int, sig: np.ndarray | None, exclude_id: int = None) -> list[tuple[int, float]]:
+    """Kullanıcının bu imzaya benzeyen notlarını (id, tahmini Jaccard) olarak döner.
+
+    Sadece en az bir bant kovasını paylaşan notlar okunur; maliyet
+    kullanıcının not sayısına değil aday sayısına bağlıdır.
+    """
+    if sig is None or not is_enabled():
+        return []
+
+    # Her bant (user_id, band, bucket) index'inde ayrı bir seek olur
+    candidates = {
+        note_id
+        for note_id, in db.query(NoteLSHBuckets.note_id).filter(
+            NoteLSHBuckets.user_id.__eq__(user_id),
+            or_(*(
+                and_(NoteLSHBuckets.band.__eq__(band), NoteLSHBuckets.bucket.__eq__(bucket))
+                for band, bucket in enumerate(band_buckets(sig))
+            ))
+        ).distinct().all()
+        if note_id != exclude_id
+    }
+    if not candidates:
+        return []
+
+    signatures = _signatures(db, candidates)
+    matches = [(note_id, float(np.mean(other == sig))) for note_id, other in signatures.items()]
+    return sorted([m for m in matches if m[1] >= DUPLICATE_THRESHOLD], key=lambda m: m[1], reverse=True)
+
+
+def index_note(db, note: Notes, sig: np.ndarray | None = None):
+    # Not id'si atanmış olmalı (flush sonrası); commit çağırana aittir
+    if not is_enabled():
+        return
+    text_hash = content_hash(note.content)
+    existing = db.query(NoteSignatures).filter(NoteSignatures.note_id.__eq__(note.id)).first()
+    if existing and existing.content_hash == text_hash:
+        return
+
+    sig = sig if sig is not None else signature(note.content)
+    db.query(NoteLSHBuckets).filter(NoteLSHBuckets.note_id.__eq__(note.id)).delete(synchronize_session=False)
+    if sig is None:
+        if existing:
+            db.delete(existing)
+        return
+
+    if existing:
+        existing.content_hash = text_hash
+        existing.signature = sig.tobytes()
+    else:
+        db.add(NoteSignatures(note_id=note.id, user_id=note.user_id, content_hash=text_hash, signature=sig.tobytes()))
+    db.add_all([
+        NoteLSHBuckets(note_id=note.id, band=band, user_id=note.user_id, bucket=bucket)
+        for band, bucket in enumerate(band_buckets(sig))
+    ])
+
+
+def rebuild_user(db, user_id: int):
+    """İmzası eksik notları indexler ve kullanıcının duplicate raporunu yeniden hesaplar.
+
+    Aday çiftler sadece aynı kovadaki notlardan çıkar; kalabalık kovalarda
+    üyeler kovanın ilk notuyla karşılaştırılır, böylece çift sayısı
+    kovanın boyutuyla doğrusal kalır.
+    """
+    indexed = {
+        note_id: text_hash
+        for note_id, text_hash in db.query(NoteSignatures.note_id, NoteSignatures.content_hash).filter(
+            NoteSignatures.user_id.__eq__(user_id)
+        ).all()
+    }
+    for note in db.query(Notes).filter(Notes.user_id.__eq__(user_id)).all():
+        if indexed.get(note.id) != content_hash(note.content):
+            index_note(db, note)
+    db.flush()
+
+    groups = {}
+    for note_id, band, bucket in db.query(NoteLSHBuckets.note_id, NoteLSHBuckets.band, NoteLSHBuckets.bucket).filter(
+        NoteLSHBuckets.user_id.__eq__(user_id)
+    ).all():
+        groups.setdefault((band, bucket), []).append(note_id)
+
+    pairs = set()
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort()
+        if len(members) > DUPLICATE_MAX_BUCKET:
+            pairs.update((members[0], other) for other in members[1:])
+        else:
+            pairs.update((a, b) for i, a in enumerate(members) for b in members[i + 1:])
+
+    duplicates = []
+    if pairs:
+        signatures = _signatures(db, {note_id for pair in pairs for note_id in pair})
+        pairs = [(a, b) for a, b in pairs if a in signatures and b in signatures]
+        if pairs:
+            left = np.stack([signatures[a] for a, _ in pairs])
+            right = np.stack([signatures[b] for _, b in pairs])
+            similarities = (left == right).mean(axis=1)
+            duplicates = [
+                NoteDuplicates(note_id=a, duplicate_id=b, user_id=user_id, similarity=float(similarity))
+                for (a, b), similarity in zip(pairs, similarities)
+                if similarity >= DUPLICATE_THRESHOLD
+            ]
+
+    db.query(NoteDuplicates).filter(NoteDuplicates.user_id.__eq__(user_id)).delete(synchronize_session=False)
+    db.add_all(duplicates)
+    db.commit()
+
+
+def rebuild_all():
+    if not is_enabled():
+        return
+    db = SessionLocal()
+    try:
+        for user_id, in db.query(Notes.user_id).distinct().all():
+            # Bir kullanıcıdaki hata sonraki kullanıcıların yeniden kurulmasını engellemez
+            try:
+                rebuild_user(db, user_id)
+            except Exception as err:
+                db.rollback()
+                print(f"Duplicate index rebuild failed for user {user_id} ({err})")
+    finally:
+        db.close()
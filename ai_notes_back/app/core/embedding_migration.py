@@ -0,0 +1,330 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import func, or_, bindparam
+from sqlalchemy.orm import load_only
+
+from app.api.embedding import get_embeddings, content_hash
+from app.api.embedding_providers import provider_for_key
+from app.core.database import SessionLocal
+from app.core.model import Notes, NoteChunks, EmbeddingMigrations, NoteEmbeddingStaging
+from app.core.schemes import EmbeddingStatusEnum
+from app.core.embedding_registry import embedding_registry
+from app.core.embedding_queue import embedding_queue
+from app.core.vector_index import vector_indexes, chunk_indexes, quantized_columns
+from app.core.chunking import NOTE_CHUNKING, sync_note_chunks
+from app.core import pgvector_store, related, topics
+
+load_dotenv()
+
+EMBEDDING_MIGRATION_ENABLED = os.getenv("EMBEDDING_MIGRATION_ENABLED", "true").lower() == "true"
+EMBEDDING_MIGRATION_BATCH_SIZE = int(os.getenv("EMBEDDING_MIGRATION_BATCH_SIZE", "64"))
+# Provider'a gönderilen metin sayısı için üst sınır (metin / saniye); istekler bu hıza yayılır
+EMBEDDING_MIGRATION_RATE = float(os.getenv("EMBEDDING_MIGRATION_RATE", "5"))
+EMBEDDING_MIGRATION_MAX_RETRIES = int(os.getenv("EMBEDDING_MIGRATION_MAX_RETRIES", "5"))
+# Bir worker'ın aldığı geçiş bu kadar saniye yenilenmezse başka bir worker devralır
+EMBEDDING_MIGRATION_LEASE = int(os.getenv("EMBEDDING_MIGRATION_LEASE", "300"))
+# Geçiş sonunda staging bu kadar satırlık parçalarla okunur; taşıma tek transaction'dır
+_CUTOVER_CHUNK = 500
+_ACTIVE = ["pending", "running", "reembedding"]
+
+
+class EmbeddingMigrator:
+    """Notları hedef modelle arka planda, hız sınırlı olarak yeniden embed eder.
+
+    Her kullanıcı için notlar id sırasıyla işlenir ve last_note_id her
+    batch'te commit edilir; süreç yeniden başladığında kaldığı yerden devam
+    eder. Yeni embedding'ler note_embedding_staging'de birikir, arama eski
+    modelden okumaya devam eder. Parça modunda yeni modelin parçaları da
+    eskilerin yanına yazılır. Kullanıcının tüm notları hazır olunca
+    embedding'ler notlara taşınır, eski parçalar silinir ve kullanıcı yeni
+    modele geçer.
+    """
+
+    def __init__(self, batch_size: int = EMBEDDING_MIGRATION_BATCH_SIZE, rate: float = EMBEDDING_MIGRATION_RATE):
+        self.batch_size = batch_size
+        self.rate = rate
+        self._thread = None
+        self._stop = threading.Event()
+        self._next_at = 0.0
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stats = {"embedded": 0, "batches": 0, "retries": 0, "users_completed": 0, "errors": 0,
+                      "chunks_embedded": 0, "chunks_reused": 0}
+
+    def start(self):
+        if not EMBEDDING_MIGRATION_ENABLED:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="embedding-migration", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _throttle(self, count: int) -> bool:
+        # Basit pacing: her batch, önceki batch'in hız payı dolana kadar bekler
+        now = time.monotonic()
+        if self._next_at > now and self._stop.wait(self._next_at - now):
+            return False
+        self._next_at = max(now, self._next_at) + count / self.rate
+        return True
+
+    def prepare(self):
+        # Başlangıçta, istekler gelmeden önce çalışır; böylece geçişteki kullanıcılar baştan eski modelden okur
+        db = SessionLocal()
+        try:
+            embedding_registry.register_active(db)
+            embedding_registry.plan_migrations(db)
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                migration = self._claim(db)
+                if migration is None:
+                    # Yapılacak iş yoksa seyrek kontrol edilir
+                    self._stop.wait(60)
+                    continue
+                self.step(db, migration)
+            except Exception as err:
+                db.rollback()
+                self.stats["errors"] += 1
+                print(f"Embedding migration step failed ({err})")
+                self._stop.wait(5)
+            finally:
+                db.close()
+
+    def _claim(self, db) -> EmbeddingMigrations | None:
+        """Sıradaki geçişi koşullu UPDATE ile bu worker'a ayırır.
+
+        Her step'te tekrar çağrılır ve sahipliği yeniler; böylece bir kullanıcının
+        geçişini aynı anda tek worker yürütür, çöken worker'ın geçişi süre dolunca devralınır.
+        """
+        now = datetime.now(timezone.utc)
+        claimable = (
+            EmbeddingMigrations.to_model.__eq__(embedding_registry.target),
+            EmbeddingMigrations.status.in_(_ACTIVE),
+            or_(
+                EmbeddingMigrations.claimed_by.__eq__(None),
+                EmbeddingMigrations.claimed_by.__eq__(self.worker_id),
+                EmbeddingMigrations.heartbeat_at < now - timedelta(seconds=EMBEDDING_MIGRATION_LEASE)
+            )
+        )
+        candidates = db.query(EmbeddingMigrations.id).filter(*claimable).order_by(EmbeddingMigrations.id).limit(5).all()
+        for migration_id, in candidates:
+            claimed = db.query(EmbeddingMigrations).filter(EmbeddingMigrations.id.__eq__(migration_id), *claimable).update(
+                {"claimed_by": self.worker_id, "heartbeat_at": now}, synchronize_session=False
+            )
+            db.commit()
+            if claimed:
+                return db.query(EmbeddingMigrations).filter(EmbeddingMigrations.id.__eq__(migration_id)).first()
+        return None
+
+    def _embed(self, db, count: int, embed) -> list[bytes] | None:
+        for attempt in range(EMBEDDING_MIGRATION_MAX_RETRIES):
+            if not self._throttle(count):
+                return None
+            try:
+                return embed()
+            except Exception as err:
+                db.rollback()
+                self.stats["retries"] += 1
+                delay = 2 ** attempt
+                print(f"Embedding migration batch failed ({err}), retrying in {delay}s")
+                if self._stop.wait(delay):
+                    return None
+        raise RuntimeError("Embedding migration batch failed after retries")
+
+    def _stage(self, db, migration: EmbeddingMigrations, notes: list[tuple[int, str]]) -> bool:
+        provider = provider_for_key(migration.to_model)
+        note_ids = [note_id for note_id, _ in notes]
+        staged = {}
+        if NOTE_CHUNKING:
+            def embed():
+                # Hedef modelin parçaları eskilerin yanına yazılır; index'e kullanıcı geçince girer.
+                # Not seviyesindeki embedding parçalarla aynı içerikten staging'e yazılır.
+                records = db.query(Notes).options(load_only(Notes.id, Notes.user_id, Notes.content)).filter(
+                    Notes.id.in_(note_ids)
+                ).all()
+                embeddings, _ = sync_note_chunks(db, records, provider, self.stats, prune_other_models=False)
+                staged.update({note.id: (note.content, embedding) for note, embedding in zip(records, embeddings)})
+                return embeddings
+        else:
+            def embed():
+                embeddings = get_embeddings([content for _, content in notes], provider=provider)
+                staged.update({note_id: (content, embedding) for (note_id, content), embedding in zip(notes, embeddings)})
+                return embeddings
+        if self._embed(db, len(notes), embed) is None:
+            return False
+
+        db.query(NoteEmbeddingStaging).filter(
+            NoteEmbeddingStaging.note_id.in_(note_ids),
+            NoteEmbeddingStaging.model.__eq__(migration.to_model)
+        ).delete(synchronize_session=False)
+        db.add_all([
+            NoteEmbeddingStaging(
+                note_id=note_id,
+                model=migration.to_model,
+                user_id=migration.user_id,
+                content_hash=content_hash(content),
+                embedding=embedding or None,
+                dim=provider.dim if embedding else None
+            )
+            for note_id, (content, embedding) in staged.items()
+        ])
+        self.stats["embedded"] += len(staged)
+        self.stats["batches"] += 1
+        return True
+
+    def step(self, db, migration: EmbeddingMigrations):
+        # Önceki sürümde başlamış "reembedding" geçişleri hedef modelden okumaya devam eder
+        if migration.status == "pending":
+            migration.status = "running"
+
+        notes = db.query(Notes.id, Notes.content).filter(
+            Notes.user_id.__eq__(migration.user_id),
+            Notes.id > migration.last_note_id
+        ).order_by(Notes.id).limit(self.batch_size).all()
+        if notes:
+            if self._stage(db, migration, notes):
+                migration.last_note_id = notes[-1][0]
+                migration.migrated += len(notes)
+                db.commit()
+            return
+
+        # Checkpoint sona ulaştı: bu arada düzenlenen ya da eklenen notlar tamamlanır
+        staged = {
+            note_id: text_hash
+            for note_id, text_hash in db.query(NoteEmbeddingStaging.note_id, NoteEmbeddingStaging.content_hash).filter(
+                NoteEmbeddingStaging.user_id.__eq__(migration.user_id),
+                NoteEmbeddingStaging.model.__eq__(migration.to_model)
+            ).all()
+        }
+        stale = [
+            (note_id, content)
+            for note_id, content in db.query(Notes.id, Notes.content).filter(
+                Notes.user_id.__eq__(migration.user_id)
+            ).order_by(Notes.id).all()
+            if staged.get(note_id) != content_hash(content)
+        ]
+        if stale:
+            if self._stage(db, migration, stale[:self.batch_size]):
+                db.commit()
+            return
+
+        self._cutover(db, migration)
+
+    def _cutover(self, db, migration: EmbeddingMigrations):
+        """Staging'deki embedding'leri tek transaction'da notlara taşır.
+
+        Arama kullanıcının notlarını ya tamamen eski ya tamamen yeni modelle görür.
+        Yazma notun içeriği okunduğu gibiyse yapılır; bu arada düzenlenen not
+        kendi düzenleme akışında embed edilir. updated_at korunur.
+        """
+        user_id, to_model = migration.user_id, migration.to_model
+        changed = []
+        statement = None
+        last_id = 0
+        while True:
+            staged = db.query(
+                NoteEmbeddingStaging.note_id,
+                NoteEmbeddingStaging.content_hash,
+                NoteEmbeddingStaging.embedding,
+                NoteEmbeddingStaging.dim
+            ).filter(
+                NoteEmbeddingStaging.user_id.__eq__(user_id),
+                NoteEmbeddingStaging.model.__eq__(to_model),
+                NoteEmbeddingStaging.note_id > last_id
+            ).order_by(NoteEmbeddingStaging.note_id).limit(_CUTOVER_CHUNK).all()
+            if not staged:
+                break
+
+            contents = dict(db.query(Notes.id, Notes.content).filter(Notes.id.in_([row[0] for row in staged])).all())
+            rows = []
+            for note_id, text_hash, embedding, dim in staged:
+                if note_id not in contents:
+                    continue
+                status = EmbeddingStatusEnum.READY.value
+                # Doğrulamadan sonra düzenlenen not yeni modelle kuyrukta embed edilir
+                if text_hash != content_hash(contents[note_id]):
+                    status = EmbeddingStatusEnum.PENDING.value
+                    changed.append(note_id)
+                values = {
+                    "embedding": embedding,
+                    "embedding_model": to_model if embedding else None,
+                    "embedding_dim": dim,
+                    "embedding_hash": text_hash if embedding else None,
+                    "embedding_status": status,
+                    "embedding_updated_at": datetime.now(timezone.utc),
+                    **pgvector_store.vector_columns(embedding, dim),
+                    **quantized_columns(embedding)
+                }
+                if statement is None:
+                    statement = self._cutover_statement(list(values))
+                rows.append({"b_id": note_id, "b_content": contents[note_id],
+                             **{f"b_{column}": value for column, value in values.items()}})
+            if rows:
+                db.connection().execute(statement, rows)
+            last_id = staged[-1][0]
+
+        db.query(NoteEmbeddingStaging).filter(
+            NoteEmbeddingStaging.user_id.__eq__(user_id),
+            NoteEmbeddingStaging.model.__eq__(to_model)
+        ).delete(synchronize_session=False)
+        if NOTE_CHUNKING:
+            # Eski modelin parçaları geçişle aynı transaction'da silinir
+            db.query(NoteChunks).filter(
+                NoteChunks.user_id.__eq__(user_id),
+                or_(NoteChunks.embedding_model.__ne__(to_model), NoteChunks.embedding_model.__eq__(None))
+            ).delete(synchronize_session=False)
+        migration.status = "done"
+        migration.finished_at = datetime.now(timezone.utc)
+        db.commit()
+        self._finish(db, user_id, changed)
+
+    @staticmethod
+    def _cutover_statement(columns: list[str]):
+        # executemany ile satır başına tek UPDATE; updated_at kendisine eşitlenerek onupdate atlanır
+        table = Notes.__table__
+        return table.update().where(
+            table.c.id == bindparam("b_id"),
+            table.c.content == bindparam("b_content")
+        ).values({**{column: bindparam(f"b_{column}") for column in columns}, "updated_at": table.c.updated_at})
+
+    def _finish(self, db, user_id: int, changed: list[int]):
+        embedding_registry.refresh()
+        vector_indexes.invalidate(user_id)
+        chunk_indexes.invalidate(user_id)
+        self.stats["users_completed"] += 1
+        if changed:
+            embedding_queue.enqueue(changed)
+        # Grafik ve konular yeni modelin vektörleriyle yeniden kurulur
+        related.rebuild_user(db, user_id)
+        topics.rebuild_user(db, user_id)
+
+    def snapshot(self) -> dict:
+        db = SessionLocal()
+        try:
+            counts = {
+                status: count
+                for status, count in db.query(EmbeddingMigrations.status, func.count(EmbeddingMigrations.id)).filter(
+                    EmbeddingMigrations.to_model.__eq__(embedding_registry.target)
+                ).group_by(EmbeddingMigrations.status).all()
+            }
+        finally:
+            db.close()
+        return {**self.stats, "target_model": embedding_registry.target, "users": counts}
+
+
+embedding_migrator = EmbeddingMigrator()
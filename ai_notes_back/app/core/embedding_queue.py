@@ -0,0 +1,264 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from app.api.embedding import get_embeddings, content_hash
+from app.api.embedding_providers import provider_for_key
+from app.core.embedding_registry import serving_model, embedding_registry
+from app.core.database import SessionLocal
+from app.core.model import Notes
+from app.core.schemes import EmbeddingStatusEnum
+from app.core.vector_index import vector_indexes, chunk_indexes, quantize_note, quantized_columns
+from app.core.chunking import NOTE_CHUNKING, sync_note_chunks
+from app.core import pgvector_store, related, topics
+
+load_dotenv()
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Bir batch dolmadan önce yeni id için beklenecek süre (saniye)
+EMBEDDING_BATCH_WAIT = float(os.getenv("EMBEDDING_BATCH_WAIT", "0.5"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_RETRY_BASE_DELAY = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", "1.0"))
+
+
+class EmbeddingQueue:
+    """Embedding'i bekleyen not id'lerini arka planda batch'ler halinde işler.
+
+    Not yazan endpoint'ler notu `pending` durumunda kaydedip id'yi kuyruğa
+    atar; worker thread kuyruğu boşaltır, provider'a tek istekte birden fazla
+    metin gönderir ve sonucu notlara yazar. Hata durumunda batch üstel
+    bekleme ile tekrar denenir, deneme hakkı bitince not `failed` olur.
+    """
+
+    def __init__(self, batch_size: int = EMBEDDING_BATCH_SIZE, batch_wait: float = EMBEDDING_BATCH_WAIT):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {"embedded": 0, "failed": 0, "batches": 0, "retries": 0, "reembeds_avoided": 0,
+                      "chunks_embedded": 0, "chunks_reused": 0}
+
+    def schedule(self, db, note: Notes) -> bool:
+        """Notun embedding'inin yenilenmesi gerekip gerekmediğine karar verir.
+
+        İçerik hash'i ve model değişmediyse mevcut embedding korunur; aynı
+        kullanıcının aynı içerikli başka bir notu varsa onun embedding'i
+        kopyalanır. Her iki durumda da False döner. Aksi halde not `pending`
+        yapılır ve True döner; çağıran commit'ten sonra `enqueue` etmelidir.
+        """
+        text_hash = content_hash(note.content)
+        # Model geçişi süren kullanıcılar için eski modelle embed edilir; yenisi geçiş job'ında üretilir
+        model = serving_model(note.user_id)
+
+        if note.embedding and note.embedding_hash == text_hash and note.embedding_model == model:
+            self.stats["reembeds_avoided"] += 1
+            return False
+
+        if NOTE_CHUNKING:
+            # Parçalar worker'da oluşturulur; değişmeyen parçalar orada yeniden kullanılır
+            note.embedding_status = EmbeddingStatusEnum.PENDING.value
+            return True
+
+        duplicate = db.query(Notes.embedding, Notes.embedding_dim).filter(
+            Notes.user_id.__eq__(note.user_id),
+            Notes.embedding_hash.__eq__(text_hash),
+            Notes.embedding_model.__eq__(model),
+            Notes.embedding.__ne__(None)
+        ).first()
+        if duplicate:
+            note.embedding, note.embedding_dim = duplicate
+            note.embedding_model = model
+            note.embedding_hash = text_hash
+            note.embedding_status = EmbeddingStatusEnum.READY.value
+            note.embedding_updated_at = datetime.now(timezone.utc)
+            pgvector_store.assign_vector(note)
+            quantize_note(note)
+            self.stats["reembeds_avoided"] += 1
+            return False
+
+        note.embedding_status = EmbeddingStatusEnum.PENDING.value
+        return True
+
+    def enqueue(self, note_ids: list[int]):
+        with self._lock:
+            for note_id in note_ids:
+                if note_id in self._queued:
+                    continue
+                self._queued.add(note_id)
+                self._queue.put(note_id)
+
+    def enqueue_pending(self):
+        db = SessionLocal()
+        try:
+            rows = db.query(Notes.id).filter(
+                Notes.embedding_status.__eq__(EmbeddingStatusEnum.PENDING.value)
+            ).all()
+        finally:
+            db.close()
+        self.enqueue([note_id for note_id, in rows])
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="embedding-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_batch(self) -> list[int]:
+        try:
+            batch = [self._queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        with self._lock:
+            self._queued.difference_update(batch)
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self.process(batch)
+
+    def process(self, note_ids: list[int]):
+        db = SessionLocal()
+        try:
+            notes = db.query(Notes).filter(
+                Notes.id.in_(note_ids),
+                Notes.embedding_status.__eq__(EmbeddingStatusEnum.PENDING.value)
+            ).all()
+            if not notes:
+                return
+
+            # Notlar kullanıcılarının okuduğu modele göre gruplanır
+            groups = {}
+            for note in notes:
+                groups.setdefault(serving_model(note.user_id), []).append(note)
+            notes = [note for group in groups.values() for note in group]
+
+            embeddings = None
+            contents, chunk_updates = {}, []
+            for attempt in range(EMBEDDING_MAX_RETRIES):
+                try:
+                    # Embed edilen içerik saklanır; yazma sırasında hâlâ aynıysa sonuç geçerlidir
+                    contents = {note.id: note.content for note in notes}
+                    results, chunk_updates = [], []
+                    for model, group in groups.items():
+                        provider = provider_for_key(model)
+                        if NOTE_CHUNKING:
+                            # Geçişteki kullanıcının hedef model parçaları geçiş job'ına aittir, silinmez
+                            group_embeddings, group_chunks = sync_note_chunks(
+                                db, group, provider, self.stats, prune_other_models=model == embedding_registry.target
+                            )
+                            chunk_updates += [(user_id, note_id, chunks, model) for user_id, note_id, chunks in group_chunks]
+                        else:
+                            group_embeddings = get_embeddings([contents[note.id] for note in group], provider=provider)
+                        results += [(embedding, provider) for embedding in group_embeddings]
+                    embeddings = results
+                    break
+                except Exception as err:
+                    db.rollback()
+                    self.stats["retries"] += 1
+                    delay = EMBEDDING_RETRY_BASE_DELAY * (2 ** attempt)
+                    print(f"Embedding batch failed ({err}), retrying in {delay:.1f}s")
+                    if self._stop.wait(delay):
+                        return
+
+            self.stats["batches"] += 1
+            if embeddings is None:
+                failed = sum(
+                    self._write(db, note_id, content, {"embedding_status": EmbeddingStatusEnum.FAILED.value})
+                    for note_id, content in contents.items()
+                )
+                db.commit()
+                self.stats["failed"] += failed
+                return
+
+            now = datetime.now(timezone.utc)
+            updated, stale = [], []
+            for note, (embedding, provider) in zip(notes, embeddings):
+                values = {
+                    "embedding": embedding or None,
+                    "embedding_model": provider.key if embedding else None,
+                    "embedding_dim": provider.dim if embedding else None,
+                    "embedding_hash": content_hash(contents[note.id]) if embedding else None,
+                    "embedding_status": EmbeddingStatusEnum.READY.value,
+                    "embedding_updated_at": now,
+                    **pgvector_store.vector_columns(embedding, provider.dim),
+                    **quantized_columns(embedding)
+                }
+                if self._write(db, note.id, contents[note.id], values):
+                    updated.append((note.user_id, note.id, embedding, values["embedding_model"]))
+                else:
+                    stale.append(note.id)
+            db.commit()
+            self.stats["embedded"] += len(updated)
+            # Batch sürerken düzenlenen notlar pending kalır ve güncel içerikle tekrar işlenir
+            self.enqueue(stale)
+
+            written = {note_id for _, note_id, _, _ in updated}
+            for user_id, note_id, embedding, model in updated:
+                vector_indexes.upsert(user_id, note_id, embedding, model)
+            for user_id, note_id, chunks, model in chunk_updates:
+                if note_id in written:
+                    chunk_indexes.replace_note(user_id, note_id, chunks, model)
+
+            by_user = {}
+            for user_id, note_id, embedding, _ in updated:
+                if embedding:
+                    by_user.setdefault(user_id, []).append(note_id)
+            for user_id, ids in by_user.items():
+                try:
+                    related.update_notes(db, user_id, ids)
+                except Exception as err:
+                    # Graf gece tam olarak yeniden kurulur; hata embedding'i etkilememeli
+                    db.rollback()
+                    print(f"Related notes update failed for user {user_id} ({err})")
+                try:
+                    topics.assign_notes(db, user_id, ids)
+                except Exception as err:
+                    db.rollback()
+                    print(f"Topic assignment failed for user {user_id} ({err})")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _write(db, note_id: int, content: str, values: dict) -> bool:
+        """Sonucu sadece not hâlâ pending ve içeriği embed edilenle aynıysa yazar.
+
+        Arka plan yazması kullanıcı düzenlemesi değildir; updated_at olduğu gibi korunur.
+        """
+        count = db.query(Notes).filter(
+            Notes.id.__eq__(note_id),
+            Notes.embedding_status.__eq__(EmbeddingStatusEnum.PENDING.value),
+            Notes.content.__eq__(content)
+        ).update({**values, "updated_at": Notes.updated_at}, synchronize_session=False)
+        return count > 0
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "queued": self._queue.qsize()}
+
+
+embedding_queue = EmbeddingQueue()
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from app.api.embedding_providers import EmbeddingProvider, get_provider, provider_for_key
+from app.core.database import SessionLocal
+from app.core.model import Notes, EmbeddingModels, EmbeddingMigrations
+from app.core.schemes import EmbeddingStatusEnum
+
+load_dotenv()
+
+# Geçişler başka worker process'lerinde tamamlanabilir; okunan model haritası bu kadar saniyede bir DB'den tazelenir
+EMBEDDING_SERVING_REFRESH = float(os.getenv("EMBEDDING_SERVING_REFRESH", "5"))
+
+
+class EmbeddingRegistry:
+    """Hangi kullanıcının aramasının hangi embedding modelinden okunacağını tutar.
+
+    Hedef model EMBEDDING_PROVIDER ile seçilen provider'dır. Geçişi
+    tamamlanmamış kullanıcılar eski (from_model) modelden okumaya devam eder;
+    kullanıcının tüm notları yeni modelle embed edilince tek seferde geçilir.
+    """
+
+    def __init__(self):
+        self._serving = {}
+        self._lock = threading.Lock()
+        self._refreshed_at = float("-inf")
+
+    @property
+    def target(self) -> str:
+        return get_provider().key
+
+    def refresh(self):
+        # Süre önce işaretlenir; aynı anda gelen okumalar DB'ye tekrar gitmez
+        self._refreshed_at = time.monotonic()
+        db = SessionLocal()
+        try:
+            # Önceki sürümde parça modunda başlamış "reembedding" geçişleri doğrudan hedef modelden okur
+            rows = db.query(EmbeddingMigrations.user_id, EmbeddingMigrations.from_model).filter(
+                EmbeddingMigrations.to_model.__eq__(self.target),
+                EmbeddingMigrations.status.in_(["pending", "running"])
+            ).all()
+        finally:
+            db.close()
+        with self._lock:
+            self._serving = {user_id: from_model for user_id, from_model in rows}
+
+    def serving_model(self, user_id: int = None) -> str:
+        if user_id is None:
+            return self.target
+        if time.monotonic() - self._refreshed_at > EMBEDDING_SERVING_REFRESH:
+            self.refresh()
+        return self._serving.get(user_id, self.target)
+
+    def serving_provider(self, user_id: int = None) -> EmbeddingProvider:
+        return provider_for_key(self.serving_model(user_id))
+
+    def register_active(self, db):
+        # Aktif model kayıtlı değilse eklenir, diğerleri retired olarak işaretlenir
+        provider = get_provider()
+        now = datetime.now(timezone.utc)
+        entry = db.query(EmbeddingModels).filter(EmbeddingModels.key.__eq__(provider.key)).first()
+        if entry is None:
+            entry = EmbeddingModels(key=provider.key, provider=provider.name, model=provider.model, dim=provider.dim)
+            db.add(entry)
+        if entry.status != "active":
+            entry.status = "active"
+            entry.activated_at = now
+        db.query(EmbeddingModels).filter(
+            EmbeddingModels.key.__ne__(provider.key),
+            EmbeddingModels.status.__eq__("active")
+        ).update({"status": "retired"}, synchronize_session=False)
+        db.commit()
+
+    def plan_migrations(self, db):
+        """Notları hedef modelden farklı modelle embed edilmiş kullanıcılar için geçiş kaydı açar."""
+        target = self.target
+        # Hedef değiştiyse yarım kalan eski geçişler iptal edilir; kullanıcılar hâlâ eski modelden okur
+        db.query(EmbeddingMigrations).filter(
+            EmbeddingMigrations.to_model.__ne__(target),
+            EmbeddingMigrations.status.in_(["pending", "running", "reembedding"])
+        ).update({"status": "cancelled"}, synchronize_session=False)
+
+        models_by_user = {}
+        for user_id, model in db.query(Notes.user_id, Notes.embedding_model).filter(
+            Notes.embedding_model.__ne__(None),
+            Notes.embedding_model.__ne__(target)
+        ).all():
+            models_by_user.setdefault(user_id, Counter())[model] += 1
+
+        planned = {
+            user_id: status
+            for user_id, status in db.query(EmbeddingMigrations.user_id, EmbeddingMigrations.status).filter(
+                EmbeddingMigrations.to_model.__eq__(target)
+            ).all()
+        }
+        for user_id, models in models_by_user.items():
+            from_model = models.most_common(1)[0][0]
+            status = planned.get(user_id)
+            if status is None:
+                db.add(EmbeddingMigrations(user_id=user_id, from_model=from_model, to_model=target))
+            elif status == "cancelled":
+                db.query(EmbeddingMigrations).filter(
+                    EmbeddingMigrations.user_id.__eq__(user_id),
+                    EmbeddingMigrations.to_model.__eq__(target)
+                ).update({"status": "pending", "from_model": from_model, "last_note_id": 0, "migrated": 0},
+                         synchronize_session=False)
+            elif status == "done":
+                # Geçişi bitmiş kullanıcıda eski modelle kalmış notlar normal kuyrukta yeniden embed edilir
+                db.query(Notes).filter(
+                    Notes.user_id.__eq__(user_id),
+                    Notes.embedding_model.__ne__(None),
+                    Notes.embedding_model.__ne__(target)
+                ).update({"embedding_status": EmbeddingStatusEnum.PENDING.value}, synchronize_session=False)
+        db.commit()
+        self.refresh()
+
+
+embedding_registry = EmbeddingRegistry()
+
+
+def serving_model(user_id: int = None) -> str:
+    return embedding_registry.serving_model(user_id)
+
+
+def serving_provider(user_id: int = None) -> EmbeddingProvider:
+    return embedding_registry.serving_provider(user_id)
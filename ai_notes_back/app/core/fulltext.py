@@ -0,0 +1,87 @@
+import os
+import re
+
+from dotenv import load_dotenv
+from sqlalchemy import func, or_
+
+from app.core.database import FULLTEXT_CONFIG, FULLTEXT_ENABLED
+from app.core.model import Notes
+
+load_dotenv()
+
+# Reciprocal rank fusion sabiti; büyüdükçe alt sıralardaki sonuçların ağırlığı artar
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Füzyona girecek aday sayısı = (offset + limit) * bu çarpan, her iki liste için
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "3"))
+# Bu kadar veya daha az kelimelik sorgular keyword sonuçları yetiyorsa embedding'e gitmez
+HYBRID_SHORT_QUERY_TERMS = int(os.getenv("HYBRID_SHORT_QUERY_TERMS", "2"))
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def query_terms(query: str) -> list[str]:
+    return _TERM_RE.findall(query.lower())
+
+
+def _document():
+    return func.coalesce(Notes.title, "") + " " + func.coalesce(Notes.content, "")
+
+
+def assign_search_vector(note: Notes):
+    # Kolon SQL ifadesiyle set edilir; tsvector INSERT/UPDATE sırasında Postgres'te hesaplanır
+    if not FULLTEXT_ENABLED:
+        return
+    note.search_vector = func.to_tsvector(
+        FULLTEXT_CONFIG, func.coalesce(note.title, "") + " " + func.coalesce(note.content, "")
+    )
+
+
+def search(db, user_id: int, query: str, k: int, offset: int = 0, conditions: list = None) -> list[tuple[int, float]]:
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    if FULLTEXT_ENABLED:
+        ts_query = func.websearch_to_tsquery(FULLTEXT_CONFIG, query)
+        rank = func.ts_rank_cd(Notes.search_vector, ts_query)
+        rows = (
+            db.query(Notes.id, rank.label("rank"))
+            .filter(
+                Notes.user_id.__eq__(user_id),
+                Notes.search_vector.op("@@")(ts_query),
+                *(conditions or [])
+            )
+            .order_by(rank.desc(), Notes.id.desc())
+            .offset(offset)
+            .limit(k)
+            .all()
+        )
+        return [(note_id, float(score)) for note_id, score in rows]
+
+    # Postgres dışı: tüm kelimeleri içeren notlar, en yeni önce
+    rows = (
+        db.query(Notes.id)
+        .filter(
+            Notes.user_id.__eq__(user_id),
+            *[or_(Notes.title.ilike(f"%{term}%"), Notes.content.ilike(f"%{term}%")) for term in terms],
+            *(conditions or [])
+        )
+        .order_by(Notes.updated_at.desc(), Notes.id.desc())
+        .offset(offset)
+        .limit(k)
+        .all()
+    )
+    return [(note_id, 1.0) for note_id, in rows]
+
+
+def reciprocal_rank_fusion(*rankings: list[tuple[int, float]], k: int = HYBRID_RRF_K) -> list[tuple[int, float]]:
+    """Sıralı (id, skor) listelerini sadece sıralarına bakarak birleştirir.
+
+    Skorlar farklı ölçeklerde (ts_rank vs cosine) olduğu için kullanılmaz;
+    her liste 1 / (k + sıra) katkı verir.
+    """
+    scores = {}
+    for ranking in rankings:
+        for position, (note_id, _) in enumerate(ranking, start=1):
+            scores[note_id] = scores.get(note_id, 0.0) + 1.0 / (k + position)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey,Table,LargeBinary,UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey,Table,LargeBinary,UniqueConstraint,Index,Float,BigInteger
 from datetime import datetime,timezone
 from sqlalchemy import Enum as SqlEnum
 
-from sqlalchemy.orm import relationship
-from app.core.database import Base
-from app.core.schemes import PriorityEnum
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from app.core.database import Base, VECTOR_BACKEND, PGVECTOR_DIM, PGVECTOR_INDEX, FULLTEXT_ENABLED
+from app.core.schemes import PriorityEnum, EmbeddingStatusEnum
+
+if VECTOR_BACKEND == "pgvector":
+    from pgvector.sqlalchemy import Vector
 
 note_tags = Table(
     "note_tags",
@@ -17,10 +21,37 @@ class Notes(Base):
     __tablename__ = 'notes'
 
     id = Column(Integer,primary_key=True,autoincrement=True,index=True)
-    user_id = Column(Integer,ForeignKey("users.id"),nullable=False)
+    user_id = Column(Integer,ForeignKey("users.id"),nullable=False,index=True)
     title = Column(String,nullable=False)
     content = Column(String,nullable=False)
-    embedding = Column(LargeBinary)
+    # Embedding blob'ları liste sorgularında yüklenmez, sadece erişilince okunur
+    embedding = deferred(Column(LargeBinary))
+    embedding_quantized = deferred(Column(LargeBinary,nullable=True))
+    embedding_scale = Column(Float,nullable=True)
+    embedding_status = Column(String,nullable=False,default=EmbeddingStatusEnum.READY.value)
+    embedding_model = Column(String,nullable=True)
+    embedding_dim = Column(Integer,nullable=True)
+    embedding_hash = Column(String(64),nullable=True)
+    # Embedding'in son yazıldığı an; arka plan yazmaları kullanıcıya görünen updated_at'i değiştirmez
+    embedding_updated_at = Column(DateTime(timezone=True),nullable=True)
+    __table_args__ = ()
+    if VECTOR_BACKEND == "pgvector":
+        embedding_vector = deferred(Column(Vector(PGVECTOR_DIM),nullable=True))
+        __table_args__ += (
+            Index(
+                "ix_notes_embedding_vector",
+                "embedding_vector",
+                postgresql_using=PGVECTOR_INDEX,
+                postgresql_ops={"embedding_vector": "vector_cosine_ops"},
+                postgresql_with={"m": 16, "ef_construction": 64} if PGVECTOR_INDEX == "hnsw" else {"lists": 100}
+            ),
+        )
+    if FULLTEXT_ENABLED:
+        # title + content; yazma endpoint'leri fulltext.assign_search_vector ile günceller
+        search_vector = deferred(Column(TSVECTOR,nullable=True))
+        __table_args__ += (
+            Index("ix_notes_search_vector", "search_vector", postgresql_using="gin"),
+        )
     created_at = Column(DateTime(timezone=True),default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime(timezone=True),onupdate=lambda: datetime.now(timezone.utc),default=lambda: datetime.now(timezone.utc))
     is_active = Column(Boolean,default=True)
@@ -33,6 +64,7 @@ class Notes(Base):
     priority = Column(SqlEnum(PriorityEnum), nullable=False, default=PriorityEnum.LOW)
     tags = relationship("Tag", secondary="note_tags", back_populates="notes")
     versions = relationship("NoteVersions", back_populates="note", cascade="all, delete-orphan")
+    chunks = relationship("NoteChunks", back_populates="note", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Users(Base):
@@ -104,4 +136,167 @@ class NoteVersions(Base):
     note = relationship("Notes", back_populates="versions")
     __table_args__ = (
         UniqueConstraint('note_id', 'version', name='uix_note_version'),
-    )
\ No newline at end of file
+    )
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+    id = Column(Integer,autoincrement=True,index=True,primary_key=True)
+    model = Column(String,nullable=False)
+    text_hash = Column(String(64),nullable=False)
+    embedding = Column(LargeBinary,nullable=False)
+    created_at = Column(DateTime(timezone=True),default=lambda:datetime.now(timezone.utc))
+    __table_args__ = (
+        UniqueConstraint('model', 'text_hash', name='uix_embedding_cache_model_hash'),
+    )
+
+class NoteChunks(Base):
+    __tablename__ = "note_chunks"
+    id = Column(Integer,autoincrement=True,index=True,primary_key=True)
+    note_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),nullable=False,index=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    position = Column(Integer,nullable=False)
+    content_hash = Column(String(64),nullable=False)
+    embedding = deferred(Column(LargeBinary,nullable=True))
+    embedding_model = Column(String,nullable=True)
+    created_at = Column(DateTime(timezone=True),default=lambda:datetime.now(timezone.utc))
+    note = relationship("Notes", back_populates="chunks")
+
+class NoteNeighbors(Base):
+    # Önceden hesaplanmış "ilgili notlar" kNN grafiği; her not için en benzer RELATED_NOTES_K not
+    __tablename__ = "note_neighbors"
+    note_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),primary_key=True)
+    neighbor_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),primary_key=True,index=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    rank = Column(Integer,nullable=False)
+    similarity = Column(Float,nullable=False)
+    # Liste hesaplanırken notun embedding_hash'i; değiştiyse liste bayattır
+    source_hash = Column(String(64),nullable=True)
+
+
+class NoteSignatures(Base):
+    # Near-duplicate tespiti için notun MinHash imzası
+    __tablename__ = "note_signatures"
+    note_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),primary_key=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    content_hash = Column(String(64),nullable=False)
+    signature = Column(LargeBinary,nullable=False)
+
+
+class NoteLSHBuckets(Base):
+    # İmzanın her bandı bir kovaya düşer; aynı kovayı paylaşan notlar aday çifttir
+    __tablename__ = "note_lsh_buckets"
+    note_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),primary_key=True)
+    band = Column(Integer,primary_key=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False)
+    bucket = Column(BigInteger,nullable=False)
+    __table_args__ = (
+        Index("ix_note_lsh_buckets_lookup", "user_id", "band", "bucket"),
+    )
+
+
+class NoteDuplicates(Base):
+    # Batch job'ın bulduğu near-duplicate çiftleri (note_id < duplicate_id)
+    __tablename__ = "note_duplicates"
+    note_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),primary_key=True)
+    duplicate_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),primary_key=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    similarity = Column(Float,nullable=False)
+    created_at = Column(DateTime(timezone=True),default=lambda:datetime.now(timezone.utc))
+
+
+class NoteTopics(Base):
+    # Kullanıcının notlarının k-means ile bulunan konu kümeleri
+    __tablename__ = "note_topics"
+    id = Column(Integer,primary_key=True,autoincrement=True,index=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    label = Column(String,nullable=True)
+    size = Column(Integer,nullable=False,default=0)
+    centroid = deferred(Column(LargeBinary,nullable=False))
+    embedding_model = Column(String,nullable=True)
+    created_at = Column(DateTime(timezone=True),default=lambda:datetime.now(timezone.utc))
+    updated_at = Column(DateTime(timezone=True),onupdate=lambda:datetime.now(timezone.utc),default=lambda:datetime.now(timezone.utc))
+
+
+class NoteTopicAssignments(Base):
+    __tablename__ = "note_topic_assignments"
+    note_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),primary_key=True)
+    topic_id = Column(Integer,ForeignKey("note_topics.id",ondelete="CASCADE"),nullable=False,index=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    similarity = Column(Float,nullable=False)
+
+
+class EmbeddingModels(Base):
+    # Kullanılmış her embedding modelinin kaydı; id model versiyonu olarak kullanılır
+    __tablename__ = "embedding_models"
+    id = Column(Integer,primary_key=True,autoincrement=True)
+    key = Column(String,unique=True,nullable=False)
+    provider = Column(String,nullable=False)
+    model = Column(String,nullable=False)
+    dim = Column(Integer,nullable=False)
+    status = Column(String,nullable=False,default="active")
+    created_at = Column(DateTime(timezone=True),default=lambda:datetime.now(timezone.utc))
+    activated_at = Column(DateTime(timezone=True),nullable=True)
+
+
+class EmbeddingMigrations(Base):
+    # Kullanıcı başına model geçişi; last_note_id kaldığı yeri tutar, süreç yeniden başlarsa oradan devam eder
+    __tablename__ = "embedding_migrations"
+    id = Column(Integer,primary_key=True,autoincrement=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    from_model = Column(String,nullable=False)
+    to_model = Column(String,nullable=False)
+    status = Column(String,nullable=False,default="pending")
+    last_note_id = Column(Integer,nullable=False,default=0)
+    migrated = Column(Integer,nullable=False,default=0)
+    # Geçişi yürüten worker ve son yenilediği an; süre dolarsa başka bir worker devralır
+    claimed_by = Column(String(64),nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True),nullable=True)
+    created_at = Column(DateTime(timezone=True),default=lambda:datetime.now(timezone.utc))
+    finished_at = Column(DateTime(timezone=True),nullable=True)
+    __table_args__ = (
+        UniqueConstraint("user_id", "to_model", name="uq_embedding_migrations_user_model"),
+    )
+
+
+class NoteEmbeddingStaging(Base):
+    # Geçiş sırasında yeni modelle üretilen embedding'ler; kullanıcı tamamlanınca notlara taşınır
+    __tablename__ = "note_embedding_staging"
+    note_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),primary_key=True)
+    model = Column(String,primary_key=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    content_hash = Column(String(64),nullable=False)
+    embedding = deferred(Column(LargeBinary,nullable=True))
+    dim = Column(Integer,nullable=True)
+
+
+class NoteAIResults(Base):
+    # LLM çıktılarının önbelleği; not, prompt versiyonu ve model aynıysa sonuç tekrar üretilmez
+    __tablename__ = "note_ai_results"
+    note_id = Column(Integer,ForeignKey("notes.id",ondelete="CASCADE"),primary_key=True)
+    kind = Column(String(16),primary_key=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    # Prompt'a giren başlık, içerik ve tag'lerin hash'i
+    content_hash = Column(String(64),nullable=False)
+    prompt_version = Column(String(16),nullable=False)
+    model = Column(String,nullable=False)
+    result = Column(String,nullable=False)
+    created_at = Column(DateTime(timezone=True),default=lambda: datetime.now(timezone.utc))
+
+
+class AutoTagJobs(Base):
+    # Tag'i olmayan notları toplu etiketleyen arka plan işi; ilerleme her batch'te kaydedilir
+    __tablename__ = "auto_tag_jobs"
+    id = Column(Integer,primary_key=True,autoincrement=True)
+    user_id = Column(Integer,ForeignKey("users.id",ondelete="CASCADE"),nullable=False,index=True)
+    # pending, running, done, budget_exhausted, failed
+    status = Column(String(20),nullable=False,default="pending")
+    total = Column(Integer,nullable=False,default=0)
+    processed = Column(Integer,nullable=False,default=0)
+    tagged = Column(Integer,nullable=False,default=0)
+    llm_requests = Column(Integer,nullable=False,default=0)
+    max_requests = Column(Integer,nullable=True)
+    last_note_id = Column(Integer,nullable=False,default=0)
+    error = Column(String,nullable=True)
+    created_at = Column(DateTime(timezone=True),default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime(timezone=True),onupdate=lambda: datetime.now(timezone.utc),default=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime(timezone=True),nullable=True)
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app.core.database import VECTOR_BACKEND, PGVECTOR_DIM, PGVECTOR_INDEX
+from app.core.model import Notes
+
+load_dotenv()
+
+# HNSW için ef_search, IVFFlat için probes varsayılanı
+PGVECTOR_SEARCH_EFFORT = int(os.getenv("PGVECTOR_SEARCH_EFFORT", "40"))
+
+
+def is_enabled() -> bool:
+    return VECTOR_BACKEND == "pgvector"
+
+
+def vector_columns(embedding: bytes, dim: int) -> dict:
+    # bytea embedding ile vector kolonunu senkron tutar; boyut uymuyorsa kolon boş bırakılır
+    if not is_enabled():
+        return {}
+    if embedding and dim == PGVECTOR_DIM:
+        return {"embedding_vector": np.frombuffer(embedding, dtype=np.float32)}
+    return {"embedding_vector": None}
+
+
+def assign_vector(note: Notes):
+    for column, value in vector_columns(note.embedding, note.embedding_dim).items():
+        setattr(note, column, value)
+
+
+def search(db, user_id: int, model: str, query: np.ndarray, k: int, offset: int = 0,
+           effort: int = None, exact: bool = False, conditions: list = None) -> list[tuple[int, float]]:
+    if len(query) != PGVECTOR_DIM:
+        return []
+
+    # Ayarlar savepoint içinde yapılır; savepoint'e geri dönmek SET LOCAL'ı da geri alır.
+    # Çağıranın session'ı ve transaction'ı olduğu gibi kalır.
+    setting = "hnsw.ef_search" if PGVECTOR_INDEX == "hnsw" else "ivfflat.probes"
+    savepoint = db.begin_nested()
+    try:
+        db.execute(text(f"SET LOCAL {setting} = {int(effort or PGVECTOR_SEARCH_EFFORT)}"))
+        if exact:
+            db.execute(text("SET LOCAL enable_indexscan = off"))
+
+        distance = Notes.embedding_vector.cosine_distance(query)
+        rows = (
+            db.query(Notes.id, distance.label("distance"))
+            .filter(
+                Notes.user_id.__eq__(user_id),
+                Notes.embedding_model.__eq__(model),
+                Notes.embedding_vector.__ne__(None),
+                *(conditions or [])
+            )
+            .order_by(distance)
+            .offset(offset)
+            .limit(k)
+            .all()
+        )
+    finally:
+        savepoint.rollback()
+    return [(note_id, 1.0 - float(dist)) for note_id, dist in rows]
@@ -0,0 +1,197 @@
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.core.embedding_registry import serving_model
+from app.core.database import SessionLocal
+from app.core.model import Notes, NoteNeighbors
+from app.core.vector_index import vector_indexes, search_index_many, normalize
+from app.core import pgvector_store
+
+load_dotenv()
+
+# Her not için saklanan komşu sayısı
+RELATED_NOTES_K = int(os.getenv("RELATED_NOTES_K", "10"))
+# Tam yeniden kurulumda tek çarpımda puanlanan satır sayısı (bellek ~ blok * not sayısı * 4 byte)
+RELATED_REBUILD_BLOCK = int(os.getenv("RELATED_REBUILD_BLOCK", "1024"))
+
+
+def _embedded_notes(db, user_id: int, note_ids: list[int] = None):
+    query = db.query(Notes.id, Notes.embedding, Notes.embedding_hash).filter(
+        Notes.user_id.__eq__(user_id),
+        Notes.embedding_model.__eq__(serving_model(user_id)),
+        Notes.embedding.__ne__(None),
+        Notes.deleted_at.__eq__(None)
+    )
+    if note_ids is not None:
+        query = query.filter(Notes.id.in_(note_ids))
+    return query.all()
+
+
+def _knn(db, user_id: int, rows, k: int) -> dict[int, list[tuple[int, float]]]:
+    # Notun kendisi hariç en benzer k not; mevcut arama altyapısı kullanılır
+    if not rows:
+        return {}
+    queries = np.stack([np.frombuffer(embedding, dtype=np.float32) for _, embedding, _ in rows])
+
+    if pgvector_store.is_enabled():
+        conditions = [Notes.deleted_at.__eq__(None)]
+        results = [
+            pgvector_store.search(db, user_id, serving_model(user_id), query, k=k + 1, conditions=conditions)
+            for query in queries
+        ]
+    else:
+        index = vector_indexes.get(db, user_id)
+        if index is None or index.full_dim != queries.shape[1]:
+            return {}
+        excluded = {note_id for note_id, in db.query(Notes.id).filter(
+            Notes.user_id.__eq__(user_id), Notes.deleted_at.__ne__(None)
+        ).all()}
+        results = search_index_many(db, index, queries, k=k + 1, excluded=excluded)
+
+    return {
+        note_id: [(neighbor_id, score) for neighbor_id, score in hits if neighbor_id != note_id][:k]
+        for (note_id, _, _), hits in zip(rows, results)
+    }
+
+
+def _write(db, user_id: int, lists: dict[int, tuple[list[tuple[int, float]], str]]):
+    if not lists:
+        return
+    db.query(NoteNeighbors).filter(NoteNeighbors.note_id.in_(list(lists))).delete(synchronize_session=False)
+    mappings = [
+        {
+            "note_id": note_id,
+            "neighbor_id": neighbor_id,
+            "user_id": user_id,
+            "rank": rank,
+            "similarity": similarity,
+            "source_hash": source_hash
+        }
+        for note_id, (neighbors, source_hash) in lists.items()
+        for rank, (neighbor_id, similarity) in enumerate(neighbors)
+    ]
+    if mappings:
+        db.execute(NoteNeighbors.__table__.insert(), mappings)
+
+
+def update_notes(db, user_id: int, note_ids: list[int]):
+    """Embedding'i değişen notların komşuluklarını artımlı olarak günceller.
+
+    Notun kendi listesi yeniden hesaplanır. Yeni komşu adaylarının listesine
+    not, son sıradakinden daha benzerse eklenir. Notu önceden komşu olarak
+    tutan ve notla benzerliği düşen notların listesi baştan hesaplanır.
+    Diğer notlara dokunulmaz.
+    """
+    rows = _embedded_notes(db, user_id, note_ids)
+    if not rows:
+        return
+
+    # Ters yönde güncelleme için daha geniş aday kümesi alınır
+    candidates = _knn(db, user_id, rows, 2 * RELATED_NOTES_K)
+    changed = {note_id for note_id, _, _ in rows}
+
+    old_reverse = db.query(NoteNeighbors.note_id, NoteNeighbors.neighbor_id, NoteNeighbors.similarity).filter(
+        NoteNeighbors.neighbor_id.in_(changed),
+        NoteNeighbors.note_id.notin_(changed)
+    ).all()
+
+    recompute = set()
+    for note_id, neighbor_id, old_similarity in old_reverse:
+        similarity = dict(candidates.get(neighbor_id, [])).get(note_id)
+        # Benzerlik düştüyse not listeden çıkmış olabilir; yerine gelecek not bilinmediği için liste baştan kurulur
+        if similarity is None or similarity < old_similarity:
+            recompute.add(note_id)
+
+    touched = {
+        neighbor_id
+        for hits in candidates.values()
+        for neighbor_id, _ in hits
+        if neighbor_id not in changed and neighbor_id not in recompute
+    }
+    current = {}
+    for note_id, neighbor_id, similarity, source_hash in db.query(
+        NoteNeighbors.note_id, NoteNeighbors.neighbor_id, NoteNeighbors.similarity, NoteNeighbors.source_hash
+    ).filter(NoteNeighbors.note_id.in_(touched)).order_by(NoteNeighbors.note_id, NoteNeighbors.rank).all():
+        neighbors, _ = current.setdefault(note_id, ([], source_hash))
+        neighbors.append((neighbor_id, similarity))
+
+    lists = {note_id: (candidates.get(note_id, [])[:RELATED_NOTES_K], text_hash) for note_id, _, text_hash in rows}
+    for note_id, hits in candidates.items():
+        for neighbor_id, similarity in hits:
+            # Listesi hiç hesaplanmamış notlar ilk istekte tam olarak hesaplanır
+            if neighbor_id not in current:
+                continue
+            neighbors, source_hash = current[neighbor_id]
+            neighbors = [item for item in neighbors if item[0] != note_id]
+            if len(neighbors) < RELATED_NOTES_K or similarity > neighbors[-1][1]:
+                neighbors.append((note_id, similarity))
+                neighbors.sort(key=lambda item: item[1], reverse=True)
+                current[neighbor_id] = (neighbors[:RELATED_NOTES_K], source_hash)
+                lists[neighbor_id] = current[neighbor_id]
+
+    if recompute:
+        recompute_rows = _embedded_notes(db, user_id, list(recompute))
+        knn = _knn(db, user_id, recompute_rows, RELATED_NOTES_K)
+        for note_id, _, text_hash in recompute_rows:
+            lists[note_id] = (knn.get(note_id, []), text_hash)
+
+    _write(db, user_id, lists)
+    db.commit()
+
+
+def get_related(db, note: Notes, limit: int) -> list[tuple[int, float]]:
+    # Liste yoksa ya da embedding sonradan değiştiyse önce artımlı güncelleme yapılır
+    stored = db.query(NoteNeighbors.neighbor_id, NoteNeighbors.similarity, NoteNeighbors.source_hash).filter(
+        NoteNeighbors.note_id.__eq__(note.id)
+    ).order_by(NoteNeighbors.rank).all()
+    if note.embedding_hash and (not stored or stored[0].source_hash != note.embedding_hash):
+        update_notes(db, note.user_id, [note.id])
+        stored = db.query(NoteNeighbors.neighbor_id, NoteNeighbors.similarity, NoteNeighbors.source_hash).filter(
+            NoteNeighbors.note_id.__eq__(note.id)
+        ).order_by(NoteNeighbors.rank).all()
+    return [(neighbor_id, similarity) for neighbor_id, similarity, _ in stored[:limit]]
+
+
+def rebuild_user(db, user_id: int):
+    # Tüm grafiği blok blok matris çarpımıyla yeniden kurar
+    rows = _embedded_notes(db, user_id)
+    lists = {}
+    k = min(RELATED_NOTES_K, len(rows) - 1)
+    if k > 0:
+        ids = np.array([note_id for note_id, _, _ in rows], dtype=np.int64)
+        matrix = normalize(np.frombuffer(b"".join(emb for _, emb, _ in rows), dtype=np.float32).reshape(len(rows), -1))
+        for start in range(0, len(rows), RELATED_REBUILD_BLOCK):
+            end = min(len(rows), start + RELATED_REBUILD_BLOCK)
+            scores = matrix[start:end] @ matrix.T
+            scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            part_scores = np.take_along_axis(scores, part, axis=1)
+            order = np.argsort(-part_scores, axis=1)
+            part = np.take_along_axis(part, order, axis=1)
+            part_scores = np.take_along_axis(part_scores, order, axis=1)
+            for offset, row in enumerate(range(start, end)):
+                lists[int(ids[row])] = (
+                    [(int(ids[i]), float(s)) for i, s in zip(part[offset], part_scores[offset])],
+                    rows[row][2]
+                )
+
+    db.query(NoteNeighbors).filter(NoteNeighbors.user_id.__eq__(user_id)).delete(synchronize_session=False)
+    _write(db, user_id, lists)
+    db.commit()
+
+
+def rebuild_all():
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for user_id, in db.query(Notes.user_id).filter(Notes.embedding.__ne__(None)).distinct().all()]
+        for user_id in user_ids:
+            # Bir kullanıcıdaki hata sonraki kullanıcıların yeniden kurulmasını engellemez
+            try:
+                rebuild_user(db, user_id)
+            except Exception as err:
+                db.rollback()
+                print(f"Related notes rebuild failed for user {user_id} ({err})")
+    finally:
+        db.close()
@@ -31,6 +31,11 @@ class PriorityEnum(str,Enum):
     MEDIUM = "Medium"
     HIGH = "High"
 
+class EmbeddingStatusEnum(str,Enum):
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
 class UpdateNotesRequest(BaseModel):
     title : str
     content :str
@@ -50,6 +55,17 @@ class NoteRequest(BaseModel):
     tags: Optional[List[str]] = []
 
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=50)
+    limit: int = Field(10, ge=1, le=200)
+    nprobe: Optional[int] = Field(None, ge=1)
+    exact: bool = False
+    include_deleted: bool = False
+
+class AutoTagRequest(BaseModel):
+    # Bu iş için en fazla LLM isteği; boşsa AUTO_TAG_MAX_REQUESTS kullanılır
+    max_requests: Optional[int] = Field(None, ge=1)
+
 class TagCreateRequest(BaseModel):
     name: str
 
@@ -0,0 +1,53 @@
+import os
+
+from dotenv import load_dotenv
+
+from app.core.model import Notes, Tag, note_tags
+from app.core.related import get_related, RELATED_NOTES_K
+
+load_dotenv()
+
+# Önerilecek en fazla tag sayısı
+TAG_SUGGEST_MAX = int(os.getenv("TAG_SUGGEST_MAX", "7"))
+# Bir tag'in önerilmesi için komşu benzerliklerinden aldığı pay (0-1)
+TAG_SUGGEST_MIN_SCORE = float(os.getenv("TAG_SUGGEST_MIN_SCORE", "0.25"))
+# En iyi tag'in payı ya da en yakın komşunun benzerliği bunun altındaysa LLM'e düşülür
+TAG_SUGGEST_CONFIDENCE = float(os.getenv("TAG_SUGGEST_CONFIDENCE", "0.4"))
+TAG_SUGGEST_MIN_SIMILARITY = float(os.getenv("TAG_SUGGEST_MIN_SIMILARITY", "0.3"))
+
+
+def suggest_tags(db, note: Notes) -> tuple[list[tuple[str, float]], bool]:
+    """Notun en yakın komşularının tag'lerini benzerlikle ağırlıklandırıp önerir.
+
+    Komşular önceden hesaplanmış kNN grafiğinden okunur. (tag, skor) listesi
+    ile önerinin yeterince güvenilir olup olmadığını döner.
+    """
+    neighbors = [(note_id, sim) for note_id, sim in get_related(db, note, RELATED_NOTES_K) if sim > 0]
+    if not neighbors:
+        return [], False
+
+    similarity = dict(neighbors)
+    rows = (
+        db.query(note_tags.c.note_id, Tag.name)
+        .join(Tag, Tag.id.__eq__(note_tags.c.tag_id))
+        .join(Notes, Notes.id.__eq__(note_tags.c.note_id))
+        .filter(note_tags.c.note_id.in_(list(similarity)), Notes.deleted_at.__eq__(None))
+        .all()
+    )
+
+    existing = {tag.name for tag in note.tags}
+    scores = {}
+    for note_id, name in rows:
+        if name not in existing:
+            scores[name] = scores.get(name, 0.0) + similarity[note_id]
+
+    total = sum(similarity.values())
+    ranked = sorted(((name, score / total) for name, score in scores.items()), key=lambda item: item[1], reverse=True)
+    ranked = [(name, score) for name, score in ranked if score >= TAG_SUGGEST_MIN_SCORE][:TAG_SUGGEST_MAX]
+
+    confident = (
+        bool(ranked)
+        and ranked[0][1] >= TAG_SUGGEST_CONFIDENCE
+        and neighbors[0][1] >= TAG_SUGGEST_MIN_SIMILARITY
+    )
+    return ranked, confident
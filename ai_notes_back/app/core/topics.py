@@ -0,0 +1,194 @@
+import os
+import re
+from collections import Counter
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import undefer
+
+from app.core.embedding_registry import serving_model
+from app.core.database import SessionLocal
+from app.core.model import Notes, Tag, note_tags, NoteTopics, NoteTopicAssignments
+from app.core.vector_index import normalize
+
+load_dotenv()
+
+# 0 -> konu sayısı sqrt(n / 2) olarak seçilir (2 ile TOPIC_MAX_COUNT arasında)
+TOPIC_COUNT = int(os.getenv("TOPIC_COUNT", "0"))
+TOPIC_MAX_COUNT = int(os.getenv("TOPIC_MAX_COUNT", "50"))
+# Bundan az notu olan kullanıcılar için kümeleme yapılmaz
+TOPIC_MIN_NOTES = int(os.getenv("TOPIC_MIN_NOTES", "10"))
+TOPIC_BATCH_SIZE = int(os.getenv("TOPIC_BATCH_SIZE", "256"))
+TOPIC_ITERATIONS = int(os.getenv("TOPIC_ITERATIONS", "100"))
+
+_WORD_RE = re.compile(r"\w{4,}", re.UNICODE)
+# Atamalar bu kadar satırlık bloklar halinde hesaplanır
+_ASSIGN_BLOCK = 4096
+
+
+def minibatch_kmeans(vectors: np.ndarray, k: int, batch_size: int = TOPIC_BATCH_SIZE,
+                     iterations: int = TOPIC_ITERATIONS) -> np.ndarray:
+    """Normalize edilmiş vektörler üzerinde spherical mini-batch k-means.
+
+    Her adımda rastgele bir batch en yakın merkeze atanır ve merkezler
+    1 / (merkeze düşen toplam örnek) öğrenme oranıyla güncellenir;
+    tüm korpus her iterasyonda taranmaz.
+    """
+    rng = np.random.default_rng(0)
+    n = len(vectors)
+    centroids = vectors[rng.choice(n, k, replace=False)].copy()
+    counts = np.zeros(k, dtype=np.float64)
+
+    for _ in range(iterations):
+        batch = vectors[rng.choice(n, min(batch_size, n), replace=False)]
+        assign = np.argmax(batch @ centroids.T, axis=1)
+        batch_counts = np.bincount(assign, minlength=k).astype(np.float64)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, batch)
+
+        counts += batch_counts
+        touched = batch_counts > 0
+        rate = (1.0 / counts[touched])[:, None]
+        # c <- c + (toplam - adet * c) / sayaç: batch'teki her örnek için c += (x - c) / sayaç'ın toplu hali
+        centroids[touched] += rate * (sums[touched] - batch_counts[touched, None] * centroids[touched])
+        centroids = normalize(centroids)
+
+    return centroids
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    labels = np.empty(len(vectors), dtype=np.int64)
+    scores = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK):
+        block = vectors[start:start + _ASSIGN_BLOCK] @ centroids.T
+        labels[start:start + len(block)] = np.argmax(block, axis=1)
+        scores[start:start + len(block)] = block[np.arange(len(block)), labels[start:start + len(block)]]
+    return labels, scores
+
+
+def _label(db, note_ids: list[int]) -> str:
+    # Önce üyelerin en sık tag'leri, tag yoksa başlıklardaki en sık kelimeler
+    tag_counts = Counter(
+        name for name, in db.query(Tag.name).join(note_tags, note_tags.c.tag_id.__eq__(Tag.id)).filter(
+            note_tags.c.note_id.in_(note_ids)
+        ).all()
+    )
+    if tag_counts:
+        return ", ".join(name for name, _ in tag_counts.most_common(3))
+    words = Counter(
+        word
+        for title, in db.query(Notes.title).filter(Notes.id.in_(note_ids)).all()
+        for word in _WORD_RE.findall((title or "").lower())
+    )
+    return ", ".join(word for word, _ in words.most_common(3)) or None
+
+
+def _embedded_notes(db, user_id: int, note_ids: list[int] = None):
+    query = db.query(Notes.id, Notes.embedding).filter(
+        Notes.user_id.__eq__(user_id),
+        Notes.embedding_model.__eq__(serving_model(user_id)),
+        Notes.embedding.__ne__(None),
+        Notes.deleted_at.__eq__(None)
+    )
+    if note_ids is not None:
+        query = query.filter(Notes.id.in_(note_ids))
+    return query.all()
+
+
+def rebuild_user(db, user_id: int):
+    rows = _embedded_notes(db, user_id)
+    db.query(NoteTopics).filter(NoteTopics.user_id.__eq__(user_id)).delete(synchronize_session=False)
+    db.query(NoteTopicAssignments).filter(NoteTopicAssignments.user_id.__eq__(user_id)).delete(synchronize_session=False)
+    if len(rows) < TOPIC_MIN_NOTES:
+        db.commit()
+        return
+
+    ids = [note_id for note_id, _ in rows]
+    vectors = normalize(np.frombuffer(b"".join(emb for _, emb in rows), dtype=np.float32).reshape(len(rows), -1))
+    k = TOPIC_COUNT or int(np.sqrt(len(rows) / 2))
+    k = max(2, min(k, TOPIC_MAX_COUNT, len(rows)))
+    centroids = minibatch_kmeans(vectors, k)
+    labels, scores = _assign(vectors, centroids)
+
+    model = serving_model(user_id)
+    topics = {}
+    for topic in np.unique(labels):
+        members = [ids[i] for i in np.flatnonzero(labels == topic)]
+        topics[int(topic)] = NoteTopics(
+            user_id=user_id,
+            label=_label(db, members),
+            size=len(members),
+            centroid=centroids[topic].astype(np.float32).tobytes(),
+            embedding_model=model
+        )
+    db.add_all(topics.values())
+    db.flush()
+
+    db.add_all([
+        NoteTopicAssignments(note_id=note_id, topic_id=topics[int(topic)].id, user_id=user_id, similarity=float(score))
+        for note_id, topic, score in zip(ids, labels, scores)
+    ])
+    db.commit()
+
+
+def assign_notes(db, user_id: int, note_ids: list[int]):
+    """Yeni ya da değişen notları mevcut merkezlere atar.
+
+    Merkez, üye sayısıyla ağırlıklı hareketli ortalama ile güncellenir;
+    kümeleme sadece gece job'ında ya da refresh istendiğinde baştan yapılır.
+    """
+    topics = db.query(NoteTopics).filter(
+        NoteTopics.user_id.__eq__(user_id),
+        NoteTopics.embedding_model.__eq__(serving_model(user_id))
+    ).options(undefer(NoteTopics.centroid)).all()
+    if not topics:
+        return
+    rows = _embedded_notes(db, user_id, note_ids)
+    if not rows:
+        return
+
+    centroids = np.stack([np.frombuffer(topic.centroid, dtype=np.float32) for topic in topics])
+    vectors = normalize(np.frombuffer(b"".join(emb for _, emb in rows), dtype=np.float32).reshape(len(rows), -1))
+    if vectors.shape[1] != centroids.shape[1]:
+        return
+    labels, scores = _assign(vectors, centroids)
+
+    topics_by_id = {topic.id: topic for topic in topics}
+    existing = {
+        assignment.note_id: assignment
+        for assignment in db.query(NoteTopicAssignments).filter(
+            NoteTopicAssignments.note_id.in_([note_id for note_id, _ in rows])
+        ).all()
+    }
+    centroids = centroids.copy()
+    for (note_id, _), vector, label, score in zip(rows, vectors, labels, scores):
+        topic = topics[label]
+        assignment = existing.get(note_id)
+        if assignment is None:
+            db.add(NoteTopicAssignments(note_id=note_id, topic_id=topic.id, user_id=user_id, similarity=float(score)))
+        else:
+            old = topics_by_id.get(assignment.topic_id)
+            if old is not None and old.id != topic.id:
+                old.size = max(0, old.size - 1)
+            assignment.topic_id = topic.id
+            assignment.similarity = float(score)
+            if old is not None and old.id == topic.id:
+                continue
+        topic.size += 1
+        centroids[label] = normalize(centroids[label] + (vector - centroids[label]) / topic.size)
+        topic.centroid = centroids[label].tobytes()
+    db.commit()
+
+
+def rebuild_all():
+    db = SessionLocal()
+    try:
+        for user_id, in db.query(Notes.user_id).filter(Notes.embedding.__ne__(None)).distinct().all():
+            # Bir kullanıcıdaki hata sonraki kullanıcıların yeniden kurulmasını engellemez
+            try:
+                rebuild_user(db, user_id)
+            except Exception as err:
+                db.rollback()
+                print(f"Topic rebuild failed for user {user_id} ({err})")
+    finally:
+        db.close()
@@ -0,0 +1,879 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func
+
+from app.core.embedding_registry import serving_model
+from app.core.model import Notes, NoteChunks
+from app.core import vector_snapshot
+
+load_dotenv()
+
+# 0 -> liste sayısı sqrt(n) olarak seçilir
+VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", "0"))
+# Aramada taranan liste sayısı; arttıkça recall artar, gecikme de artar
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+# Bu sayının altındaki kullanıcılar için IVF kurulmaz, exact scan yapılır
+VECTOR_INDEX_MIN_SIZE = int(os.getenv("VECTOR_INDEX_MIN_SIZE", "2048"))
+VECTOR_INDEX_TRAIN_ITERS = int(os.getenv("VECTOR_INDEX_TRAIN_ITERS", "10"))
+VECTOR_INDEX_TRAIN_SAMPLE = int(os.getenv("VECTOR_INDEX_TRAIN_SAMPLE", "20000"))
+# Bellekte tutulan tüm kullanıcı matrisleri için üst sınır (byte); aşılınca en eski kullanılan düşer
+VECTOR_INDEX_MEMORY_BUDGET = int(os.getenv("VECTOR_INDEX_MEMORY_BUDGET", str(256 * 1024 * 1024)))
+# "none" (float32), "float16" ya da "int8": sıkıştırılmış vektörlerle kaba tarama yapılır,
+# en iyi adaylar float32 embedding ile yeniden puanlanır
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+# Yeniden puanlanan aday sayısı = (offset + limit) * VECTOR_RESCORE_FACTOR
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+# >0 ise (örn. 256) index sadece embedding'in ilk D boyutunu tutar (Matryoshka kaba tarama),
+# adaylar tam boyutlu embedding ile yeniden sıralanır. text-embedding-3-* modelleri bunu destekler.
+VECTOR_COARSE_DIM = int(os.getenv("VECTOR_COARSE_DIM", "0"))
+# Filtreli aramada eşleşen not sayısı bunun altındaysa IVF yerine sadece o satırlar taranır
+VECTOR_FILTER_EXACT_MAX = int(os.getenv("VECTOR_FILTER_EXACT_MAX", "10000"))
+
+_STORAGE_DTYPES = {"none": np.float32, "float16": np.float16, "int8": np.int8}
+# Sıkıştırılmış matris float32'ye bu kadar satırlık parçalar halinde açılır
+_SCAN_CHUNK = 8192
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+def quantize(vectors: np.ndarray, mode: str = VECTOR_QUANTIZATION) -> tuple[np.ndarray, np.ndarray]:
+    # Normalize edilmiş vektörleri saklama tipine çevirir; int8'de her satırın kendi ölçeği vardır
+    vectors = normalize(np.asarray(vectors, dtype=np.float32))
+    scales = np.ones(len(vectors), dtype=np.float32)
+    if mode == "int8":
+        peak = np.abs(vectors).max(axis=1)
+        peak[peak == 0] = 1.0
+        scales = (peak / 127.0).astype(np.float32)
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales
+    return vectors.astype(_STORAGE_DTYPES[mode]), scales
+
+
+def quantized_columns(embedding: bytes) -> dict:
+    if VECTOR_QUANTIZATION == "none" or not embedding:
+        return {"embedding_quantized": None, "embedding_scale": None}
+    data, scales = quantize(np.frombuffer(embedding, dtype=np.float32)[None, :])
+    return {"embedding_quantized": data.tobytes(), "embedding_scale": float(scales[0])}
+
+
+def quantize_note(note: Notes):
+    for column, value in quantized_columns(note.embedding).items():
+        setattr(note, column, value)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # Tam sıralama yerine argpartition: O(n + k log k)
+    if k >= len(scores):
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+def _train_centroids(vectors: np.ndarray, nlist: int) -> np.ndarray:
+    # Spherical k-means: vektörler normalize olduğu için benzerlik = iç çarpım
+    rng = np.random.default_rng(0)
+    sample = vectors
+    if len(vectors) > VECTOR_INDEX_TRAIN_SAMPLE:
+        sample = vectors[rng.choice(len(vectors), VECTOR_INDEX_TRAIN_SAMPLE, replace=False)]
+
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(VECTOR_INDEX_TRAIN_ITERS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        filled = counts > 0
+        centroids[filled] = sums[filled]
+        centroids = normalize(centroids)
+    return centroids
+
+
+class _ReadWriteLock:
+    """Çok okuyucu / tek yazıcı kilidi; bekleyen yazıcı varken yeni okuyucu alınmaz."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class IVFIndex:
+    """Tek bir kullanıcının not embedding'leri için IVF (inverted file) index.
+
+    Vektörler normalize edilmiş matris olarak tutulur; VECTOR_QUANTIZATION
+    açıksa float16 ya da satır ölçekli int8 olarak saklanır. Not sayısı
+    VECTOR_INDEX_MIN_SIZE altındaysa ya da exact istenirse tüm matris taranır,
+    aksi halde sorguya en yakın `nprobe` centroid listesi taranır.
+
+    Aramalar okuma, add/remove yazma kilidiyle çalışır; embedding worker'ı
+    index'i güncellerken arama yarım yazılmış satır ya da liste görmez.
+    """
+
+    def __init__(self, dim: int, model: str = None, quantization: str = VECTOR_QUANTIZATION, full_dim: int = None):
+        # dim: index'te tutulan boyut, full_dim: embedding'in gerçek boyutu (kırpma yoksa aynı)
+        self.dim = dim
+        self.full_dim = full_dim or dim
+        self.model = model
+        self.quantization = quantization
+        self._vectors = np.empty((0, dim), dtype=_STORAGE_DTYPES[quantization])
+        self._scales = np.empty(0, dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._assign = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self._rows = {}
+        self._centroids = None
+        self._lists = []
+        self._trained_size = 0
+        self._rw = _ReadWriteLock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        centroids = self._centroids.nbytes if self._centroids is not None else 0
+        return self._vectors.nbytes + self._scales.nbytes + self._ids.nbytes + self._assign.nbytes + centroids
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    @property
+    def needs_rescore(self) -> bool:
+        return self.quantization != "none" or self.dim < self.full_dim
+
+    def _truncate(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors[..., :self.dim]
+
+    def build(self, ids: list[int], vectors: np.ndarray):
+        vectors = self._truncate(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        data, scales = quantize(vectors, self.quantization)
+        self.build_encoded(ids, data, scales)
+
+    def build_encoded(self, ids: list[int], data: np.ndarray, scales: np.ndarray):
+        self._vectors = np.array(data, dtype=_STORAGE_DTYPES[self.quantization]).reshape(-1, self.dim)
+        self._scales = np.array(scales, dtype=np.float32)
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._size = len(ids)
+        self._rows = {int(note_id): row for row, note_id in enumerate(self._ids)}
+        if self.dim < self.full_dim:
+            self._renormalize()
+        self._train()
+
+    def attach(self, ids: np.ndarray, vectors: np.ndarray):
+        # Normalize edilmiş float32 matris (örn. mmap'lenmiş snapshot) kopyalanmadan kullanılır
+        self._vectors = vectors
+        self._scales = np.ones(len(ids), dtype=np.float32)
+        self._ids = ids
+        self._size = len(ids)
+        self._rows = {int(note_id): row for row, note_id in enumerate(ids)}
+        self._train()
+
+    def _materialize(self):
+        # mmap'ten gelen salt okunur diziler ilk değişiklikte process belleğine kopyalanır
+        if not self._vectors.flags.writeable:
+            self._vectors = np.array(self._vectors)
+        if not self._ids.flags.writeable:
+            self._ids = np.array(self._ids)
+
+    def _renormalize(self):
+        # Kırpılmış vektörlerin normu 1 değildir; kosinüs için satırlar yeniden ölçeklenir
+        for start in range(0, self._size, _SCAN_CHUNK):
+            rows = np.arange(start, min(self._size, start + _SCAN_CHUNK))
+            norms = np.linalg.norm(self._decode(rows), axis=1)
+            norms[norms == 0] = 1.0
+            if self.quantization == "none":
+                self._vectors[rows] /= norms[:, None]
+            else:
+                self._scales[rows] /= norms
+
+    def _decode(self, rows) -> np.ndarray:
+        if self.quantization == "none":
+            return self._vectors[rows]
+        return self._vectors[rows].astype(np.float32) * self._scales[rows, None]
+
+    def _matmul(self, rows, matrix: np.ndarray) -> np.ndarray:
+        # Sıkıştırılmış satırlar parça parça açılır; tüm matrisin float32 kopyası oluşmaz
+        if self.quantization == "none":
+            # Tam taramada satırlar kopyalanmadan görünüm üzerinden çarpılır
+            if rows is None:
+                return self._vectors[:self._size] @ matrix
+            return self._vectors[rows] @ matrix
+        if rows is None:
+            rows = np.arange(self._size)
+        out = np.empty((len(rows),) + matrix.shape[1:], dtype=np.float32)
+        for start in range(0, len(rows), _SCAN_CHUNK):
+            chunk = rows[start:start + _SCAN_CHUNK]
+            out[start:start + len(chunk)] = self._decode(chunk) @ matrix
+        return out
+
+    def _train(self):
+        n = self._size
+        if n < VECTOR_INDEX_MIN_SIZE:
+            self._centroids = None
+            self._lists = []
+            self._assign = np.zeros(len(self._vectors), dtype=np.int32)
+            self._trained_size = 0
+            return
+
+        nlist = VECTOR_INDEX_NLIST or int(np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        sample = np.arange(n)
+        if n > VECTOR_INDEX_TRAIN_SAMPLE:
+            sample = np.random.default_rng(0).choice(n, VECTOR_INDEX_TRAIN_SAMPLE, replace=False)
+        self._centroids = _train_centroids(self._decode(sample), nlist)
+
+        assign = np.argmax(self._matmul(None, self._centroids.T), axis=1).astype(np.int32)
+        self._assign = np.zeros(len(self._vectors), dtype=np.int32)
+        self._assign[:n] = assign
+        self._lists = [set() for _ in range(nlist)]
+        for row, list_id in enumerate(assign):
+            self._lists[list_id].add(row)
+        self._trained_size = n
+
+    def _grow(self):
+        capacity = max(16, len(self._vectors) * 2)
+        vectors = np.empty((capacity, self.dim), dtype=self._vectors.dtype)
+        vectors[:self._size] = self._vectors[:self._size]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:self._size] = self._scales[:self._size]
+        ids = np.empty(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        assign = np.zeros(capacity, dtype=np.int32)
+        assign[:self._size] = self._assign[:self._size]
+        self._vectors, self._scales, self._ids, self._assign = vectors, scales, ids, assign
+
+    def add(self, note_id: int, vector: np.ndarray):
+        with self._rw.writing():
+            self._add(note_id, vector)
+
+    def remove(self, note_id: int):
+        with self._rw.writing():
+            self._remove(note_id)
+
+    def _add(self, note_id: int, vector: np.ndarray):
+        vector = normalize(self._truncate(vector).reshape(self.dim))
+        data, scales = quantize(vector[None, :], self.quantization)
+        self._materialize()
+        if note_id in self._rows:
+            self._remove(note_id)
+
+        if self._size == len(self._vectors):
+            self._grow()
+
+        row = self._size
+        self._vectors[row] = data[0]
+        self._scales[row] = scales[0]
+        self._ids[row] = note_id
+        self._rows[note_id] = row
+        self._size += 1
+
+        if self.is_trained:
+            list_id = int(np.argmax(self._centroids @ vector))
+            self._assign[row] = list_id
+            self._lists[list_id].add(row)
+            # Korpus eğitildiği boyutun iki katına çıktıysa centroid'ler yeniden hesaplanır
+            if self._size >= 2 * self._trained_size:
+                self._train()
+        elif self._size >= VECTOR_INDEX_MIN_SIZE:
+            self._train()
+
+    def _remove(self, note_id: int):
+        row = self._rows.pop(note_id, None)
+        if row is None:
+            return
+        self._materialize()
+
+        last = self._size - 1
+        if self.is_trained:
+            self._lists[self._assign[row]].discard(row)
+
+        if row != last:
+            moved_id = int(self._ids[last])
+            self._vectors[row] = self._vectors[last]
+            self._scales[row] = self._scales[last]
+            self._ids[row] = moved_id
+            self._assign[row] = self._assign[last]
+            self._rows[moved_id] = row
+            if self.is_trained:
+                self._lists[self._assign[last]].discard(last)
+                self._lists[self._assign[row]].add(row)
+
+        self._size -= 1
+
+    def _candidate_rows(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        centroid_scores = self._centroids @ query
+        nprobe = min(nprobe, len(self._centroids))
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        rows = [row for list_id in probe for row in self._lists[list_id]]
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def _rows_for(self, ids) -> np.ndarray:
+        rows = [self._rows[i] for i in ids if i in self._rows]
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def search(self, query: np.ndarray, k: int, offset: int = 0, nprobe: int = None,
+               exact: bool = False, allowed=None, excluded=None) -> list[tuple[int, float]]:
+        """En benzer k sonucu döner.
+
+        `allowed` verilirse sadece bu id'ler puanlanır (SQL'de önceden
+        filtrelenmiş notlar); `excluded` id'leri sonuçlardan çıkarılır.
+        """
+        with self._rw.reading():
+            return self._search(query, k, offset, nprobe, exact, allowed, excluded)
+
+    def _search(self, query: np.ndarray, k: int, offset: int = 0, nprobe: int = None,
+                exact: bool = False, allowed=None, excluded=None) -> list[tuple[int, float]]:
+        if self._size == 0 or k <= 0:
+            return []
+
+        query = normalize(self._truncate(query).reshape(self.dim))
+        nprobe = nprobe or VECTOR_INDEX_NPROBE
+        use_ivf = not exact and self.is_trained and nprobe < len(self._centroids)
+
+        if allowed is not None:
+            rows = self._rows_for(allowed)
+            # Seçici filtrelerde sadece eşleşen satırlar taranır, maliyet alt kümeyle orantılıdır
+            if use_ivf and len(rows) > VECTOR_FILTER_EXACT_MAX:
+                rows = np.intersect1d(self._candidate_rows(query, nprobe), rows, assume_unique=True)
+        elif use_ivf:
+            rows = self._candidate_rows(query, nprobe)
+        else:
+            rows = None
+
+        if rows is not None and len(rows) == 0:
+            return []
+        scores = self._matmul(rows, query)
+
+        if excluded:
+            excluded_rows = self._rows_for(excluded)
+            if len(excluded_rows):
+                if rows is None:
+                    scores[excluded_rows] = -np.inf
+                else:
+                    scores[np.isin(rows, excluded_rows)] = -np.inf
+
+        order = top_k(scores, offset + k)[offset:]
+        order = order[np.isfinite(scores[order])]
+        ids = self._ids[order] if rows is None else self._ids[rows[order]]
+        return [(int(note_id), float(scores[i])) for note_id, i in zip(ids, order)]
+
+    def search_many(self, queries: np.ndarray, k: int, nprobe: int = None, exact: bool = False,
+                    allowed=None, excluded=None) -> list[list[tuple[int, float]]]:
+        """Birden fazla sorguyu tek matris-matris çarpımıyla puanlar.
+
+        IVF'de sorguların probe ettiği listelerin birleşimi taranır; her sorgu
+        kendi listelerinin üst kümesini gördüğü için recall tekli aramadan düşük olmaz.
+        """
+        with self._rw.reading():
+            return self._search_many(queries, k, nprobe, exact, allowed, excluded)
+
+    def _search_many(self, queries: np.ndarray, k: int, nprobe: int = None, exact: bool = False,
+                     allowed=None, excluded=None) -> list[list[tuple[int, float]]]:
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.full_dim)
+        if self._size == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        queries = normalize(self._truncate(queries))
+        nprobe = nprobe or VECTOR_INDEX_NPROBE
+        use_ivf = not exact and self.is_trained and nprobe < len(self._centroids)
+
+        rows = self._rows_for(allowed) if allowed is not None else None
+        if use_ivf and (rows is None or len(rows) > VECTOR_FILTER_EXACT_MAX):
+            candidates = np.unique(np.concatenate([self._candidate_rows(query, nprobe) for query in queries]))
+            rows = candidates if rows is None else np.intersect1d(candidates, rows, assume_unique=True)
+
+        if rows is not None and len(rows) == 0:
+            return [[] for _ in range(len(queries))]
+        # (satır, sorgu) skor matrisi
+        scores = self._matmul(rows, queries.T)
+
+        if excluded:
+            excluded_rows = self._rows_for(excluded)
+            if len(excluded_rows):
+                if rows is None:
+                    scores[excluded_rows] = -np.inf
+                else:
+                    scores[np.isin(rows, excluded_rows)] = -np.inf
+
+        ids = self._ids[:self._size] if rows is None else self._ids[rows]
+        results = []
+        for column in scores.T:
+            order = top_k(column, k)
+            order = order[np.isfinite(column[order])]
+            results.append([(int(ids[i]), float(column[i])) for i in order])
+        return results
+
+
+def _coarse_width(dim: int) -> int:
+    return VECTOR_COARSE_DIM if 0 < VECTOR_COARSE_DIM < dim else dim
+
+
+class VectorIndexRegistry:
+    """Kullanıcı başına IVFIndex tutar; index ilk aramada veritabanından kurulur.
+
+    Toplam bellek VECTOR_INDEX_MEMORY_BUDGET'ı aşarsa en uzun süredir
+    kullanılmayan kullanıcıların index'i LRU sırasıyla atılır.
+    """
+
+    def __init__(self, memory_budget: int = VECTOR_INDEX_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self._indexes = OrderedDict()
+        # Global kilit sadece sözlüğü korur; index kurulumu kullanıcı başına kilitle yapılır
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        # Kurulmakta olan index'ler için bekleyen değişiklikler
+        self._pending = {}
+        self.evictions = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(index.nbytes for index in self._indexes.values())
+
+    def _evict(self, keep: int):
+        total = self.nbytes
+        while total > self.memory_budget and len(self._indexes) > 1:
+            user_id, index = next(iter(self._indexes.items()))
+            if user_id == keep:
+                self._indexes.move_to_end(user_id)
+                continue
+            del self._indexes[user_id]
+            total -= index.nbytes
+            self.evictions += 1
+
+    def _build(self, db, user_id: int):
+        # Sadece aktif provider/model ile üretilmiş embedding'ler karşılaştırılabilir
+        model = serving_model(user_id)
+        if VECTOR_QUANTIZATION != "none":
+            return self._build_quantized(db, user_id, model)
+        if vector_snapshot.is_enabled():
+            return self._build_from_snapshot(db, user_id, model)
+
+        # Kaba tarama açıksa blob'un sadece ilk D boyutu veritabanından okunur
+        column = Notes.embedding
+        if VECTOR_COARSE_DIM > 0:
+            column = func.substr(Notes.embedding, 1, VECTOR_COARSE_DIM * 4)
+        rows = (
+            db.query(Notes.id, column, Notes.embedding_dim)
+            .filter(
+                Notes.user_id.__eq__(user_id),
+                Notes.embedding.__ne__(None),
+                Notes.embedding_model.__eq__(model)
+            )
+            .all()
+        )
+        if not rows:
+            return None
+
+        dim = rows[0][2]
+        width = _coarse_width(dim)
+        rows = [(note_id, emb) for note_id, emb, emb_dim in rows if emb_dim == dim and len(emb) == width * 4]
+        vectors = np.frombuffer(b"".join(emb for _, emb in rows), dtype=np.float32).reshape(-1, width)
+
+        index = IVFIndex(width, model, full_dim=dim)
+        index.build([note_id for note_id, _ in rows], vectors)
+        return index
+
+    def _build_from_snapshot(self, db, user_id: int, model: str):
+        # Snapshot sadece değişen notlar için DB'ye gider; matris process'ler arasında page cache'ten paylaşılır
+        snapshot = vector_snapshot.refresh(db, user_id, model)
+        if snapshot is None:
+            return None
+        width = _coarse_width(snapshot.dim)
+        index = IVFIndex(width, model, full_dim=snapshot.dim)
+        if width == snapshot.dim:
+            index.attach(snapshot.ids, snapshot.vectors)
+        else:
+            index.build(snapshot.ids.tolist(), snapshot.vectors[:, :width])
+        return index
+
+    def _build_quantized(self, db, user_id: int, model: str):
+        # Sadece sıkıştırılmış kolonlar okunur; henüz sıkıştırılmamış notlar float32'den çevrilir
+        dtype = _STORAGE_DTYPES[VECTOR_QUANTIZATION]
+        itemsize = np.dtype(dtype).itemsize
+        column = Notes.embedding_quantized
+        if VECTOR_COARSE_DIM > 0:
+            column = func.substr(Notes.embedding_quantized, 1, VECTOR_COARSE_DIM * itemsize)
+        rows = (
+            db.query(Notes.id, Notes.embedding_dim, column, Notes.embedding_scale)
+            .filter(
+                Notes.user_id.__eq__(user_id),
+                Notes.embedding.__ne__(None),
+                Notes.embedding_model.__eq__(model)
+            )
+            .all()
+        )
+        if not rows:
+            return None
+
+        dim = rows[0][1]
+        width = _coarse_width(dim)
+        ready = [r for r in rows if r[1] == dim and r[2] and len(r[2]) == width * itemsize]
+        missing = [r[0] for r in rows if r[1] == dim and not (r[2] and len(r[2]) == width * itemsize)]
+
+        ids = [r[0] for r in ready]
+        data = np.frombuffer(b"".join(r[2] for r in ready), dtype=dtype).reshape(-1, width)
+        scales = np.array([r[3] or 1.0 for r in ready], dtype=np.float32)
+
+        if missing:
+            legacy = db.query(Notes.id, Notes.embedding).filter(Notes.id.in_(missing)).all()
+            legacy = [(note_id, emb) for note_id, emb in legacy if len(emb) == dim * 4]
+            if legacy:
+                legacy_data, legacy_scales = quantize(
+                    np.frombuffer(b"".join(emb for _, emb in legacy), dtype=np.float32).reshape(-1, dim)[:, :width]
+                )
+                ids += [note_id for note_id, _ in legacy]
+                data = np.concatenate([data, legacy_data])
+                scales = np.concatenate([scales, legacy_scales])
+
+        index = IVFIndex(width, model, full_dim=dim)
+        index.build_encoded(ids, data, scales)
+        return index
+
+    def _current(self, user_id: int, model: str):
+        index = self._touch(user_id)
+        if index is not None and index.model != model:
+            del self._indexes[user_id]
+            return None
+        return index
+
+    def _touch(self, user_id: int):
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+        return index
+
+    def get(self, db, user_id: int):
+        # Kullanıcının geçişi başka bir process'te bitmiş olabilir; eski modelin index'i kullanılmaz
+        model = serving_model(user_id)
+        with self._lock:
+            index = self._current(user_id, model)
+            if index is not None:
+                return index
+            build_lock = self._build_locks.setdefault(user_id, threading.Lock())
+
+        # Kurulum sadece bu kullanıcının kilidini tutar; diğer kullanıcıların aramaları
+        # ve worker'ın upsert'leri DB okuması ve k-means eğitimi boyunca beklemez
+        with build_lock:
+            with self._lock:
+                index = self._current(user_id, model)
+                if index is not None:
+                    return index
+                self._pending[user_id] = []
+            index = None
+            try:
+                index = self._build(db, user_id)
+            finally:
+                with self._lock:
+                    pending = self._pending.pop(user_id, [])
+                    # Kurulum sırasında gelen değişiklikler index yayınlanmadan uygulanır
+                    if index is not None and all(op(index) for op in pending):
+                        self._indexes[user_id] = index
+                        self._evict(keep=user_id)
+            return index
+
+    def _apply(self, user_id: int, op):
+        # op(index) -> False ise index geçersizdir ve atılır
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                if user_id in self._pending:
+                    self._pending[user_id].append(op)
+                return
+        keep = op(index)
+        with self._lock:
+            if not keep:
+                if self._indexes.get(user_id) is index:
+                    del self._indexes[user_id]
+            elif user_id in self._indexes:
+                self._evict(keep=user_id)
+
+    def upsert(self, user_id: int, note_id: int, embedding: bytes, model: str):
+        def op(index):
+            if not embedding or model != index.model:
+                index.remove(note_id)
+                return True
+            vector = np.frombuffer(embedding, dtype=np.float32)
+            if len(vector) != index.full_dim:
+                # Farklı boyutta embedding geldiyse index baştan kurulmalı
+                return False
+            index.add(note_id, vector)
+            return True
+
+        self._apply(user_id, op)
+
+    def remove(self, user_id: int, note_ids: list[int]):
+        def op(index):
+            for note_id in note_ids:
+                index.remove(note_id)
+            return True
+
+        self._apply(user_id, op)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            if user_id in self._pending:
+                self._pending[user_id].append(lambda index: False)
+
+
+class ChunkIndex(IVFIndex):
+    """Parça embedding'leri için IVFIndex; her parçanın hangi nota ait olduğunu da tutar."""
+
+    def __init__(self, dim: int, model: str = None):
+        super().__init__(dim, model, quantization="none")
+        self.owners = {}
+        self.note_chunks = {}
+
+    def add_chunk(self, note_id: int, chunk_id: int, vector: np.ndarray):
+        with self._rw.writing():
+            self._add_chunk(note_id, chunk_id, vector)
+
+    def remove_note(self, note_id: int):
+        with self._rw.writing():
+            self._remove_note(note_id)
+
+    def replace_note(self, note_id: int, chunks: list[tuple[int, np.ndarray]]):
+        # Aramalar notun eski ya da yeni parçalarını görür, yarım hâlini görmez
+        with self._rw.writing():
+            self._remove_note(note_id)
+            for chunk_id, vector in chunks:
+                self._add_chunk(note_id, chunk_id, vector)
+
+    def _add_chunk(self, note_id: int, chunk_id: int, vector: np.ndarray):
+        self._add(chunk_id, vector)
+        self.owners[chunk_id] = note_id
+        self.note_chunks.setdefault(note_id, set()).add(chunk_id)
+
+    def _remove_note(self, note_id: int):
+        for chunk_id in self.note_chunks.pop(note_id, ()):
+            self._remove(chunk_id)
+            self.owners.pop(chunk_id, None)
+
+    def _chunk_ids(self, note_ids) -> list[int]:
+        return [chunk_id for note_id in note_ids for chunk_id in self.note_chunks.get(note_id, ())]
+
+    def _best_per_note(self, hits: list[tuple[int, float]]) -> dict[int, float]:
+        # Not skoru = en benzer parçasının skoru; sonuçlar azalan sırada geldiği için ilk görülen en yüksektir
+        best = {}
+        for chunk_id, score in hits:
+            note_id = self.owners.get(chunk_id)
+            if note_id is not None and note_id not in best:
+                best[note_id] = score
+        return best
+
+    def search_notes(self, query: np.ndarray, k: int, offset: int = 0, nprobe: int = None,
+                     exact: bool = False, allowed=None, excluded=None) -> list[tuple[int, float]]:
+        with self._rw.reading():
+            # Not id filtreleri parça id'lerine çevrilir
+            if allowed is not None:
+                allowed = self._chunk_ids(allowed)
+            if excluded:
+                excluded = self._chunk_ids(excluded)
+            # Bir notun çok sayıda parçası adayları doldurabilir; yeterli farklı not bulunana
+            # ya da index tükenene kadar aday sayısı ikiye katlanır
+            fetch = (offset + k) * VECTOR_RESCORE_FACTOR
+            while True:
+                hits = self._search(query, k=fetch, nprobe=nprobe, exact=exact, allowed=allowed, excluded=excluded)
+                best = self._best_per_note(hits)
+                if len(best) >= offset + k or len(hits) < fetch:
+                    return list(best.items())[offset:offset + k]
+                fetch *= 2
+
+    def search_notes_many(self, queries: np.ndarray, k: int, nprobe: int = None, exact: bool = False,
+                          allowed=None, excluded=None) -> list[list[tuple[int, float]]]:
+        with self._rw.reading():
+            if allowed is not None:
+                allowed = self._chunk_ids(allowed)
+            if excluded:
+                excluded = self._chunk_ids(excluded)
+            # search_notes ile aynı genişletme; sadece k nota ulaşamayan sorgular tekrar aranır
+            queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.full_dim)
+            results = [[] for _ in range(len(queries))]
+            pending = list(range(len(queries)))
+            fetch = k * VECTOR_RESCORE_FACTOR
+            while pending:
+                short = []
+                batch = self._search_many(queries[pending], k=fetch, nprobe=nprobe, exact=exact,
+                                          allowed=allowed, excluded=excluded)
+                for i, hits in zip(pending, batch):
+                    best = self._best_per_note(hits)
+                    results[i] = list(best.items())[:k]
+                    if len(best) < k and len(hits) == fetch:
+                        short.append(i)
+                pending = short
+                fetch *= 2
+            return results
+
+
+class ChunkIndexRegistry(VectorIndexRegistry):
+    """note_chunks tablosundan kurulan kullanıcı başına ChunkIndex'ler."""
+
+    def _build(self, db, user_id: int):
+        model = serving_model(user_id)
+        rows = (
+            db.query(NoteChunks.id, NoteChunks.note_id, NoteChunks.embedding)
+            .filter(
+                NoteChunks.user_id.__eq__(user_id),
+                NoteChunks.embedding.__ne__(None),
+                NoteChunks.embedding_model.__eq__(model)
+            )
+            .all()
+        )
+        if not rows:
+            return None
+
+        dim = len(rows[0][2]) // 4
+        rows = [row for row in rows if len(row[2]) == dim * 4]
+        vectors = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.float32).reshape(-1, dim)
+
+        index = ChunkIndex(dim, model)
+        index.build([row[0] for row in rows], vectors)
+        for chunk_id, note_id, _ in rows:
+            index.owners[chunk_id] = note_id
+            index.note_chunks.setdefault(note_id, set()).add(chunk_id)
+        return index
+
+    def replace_note(self, user_id: int, note_id: int, chunks: list[tuple[int, bytes]], model: str):
+        def op(index):
+            if model != index.model:
+                index.remove_note(note_id)
+                return True
+            vectors = [(chunk_id, np.frombuffer(embedding, dtype=np.float32)) for chunk_id, embedding in chunks]
+            if any(len(vector) != index.dim for _, vector in vectors):
+                return False
+            index.replace_note(note_id, vectors)
+            return True
+
+        self._apply(user_id, op)
+
+    def remove(self, user_id: int, note_ids: list[int]):
+        def op(index):
+            for note_id in note_ids:
+                index.remove_note(note_id)
+            return True
+
+        self._apply(user_id, op)
+
+
+vector_indexes = VectorIndexRegistry()
+chunk_indexes = ChunkIndexRegistry()
+
+
+def forget_notes(user_id: int, note_ids: list[int]):
+    # Silinen notlar hem not hem parça index'inden çıkarılır
+    vector_indexes.remove(user_id, note_ids)
+    chunk_indexes.remove(user_id, note_ids)
+
+
+def rescore(db, candidates: list[tuple[int, float]], query: np.ndarray, k: int,
+            offset: int = 0) -> list[tuple[int, float]]:
+    # Kaba taramadan gelen adayların float32 embedding'leri ile tam benzerlik hesabı
+    if not candidates:
+        return []
+    rows = db.query(Notes.id, Notes.embedding).filter(Notes.id.in_([note_id for note_id, _ in candidates])).all()
+    rows = [(note_id, emb) for note_id, emb in rows if emb and len(emb) == len(query) * 4]
+    if not rows:
+        return []
+
+    matrix = normalize(np.frombuffer(b"".join(emb for _, emb in rows), dtype=np.float32).reshape(len(rows), -1))
+    scores = matrix @ normalize(np.asarray(query, dtype=np.float32))
+    order = top_k(scores, offset + k)[offset:]
+    return [(int(rows[i][0]), float(scores[i])) for i in order]
+
+
+def rescore_many(db, candidates: list[list[tuple[int, float]]], queries: np.ndarray,
+                 k: int) -> list[list[tuple[int, float]]]:
+    # Tüm sorguların adayları tek sorguda okunur ve tek çarpımla puanlanır
+    note_ids = {note_id for hits in candidates for note_id, _ in hits}
+    if not note_ids:
+        return [[] for _ in candidates]
+    queries = normalize(np.asarray(queries, dtype=np.float32))
+    rows = db.query(Notes.id, Notes.embedding).filter(Notes.id.in_(note_ids)).all()
+    rows = [(note_id, emb) for note_id, emb in rows if emb and len(emb) == queries.shape[1] * 4]
+    if not rows:
+        return [[] for _ in candidates]
+
+    position = {note_id: i for i, (note_id, _) in enumerate(rows)}
+    matrix = normalize(np.frombuffer(b"".join(emb for _, emb in rows), dtype=np.float32).reshape(len(rows), -1))
+    scores = matrix @ queries.T
+
+    results = []
+    for column, hits in enumerate(candidates):
+        positions = np.array([position[note_id] for note_id, _ in hits if note_id in position], dtype=np.int64)
+        if len(positions) == 0:
+            results.append([])
+            continue
+        column_scores = scores[positions, column]
+        order = top_k(column_scores, k)
+        results.append([(int(rows[positions[i]][0]), float(column_scores[i])) for i in order])
+    return results
+
+
+def search_index(db, index: IVFIndex, query: np.ndarray, k: int, offset: int = 0, nprobe: int = None,
+                 exact: bool = False, allowed=None, excluded=None) -> list[tuple[int, float]]:
+    if not index.needs_rescore:
+        return index.search(query, k=k, offset=offset, nprobe=nprobe, exact=exact,
+                            allowed=allowed, excluded=excluded)
+    candidates = index.search(query, k=(offset + k) * VECTOR_RESCORE_FACTOR, nprobe=nprobe, exact=exact,
+                              allowed=allowed, excluded=excluded)
+    return rescore(db, candidates, query, k=k, offset=offset)
+
+
+def search_chunks(index: ChunkIndex, query: np.ndarray, k: int, offset: int = 0, nprobe: int = None,
+                  exact: bool = False, allowed=None, excluded=None) -> list[tuple[int, float]]:
+    return index.search_notes(query, k=k, offset=offset, nprobe=nprobe, exact=exact,
+                              allowed=allowed, excluded=excluded)
+
+
+def search_index_many(db, index: IVFIndex, queries: np.ndarray, k: int, nprobe: int = None,
+                      exact: bool = False, allowed=None, excluded=None) -> list[list[tuple[int, float]]]:
+    if not index.needs_rescore:
+        return index.search_many(queries, k=k, nprobe=nprobe, exact=exact, allowed=allowed, excluded=excluded)
+    candidates = index.search_many(queries, k=k * VECTOR_RESCORE_FACTOR, nprobe=nprobe, exact=exact,
+                                   allowed=allowed, excluded=excluded)
+    return rescore_many(db, candidates, queries, k=k)
+
+
+def search_chunks_many(index: ChunkIndex, queries: np.ndarray, k: int, nprobe: int = None,
+                       exact: bool = False, allowed=None, excluded=None) -> list[list[tuple[int, float]]]:
+    return index.search_notes_many(queries, k=k, nprobe=nprobe, exact=exact, allowed=allowed, excluded=excluded)
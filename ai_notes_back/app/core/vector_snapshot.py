@@ -0,0 +1,180 @@
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.core.model import Notes
+
+load_dotenv()
+
+# Boş değilse kullanıcı başına embedding matrisleri bu dizinde saklanır ve mmap ile açılır
+VECTOR_SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR", "")
+# Eski snapshot dosyaları en az bu kadar saniye sonra silinir (başka process hâlâ açıyor olabilir)
+VECTOR_SNAPSHOT_RETENTION = int(os.getenv("VECTOR_SNAPSHOT_RETENTION", "60"))
+# Değişen embedding blob'ları bu kadarlık IN sorgularıyla okunur
+_FETCH_CHUNK = 1000
+
+_SLUG_RE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class Snapshot:
+    """Diskteki bir snapshot'ın salt okunur görünümü.
+
+    Dosya düzeni: n adet int64 not id'si, ardından n x dim float32
+    normalize edilmiş satır. Veri dosyaları hiç değiştirilmez; güncel
+    dosyayı gösteren küçük pointer dosyası atomik olarak yenilenir.
+    """
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray, model: str, synced_at: datetime | None):
+        self.ids = ids
+        self.vectors = vectors
+        self.model = model
+        self.synced_at = synced_at
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+
+def is_enabled() -> bool:
+    return bool(VECTOR_SNAPSHOT_DIR)
+
+
+def _utc(value: datetime | None) -> datetime | None:
+    # SQLite naive, Postgres aware datetime döner; karşılaştırma için naive UTC'ye çevrilir
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _user_dir(user_id: int) -> str:
+    return os.path.join(VECTOR_SNAPSHOT_DIR, str(user_id))
+
+
+def _pointer_path(user_id: int, model: str) -> str:
+    return os.path.join(_user_dir(user_id), f"{_SLUG_RE.sub('_', model)}.json")
+
+
+def read(user_id: int, model: str) -> Snapshot | None:
+    try:
+        with open(_pointer_path(user_id, model)) as f:
+            pointer = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    count, dim = pointer["count"], pointer["dim"]
+    synced_at = datetime.fromisoformat(pointer["synced_at"]) if pointer.get("synced_at") else None
+    if count == 0:
+        return Snapshot(np.empty(0, dtype=np.int64), np.empty((0, dim), dtype=np.float32), model, synced_at)
+
+    path = os.path.join(_user_dir(user_id), pointer["file"])
+    try:
+        ids = np.memmap(path, dtype=np.int64, mode="r", shape=(count,))
+        vectors = np.memmap(path, dtype=np.float32, mode="r", offset=count * 8, shape=(count, dim))
+    except (OSError, ValueError):
+        return None
+    return Snapshot(ids, vectors, model, synced_at)
+
+
+def write(user_id: int, model: str, ids: np.ndarray, vectors: np.ndarray, synced_at: datetime | None) -> Snapshot:
+    directory = _user_dir(user_id)
+    os.makedirs(directory, exist_ok=True)
+    slug = _SLUG_RE.sub("_", model)
+    name = f"{slug}.{uuid.uuid4().hex}.bin"
+    path = os.path.join(directory, name)
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+        f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+    os.replace(path + ".tmp", path)
+
+    pointer = {
+        "file": name,
+        "model": model,
+        "count": int(len(ids)),
+        "dim": int(vectors.shape[1]),
+        "synced_at": synced_at.isoformat() if synced_at else None
+    }
+    pointer_path = _pointer_path(user_id, model)
+    with open(pointer_path + ".tmp", "w") as f:
+        json.dump(pointer, f)
+    os.replace(pointer_path + ".tmp", pointer_path)
+
+    # Açık mmap'ler silinen dosyayı görmeye devam eder; yeni yazılmış ama henüz işaret edilmemiş
+    # dosyaları silmemek için sadece yeterince eski olanlar temizlenir
+    cutoff = time.time() - VECTOR_SNAPSHOT_RETENTION
+    for entry in os.scandir(directory):
+        if entry.name.startswith(f"{slug}.") and entry.name.endswith(".bin") and entry.name != name:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    return read(user_id, model)
+
+
+def refresh(db, user_id: int, model: str) -> Snapshot | None:
+    """Kullanıcının snapshot'ını veritabanıyla eşitler ve mmap'lenmiş halini döner.
+
+    Sadece id ve embedding_updated_at okunur; blob'lar yalnızca snapshot'tan
+    sonra embedding'i değişen notlar için çekilir. Başlık gibi alanların
+    düzenlenmesi (updated_at) yeniden okuma gerektirmez. Silinen notların satırları düşülür.
+    """
+    rows = db.query(Notes.id, Notes.embedding_updated_at, Notes.embedding_dim).filter(
+        Notes.user_id.__eq__(user_id),
+        Notes.embedding.__ne__(None),
+        Notes.embedding_model.__eq__(model)
+    ).all()
+    if not rows:
+        return None
+
+    dim = rows[0][2]
+    live = {note_id: _utc(embedded_at) for note_id, embedded_at, emb_dim in rows if emb_dim == dim}
+    current = read(user_id, model)
+    if current is not None and current.dim != dim:
+        current = None
+
+    known = set(current.ids.tolist()) if current is not None else set()
+    if current is None:
+        changed = list(live)
+    else:
+        changed = [
+            note_id for note_id, embedded_at in live.items()
+            if note_id not in known or (embedded_at is not None and current.synced_at is not None
+                                        and embedded_at >= current.synced_at)
+        ]
+    removed = known - set(live)
+    if current is not None and not changed and not removed:
+        return current
+
+    fetched = {}
+    for start in range(0, len(changed), _FETCH_CHUNK):
+        for note_id, embedding in db.query(Notes.id, Notes.embedding).filter(
+            Notes.id.in_(changed[start:start + _FETCH_CHUNK])
+        ).all():
+            if embedding and len(embedding) == dim * 4:
+                fetched[note_id] = embedding
+
+    if current is not None and len(current.ids):
+        keep = ~np.isin(current.ids, np.array(list(removed | set(fetched)), dtype=np.int64))
+        ids = [np.asarray(current.ids[keep])]
+        vectors = [np.asarray(current.vectors[keep])]
+    else:
+        ids, vectors = [], []
+    if fetched:
+        ids.append(np.array(list(fetched), dtype=np.int64))
+        matrix = np.frombuffer(b"".join(fetched.values()), dtype=np.float32).reshape(-1, dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors.append(matrix / norms)
+
+    ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+    vectors = np.concatenate(vectors) if vectors else np.empty((0, dim), dtype=np.float32)
+    timestamps = [embedded_at for embedded_at in live.values() if embedded_at is not None]
+    return write(user_id, model, ids, vectors, max(timestamps) if timestamps else None)
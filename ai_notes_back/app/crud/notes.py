@@ -2,19 +2,32 @@ from typing import Annotated
 
 from fastapi import APIRouter,Depends,HTTPException,Query,status,Response,Body, File, UploadFile
 from fastapi.responses import StreamingResponse
-from app.api.embedding import get_embedding
-from app.api.summary import generate_summary
-
-from app.core.model import Notes,Tag,NoteVersions
-from app.core.database import get_db, SessionLocal
-from sqlalchemy.orm import Session
-
-from app.core.schemes import NoteRequest,UpdateNotesRequest,IdsSchema,SummaryResponse
+from starlette.concurrency import run_in_threadpool
+from app.api.embedding import get_embedding, get_embeddings
+from app.core.embedding_queue import embedding_queue
+from app.api.summary import stream_summary
+from app.api.llm_client import LLMUnavailable
+
+from app.core.model import Notes,Tag,NoteVersions,NoteDuplicates,NoteTopics,NoteTopicAssignments
+from app.core.database import get_db, get_async_db, SessionLocal
+from app.core.vector_index import vector_indexes, chunk_indexes, search_index, search_chunks, search_index_many, search_chunks_many, forget_notes
+from app.core.chunking import NOTE_CHUNKING
+from app.core import pgvector_store, fulltext, related, dedup, topics, ai_cache
+from app.core.dedup import DUPLICATE_DETECTION
+from app.core.related import RELATED_NOTES_K
+from app.core.fulltext import HYBRID_CANDIDATE_FACTOR, HYBRID_SHORT_QUERY_TERMS
+from app.core.embedding_registry import serving_model, serving_provider
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.schemes import NoteRequest,UpdateNotesRequest,IdsSchema,SummaryResponse,EmbeddingStatusEnum,PriorityEnum,BatchSearchRequest
 
 from app.crud.users import get_current_user
 from datetime import datetime, timezone ,timedelta
 
 import numpy as np
+import functools
 import io
 import json
 
@@ -31,8 +44,8 @@ router = APIRouter(
 user_dependency = Annotated[dict,Depends(get_current_user)]
 
 @router.get("/notes/get-all-notes/")
-async def get_all_notes(dependency:user_dependency,db:Session=Depends(get_db)):
-    db_notes = db.query(Notes).filter(Notes.user_id.__eq__(dependency.get("id"))).all()
+async def get_all_notes(dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    db_notes = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.user_id.__eq__(dependency.get("id"))))).scalars().all()
     if not db_notes:
         return {
             "notes" : []
@@ -58,8 +71,8 @@ async def get_all_notes(dependency:user_dependency,db:Session=Depends(get_db)):
     return notes_list
 
 @router.get("/notes/get-note-by-id/{note_id}")
-async def get_note_by_id(note_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
-    db_note = db.query(Notes).filter(Notes.id.__eq__(note_id) and Notes.user_id.__eq__(dependency.get("id"))).first()
+async def get_note_by_id(note_id:int,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    db_note = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))))).scalars().first()
     if not db_note:
         raise HTTPException(404,detail="Note not found!")
 
@@ -75,13 +88,14 @@ async def get_note_by_id(note_id:int,dependency:user_dependency,db:Session=Depen
     }
 
 @router.delete("/notes/delete/{note_id}")
-async def delete_note(note_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
-    db_note = db.query(Notes).filter(Notes.id.__eq__(note_id) and Notes.user_id.__eq__(dependency.get("id"))).first()
+def delete_note(note_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
+    db_note = db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))).first()
     if not db_note:
         raise HTTPException(404,detail="Note not found!")
 
     db.delete(db_note)
     db.commit()
+    forget_notes(db_note.user_id, [db_note.id])
     return{
         "id": db_note.id,
         "title": db_note.title,
@@ -93,11 +107,18 @@ async def delete_note(note_id:int,dependency:user_dependency,db:Session=Depends(
     }
 
 @router.post("/notes/create-note/")
-async def create_note(dependency: user_dependency, note_request: NoteRequest, db: Session = Depends(get_db)):
+def create_note(dependency: user_dependency, note_request: NoteRequest, db: Session = Depends(get_db)):
     if dependency is None:
         raise HTTPException(401, detail="Not Authenticated!")
 
-    embedding_byte = get_embedding(note_request.content)
+    # Near-duplicate kontrolü LSH kovaları üzerinden, tag'ler oluşturulmadan önce yapılır
+    signature = dedup.signature(note_request.content)
+    duplicates = dedup.find_duplicates(db, dependency.get("id"), signature)
+    if duplicates and DUPLICATE_DETECTION == "reject":
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "A near-duplicate note already exists.", "duplicates": [note_id for note_id, _ in duplicates]}
+        )
 
     note_tags = []
     for tag_name in note_request.tags:
@@ -115,17 +136,23 @@ async def create_note(dependency: user_dependency, note_request: NoteRequest, db
         title=note_request.title,
         content=note_request.content,
         tags=note_tags,
-        embedding=embedding_byte,
         user_id=dependency.get("id"),
         is_feature_note=note_request.is_feature_note,
         priority = note_request.priority,
         feature_date=feature_date
     )
+    fulltext.assign_search_vector(db_notes)
+    needs_embedding = embedding_queue.schedule(db, db_notes)
 
     db.add(db_notes)
+    db.flush()
+    dedup.index_note(db, db_notes, signature)
     db.commit()
     db.refresh(db_notes)
-
+    if needs_embedding:
+        embedding_queue.enqueue([db_notes.id])
+    else:
+        vector_indexes.upsert(db_notes.user_id, db_notes.id, db_notes.embedding, db_notes.embedding_model)
 
     return {
             "id": db_notes.id,
@@ -140,12 +167,14 @@ async def create_note(dependency: user_dependency, note_request: NoteRequest, db
             "favorite":db_notes.favorite,
             "is_feature_note":db_notes.is_feature_note,
             "feature_date":db_notes.feature_date,
-            "priority":db_notes.priority
+            "priority":db_notes.priority,
+            "embedding_status":db_notes.embedding_status,
+            "duplicates":[{"id": note_id, "similarity": sim} for note_id, sim in duplicates]
         }
 
 
 @router.patch("/notes/update-note/{note_id}")
-async def update_notes_with_id_by_creator(
+def update_notes_with_id_by_creator(
     note_id: int,
     dependency: user_dependency,
     update_body: UpdateNotesRequest,
@@ -190,6 +219,10 @@ async def update_notes_with_id_by_creator(
     db_note.title = update_body.title
     db_note.content = update_body.content
     db_note.priority = update_body.priority
+    # İçerik değiştiyse embedding arka planda yenilenir
+    fulltext.assign_search_vector(db_note)
+    needs_embedding = embedding_queue.schedule(db, db_note)
+    dedup.index_note(db, db_note)
 
     # 5) Tag güncelleme
     if update_body.tags is not None:
@@ -215,6 +248,10 @@ async def update_notes_with_id_by_creator(
 
     db.commit()
     db.refresh(db_note)
+    if needs_embedding:
+        embedding_queue.enqueue([db_note.id])
+    else:
+        vector_indexes.upsert(db_note.user_id, db_note.id, db_note.embedding, db_note.embedding_model)
 
     # 6) Response
     return {
@@ -234,34 +271,144 @@ async def update_notes_with_id_by_creator(
 
 
 
+def _search_conditions(tag_ids, created_from, created_to, updated_from, updated_to,
+                       priority, is_archived, favorite, is_feature_note) -> list:
+    conditions = []
+    if tag_ids:
+        conditions.append(Notes.tags.any(Tag.id.in_(tag_ids)))
+    if created_from is not None:
+        conditions.append(Notes.created_at >= created_from)
+    if created_to is not None:
+        conditions.append(Notes.created_at <= created_to)
+    if updated_from is not None:
+        conditions.append(Notes.updated_at >= updated_from)
+    if updated_to is not None:
+        conditions.append(Notes.updated_at <= updated_to)
+    if priority is not None:
+        conditions.append(Notes.priority.__eq__(priority))
+    if is_archived is not None:
+        conditions.append(Notes.is_archived.__eq__(is_archived))
+    if favorite is not None:
+        conditions.append(Notes.favorite.__eq__(favorite))
+    if is_feature_note is not None:
+        conditions.append(Notes.is_feature_note.__eq__(is_feature_note))
+    return conditions
+
+
+def _semantic_hits(db, user_id: int, query: str, k: int, offset: int, nprobe, exact: bool,
+                   conditions: list, include_deleted: bool):
+    # Kullanıcının index'i yoksa None döner
+    conditions = list(conditions)
+    if pgvector_store.is_enabled():
+        if not include_deleted:
+            conditions.append(Notes.deleted_at.__eq__(None))
+        query_array = np.frombuffer(get_embedding(query, provider=serving_provider(user_id)), dtype=np.float32)
+        return pgvector_store.search(
+            db, user_id, serving_model(user_id), query_array,
+            k=k, offset=offset, effort=nprobe, exact=exact, conditions=conditions
+        )
+
+    # Filtreler SQL'de uygulanır, index sadece eşleşen id'leri puanlar.
+    # Filtre yoksa sadece (genelde az sayıdaki) soft-delete edilmiş notlar dışlanır.
+    allowed, excluded = None, None
+    if conditions:
+        if not include_deleted:
+            conditions.append(Notes.deleted_at.__eq__(None))
+        allowed = {note_id for note_id, in db.query(Notes.id).filter(
+            Notes.user_id.__eq__(user_id), *conditions
+        ).all()}
+        if not allowed:
+            return []
+    elif not include_deleted:
+        excluded = {note_id for note_id, in db.query(Notes.id).filter(
+            Notes.user_id.__eq__(user_id), Notes.deleted_at.__ne__(None)
+        ).all()}
+
+    registry = chunk_indexes if NOTE_CHUNKING else vector_indexes
+    index = registry.get(db, user_id)
+    if index is None:
+        return None
+
+    query_array = np.frombuffer(get_embedding(query, provider=serving_provider(user_id)), dtype=np.float32)
+    if len(query_array) != index.full_dim:
+        raise HTTPException(status_code=400, detail="Query embedding dimension does not match stored notes.")
+
+    search = search_chunks if NOTE_CHUNKING else functools.partial(search_index, db)
+    return search(index, query_array, k=k, offset=offset, nprobe=nprobe, exact=exact,
+                  allowed=allowed, excluded=excluded)
+
+
 @router.get("/notes/search/")
-async def semantic_search(
+def semantic_search(
         query: str = Query(..., description="The note content you want to search"),
+        limit: int = Query(20, ge=1, le=200, description="Number of notes to return"),
+        offset: int = Query(0, ge=0, description="Number of top results to skip"),
+        mode: str = Query("semantic", regex="^(semantic|keyword|hybrid)$", description="semantic (embeddings), keyword (full-text) or hybrid (rank fusion of both)"),
+        nprobe: int | None = Query(None, ge=1, description="IVF lists (or pgvector ef_search/probes) to scan; higher is slower but more accurate"),
+        exact: bool = Query(False, description="Skip the ANN index and scan every note"),
+        tag_ids: list[int] | None = Query(None, description="Only notes having any of these tags"),
+        created_from: datetime | None = Query(None),
+        created_to: datetime | None = Query(None),
+        updated_from: datetime | None = Query(None),
+        updated_to: datetime | None = Query(None),
+        priority: PriorityEnum | None = Query(None),
+        is_archived: bool | None = Query(None),
+        favorite: bool | None = Query(None),
+        is_feature_note: bool | None = Query(None),
+        include_deleted: bool = Query(False, description="Include soft-deleted notes"),
         dependency=Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
     if dependency is None:
         raise HTTPException(401, detail="Not Authenticated!")
 
-    query_embedding = get_embedding(query)
-    query_array = np.frombuffer(query_embedding, dtype=np.float32)
+    user_id = dependency.get("id")
 
-    db_notes = db.query(Notes).filter(Notes.user_id.__eq__(dependency.get("id"))).all()
-    if not db_notes:
-        raise HTTPException(status_code=404, detail="No notes found!")
-
-    results = []
-    for note in db_notes:
-        if note.embedding:
-            note_array = np.frombuffer(note.embedding, dtype=np.float32)
-            # Cosine similarity
-            sim = float(np.dot(query_array, note_array) / (np.linalg.norm(query_array) * np.linalg.norm(note_array)))
-            results.append((sim, note))
+    # Embedding'i henüz hazır olmayan notlar aramaya girmez, kuyruğa alınır
+    pending = db.query(Notes.id).filter(
+        Notes.user_id.__eq__(user_id),
+        Notes.embedding_status.__eq__(EmbeddingStatusEnum.PENDING.value)
+    ).all()
+    if pending:
+        embedding_queue.enqueue([note_id for note_id, in pending])
 
-    results.sort(reverse=True, key=lambda x: x[0])
+    conditions = _search_conditions(
+        tag_ids, created_from, created_to, updated_from, updated_to,
+        priority, is_archived, favorite, is_feature_note
+    )
+    keyword_conditions = conditions if include_deleted else conditions + [Notes.deleted_at.__eq__(None)]
+
+    if mode == "keyword":
+        hits = fulltext.search(db, user_id, query, k=limit, offset=offset, conditions=keyword_conditions)
+    elif mode == "hybrid":
+        depth = (offset + limit) * HYBRID_CANDIDATE_FACTOR
+        keyword_hits = fulltext.search(db, user_id, query, k=depth, conditions=keyword_conditions)
+        if len(fulltext.query_terms(query)) <= HYBRID_SHORT_QUERY_TERMS and len(keyword_hits) >= offset + limit:
+            # Kısa sorgu keyword eşleşmeleriyle sayfayı dolduruyorsa embedding çağrısı yapılmaz
+            semantic_hits = []
+        else:
+            semantic_hits = _semantic_hits(db, user_id, query, depth, 0, nprobe, exact, conditions, include_deleted) or []
+        hits = fulltext.reciprocal_rank_fusion(keyword_hits, semantic_hits)[offset:offset + limit]
+    else:
+        hits = _semantic_hits(db, user_id, query, limit, offset, nprobe, exact, conditions, include_deleted)
+        if hits is None:
+            raise HTTPException(status_code=404, detail="No notes found!")
+
+    if not hits:
+        return []
+
+    notes_by_id = {
+        note.id: note
+        for note in db.query(Notes).filter(Notes.id.in_([note_id for note_id, _ in hits])).all()
+    }
 
+    # semantic: cosine benzerliği, keyword: ts_rank, hybrid: RRF skoru
+    score_field = {"semantic": "similarity", "keyword": "rank", "hybrid": "score"}[mode]
     response = []
-    for sim, note in results:
+    for note_id, score in hits:
+        note = notes_by_id.get(note_id)
+        if note is None:
+            continue
         response.append({
             "id": note.id,
             "title": note.title,
@@ -270,19 +417,232 @@ async def semantic_search(
             "created_at": note.created_at,
             "updated_at": note.updated_at,
             "is_active": note.is_active,
+            score_field: score
+        })
+
+    return response
+
+@router.post("/notes/search/batch/")
+def batch_semantic_search(
+        dependency: user_dependency,
+        request: BatchSearchRequest,
+        db: Session = Depends(get_db)
+):
+    if dependency is None:
+        raise HTTPException(401, detail="Not Authenticated!")
+
+    if any(not query.strip() for query in request.queries):
+        raise HTTPException(status_code=400, detail="Queries must not be empty.")
+
+    user_id = dependency.get("id")
+    # Tüm sorgular tek provider çağrısıyla embed edilir
+    query_matrix = np.stack([
+        np.frombuffer(emb, dtype=np.float32)
+        for emb in get_embeddings(request.queries, provider=serving_provider(user_id))
+    ])
+
+    if pgvector_store.is_enabled():
+        # kNN Postgres'te çalıştığı için sorgular tek tek gönderilir, embedding yine tek çağrıdır
+        conditions = [] if request.include_deleted else [Notes.deleted_at.__eq__(None)]
+        results = [
+            pgvector_store.search(db, user_id, serving_model(user_id), query_array, k=request.limit,
+                                  effort=request.nprobe, exact=request.exact, conditions=conditions)
+            for query_array in query_matrix
+        ]
+    else:
+        registry = chunk_indexes if NOTE_CHUNKING else vector_indexes
+        index = registry.get(db, user_id)
+        if index is None:
+            raise HTTPException(status_code=404, detail="No notes found!")
+        if query_matrix.shape[1] != index.full_dim:
+            raise HTTPException(status_code=400, detail="Query embedding dimension does not match stored notes.")
+
+        excluded = None
+        if not request.include_deleted:
+            excluded = {note_id for note_id, in db.query(Notes.id).filter(
+                Notes.user_id.__eq__(user_id), Notes.deleted_at.__ne__(None)
+            ).all()}
+
+        search = search_chunks_many if NOTE_CHUNKING else functools.partial(search_index_many, db)
+        results = search(index, query_matrix, k=request.limit, nprobe=request.nprobe, exact=request.exact,
+                         excluded=excluded)
+
+    note_ids = {note_id for hits in results for note_id, _ in hits}
+    notes_by_id = {
+        note.id: note
+        for note in db.query(Notes).filter(Notes.id.in_(note_ids)).all()
+    } if note_ids else {}
+
+    response = []
+    for query, hits in zip(request.queries, results):
+        response.append({
+            "query": query,
+            "results": [
+                {
+                    "id": note_id,
+                    "title": notes_by_id[note_id].title,
+                    "content": notes_by_id[note_id].content,
+                    "tags": [{"id": tag.id, "name": tag.name} for tag in notes_by_id[note_id].tags],
+                    "created_at": notes_by_id[note_id].created_at,
+                    "updated_at": notes_by_id[note_id].updated_at,
+                    "is_active": notes_by_id[note_id].is_active,
+                    "similarity": sim
+                }
+                for note_id, sim in hits if note_id in notes_by_id
+            ]
+        })
+
+    return response
+
+@router.get("/notes/{note_id}/related")
+def get_related_notes(
+        note_id: int,
+        dependency: user_dependency,
+        limit: int = Query(RELATED_NOTES_K, ge=1, le=RELATED_NOTES_K, description="Number of related notes to return"),
+        db: Session = Depends(get_db)
+):
+    note = db.query(Notes).filter(Notes.id.__eq__(note_id), Notes.user_id.__eq__(dependency.get("id"))).first()
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+
+    # Komşular önceden hesaplanmış grafikten okunur
+    hits = related.get_related(db, note, limit)
+    if not hits:
+        return []
+
+    notes_by_id = {
+        neighbor.id: neighbor
+        for neighbor in db.query(Notes).filter(
+            Notes.id.in_([neighbor_id for neighbor_id, _ in hits]),
+            Notes.deleted_at.__eq__(None)
+        ).all()
+    }
+
+    response = []
+    for neighbor_id, sim in hits:
+        neighbor = notes_by_id.get(neighbor_id)
+        if neighbor is None:
+            continue
+        response.append({
+            "id": neighbor.id,
+            "title": neighbor.title,
+            "content": neighbor.content,
+            "tags": [{"id": tag.id, "name": tag.name} for tag in neighbor.tags],
+            "created_at": neighbor.created_at,
+            "updated_at": neighbor.updated_at,
+            "is_active": neighbor.is_active,
             "similarity": sim
         })
 
     return response
 
+@router.get("/notes/duplicates")
+def get_duplicate_notes(
+        dependency: user_dependency,
+        refresh: bool = Query(False, description="Recompute the report now instead of serving the last batch run"),
+        db: Session = Depends(get_db)
+):
+    if refresh:
+        dedup.rebuild_user(db, dependency.get("id"))
+
+    pairs = db.query(NoteDuplicates).filter(NoteDuplicates.user_id.__eq__(dependency.get("id"))).all()
+    if not pairs:
+        return []
+
+    # Çiftler union-find ile gruplara birleştirilir
+    parent = {}
+
+    def find(note_id):
+        parent.setdefault(note_id, note_id)
+        while parent[note_id] != note_id:
+            parent[note_id] = parent[parent[note_id]]
+            note_id = parent[note_id]
+        return note_id
+
+    for pair in pairs:
+        parent[find(pair.note_id)] = find(pair.duplicate_id)
+
+    notes_by_id = {
+        note.id: note
+        for note in db.query(Notes).filter(Notes.id.in_(list(parent)), Notes.deleted_at.__eq__(None)).all()
+    }
+    groups = {}
+    for pair in pairs:
+        if pair.note_id in notes_by_id and pair.duplicate_id in notes_by_id:
+            groups.setdefault(find(pair.note_id), []).append(pair)
+
+    response = []
+    for group in groups.values():
+        note_ids = sorted({note_id for pair in group for note_id in (pair.note_id, pair.duplicate_id)})
+        response.append({
+            "notes": [
+                {
+                    "id": note_id,
+                    "title": notes_by_id[note_id].title,
+                    "created_at": notes_by_id[note_id].created_at,
+                    "updated_at": notes_by_id[note_id].updated_at
+                }
+                for note_id in note_ids
+            ],
+            "pairs": [
+                {"note_id": pair.note_id, "duplicate_id": pair.duplicate_id, "similarity": pair.similarity}
+                for pair in group
+            ]
+        })
+
+    return response
+
+@router.get("/notes/topics")
+def get_note_topics(
+        dependency: user_dependency,
+        notes_per_topic: int = Query(5, ge=0, le=100, description="Most central notes to include per topic"),
+        refresh: bool = Query(False, description="Recluster now instead of serving the stored topics"),
+        db: Session = Depends(get_db)
+):
+    if refresh:
+        topics.rebuild_user(db, dependency.get("id"))
+
+    # Konular ve atamalar tablodan okunur, istek başına kümeleme yapılmaz
+    user_topics = db.query(NoteTopics).filter(
+        NoteTopics.user_id.__eq__(dependency.get("id")),
+        NoteTopics.size > 0
+    ).order_by(NoteTopics.size.desc()).all()
+    if not user_topics:
+        return []
+
+    members = {}
+    if notes_per_topic:
+        rows = (
+            db.query(NoteTopicAssignments.topic_id, Notes.id, Notes.title, NoteTopicAssignments.similarity)
+            .join(Notes, Notes.id.__eq__(NoteTopicAssignments.note_id))
+            .filter(NoteTopicAssignments.user_id.__eq__(dependency.get("id")), Notes.deleted_at.__eq__(None))
+            .order_by(NoteTopicAssignments.topic_id, NoteTopicAssignments.similarity.desc())
+            .all()
+        )
+        for topic_id, note_id, title, sim in rows:
+            topic_notes = members.setdefault(topic_id, [])
+            if len(topic_notes) < notes_per_topic:
+                topic_notes.append({"id": note_id, "title": title, "similarity": sim})
+
+    return [
+        {
+            "id": topic.id,
+            "label": topic.label,
+            "size": topic.size,
+            "updated_at": topic.updated_at,
+            "notes": members.get(topic.id, [])
+        }
+        for topic in user_topics
+    ]
+
 @router.put("/notes/status-active-passive/{note_id}")
-async def note_status_change_to_favorite_wih_is_active_field(is_active:bool,note_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
-    db_note = db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))).first()
+async def note_status_change_to_favorite_wih_is_active_field(is_active:bool,note_id:int,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    db_note = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))))).scalars().first()
     if not db_note:
         raise HTTPException(status_code=404,detail="Note not found")
     db_note.is_active = is_active
     db.add(db_note)
-    db.commit()
+    await db.commit()
     return {
         "id": db_note.id,
         "title": db_note.title,
@@ -294,13 +654,13 @@ async def note_status_change_to_favorite_wih_is_active_field(is_active:bool,note
     }
 
 @router.put("/notes/add-to-favorite/{note_id}")
-async def note_adding_into_favorite_by_user(favorite:bool,dependency:user_dependency,note_id:int,db:Session=Depends(get_db)):
-    db_note = db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))).first()
+async def note_adding_into_favorite_by_user(favorite:bool,dependency:user_dependency,note_id:int,db:AsyncSession=Depends(get_async_db)):
+    db_note = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))))).scalars().first()
     if not db_note:
         raise HTTPException(404,detail="Note not found!")
     db_note.favorite = favorite
     db.add(db_note)
-    db.commit()
+    await db.commit()
     return {
         "id": db_note.id,
         "title": db_note.title,
@@ -313,7 +673,7 @@ async def note_adding_into_favorite_by_user(favorite:bool,dependency:user_depend
     }
 
 @router.delete("/notes/delete-selected-notes")
-async def delete_selected_notes_by_notes_id_dependency(
+def delete_selected_notes_by_notes_id_dependency(
     dependency: user_dependency,
     ids: IdsSchema = Body(...),  # Body ile Swagger uyumu
     db: Session = Depends(get_db)
@@ -336,6 +696,7 @@ async def delete_selected_notes_by_notes_id_dependency(
         db.delete(note)    # notu sil
 
     db.commit()
+    forget_notes(dependency.get("id"), [note.id for note in notes_to_delete])
     return {"message": "Selected notes deleted by user."}
 
 
@@ -363,6 +724,8 @@ def delete_old_soft_deleted_notes():
         for note in old_notes:
             db.delete(note)
         db.commit()
+        for note in old_notes:
+            forget_notes(note.user_id, [note.id])
         print(f"{len(old_notes)} old soft deleted notes removed.")
     finally:
         db.close()
@@ -389,20 +752,20 @@ def soft_delete_multiple_notes(dependency: user_dependency, payload: IdsSchema,
     }
 
 @router.get("/notes/get-favorites")
-async def get_favorite_notes_usr_(dependency:user_dependency,db:Session=Depends(get_db)):
-    favorite_notes = db.query(Notes).filter(Notes.favorite.__eq__(True),Notes.user_id.__eq__(dependency.get("id"))).all()
+async def get_favorite_notes_usr_(dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    favorite_notes = (await db.execute(select(Notes).where(Notes.favorite.__eq__(True),Notes.user_id.__eq__(dependency.get("id"))))).scalars().all()
     if not favorite_notes:
         raise HTTPException(status_code=404,detail="There is no any favorite notes here.")
     return favorite_notes
 
 @router.put("/notes/archive/{note_id}")
-async def change_status_to_archived(note_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
-    db_note = db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))).first()
+async def change_status_to_archived(note_id:int,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    db_note = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))))).scalars().first()
     if not db_note:
         raise HTTPException(status_code=404,detail="Note not found into database.")
     db_note.is_archived = not db_note.is_archived
     db.add(db_note)
-    db.commit()
+    await db.commit()
     return {
         "id": db_note.id,
         "title": db_note.title,
@@ -416,15 +779,15 @@ async def change_status_to_archived(note_id:int,dependency:user_dependency,db:Se
     }
 
 @router.get("/notes/all-archived-notes")
-async def get_all_archived_notes(dependency:user_dependency,db:Session=Depends(get_db)):
-    archived_notes = db.query(Notes).filter(Notes.user_id.__eq__(dependency.get("id"))).all()
+async def get_all_archived_notes(dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    archived_notes = (await db.execute(select(Notes).where(Notes.user_id.__eq__(dependency.get("id"))))).scalars().all()
     if not archived_notes:
         raise HTTPException(status_code=404,detail="Archived notes not found!")
     return archived_notes
 
 @router.delete("/notes/{note_id}/tags/{tag_id}")
-async def remove_tag_into_note(note_id:int,tag_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
-    note = db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))).first()
+async def remove_tag_into_note(note_id:int,tag_id:int,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    note = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))))).scalars().first()
     if not note:
         raise HTTPException(status_code=404, detail="Note not found or not authanticated!")
     tag_to_remove = next(
@@ -437,17 +800,17 @@ async def remove_tag_into_note(note_id:int,tag_id:int,dependency:user_dependency
         )
 
     note.tags.remove(tag_to_remove)
-    db.commit()
+    await db.commit()
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.post("/notes/{note_id}/tags/{tag_id}", status_code=status.HTTP_201_CREATED)
-async def add_tag_into_note(note_id: int, tag_id: int, dependency: user_dependency, db: Session = Depends(get_db)):
-    note_model = (db.query(Notes).filter(Notes.id.__eq__(note_id), Notes.user_id.__eq__(dependency.get("id"))).first())
+async def add_tag_into_note(note_id: int, tag_id: int, dependency: user_dependency, db:AsyncSession=Depends(get_async_db)):
+    note_model = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))))).scalars().first()
     if not note_model:
         raise HTTPException(status_code=404, detail="Not bulunamadı veya yetkiniz yok.")
 
-    tag_model = db.query(Tag).filter(Tag.id.__eq__(tag_id)).first()
+    tag_model = (await db.execute(select(Tag).where(Tag.id.__eq__(tag_id)))).scalars().first()
     if not tag_model:
         raise HTTPException(status_code=404, detail="Etiket bulunamadı.")
 
@@ -458,18 +821,18 @@ async def add_tag_into_note(note_id: int, tag_id: int, dependency: user_dependen
         )
 
     note_model.tags.append(tag_model)
-    db.commit()
+    await db.commit()
 
     return {"message": f"'{tag_model.name}' etiketi nota başarıyla eklendi."}
 
 @router.patch("/notes/toggle-pin/{note_id}")
-async def add_pin_to_selected_note(note_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
-    note = db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))).first()
+async def add_pin_to_selected_note(note_id:int,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    note = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))))).scalars().first()
     if not note:
         raise HTTPException(status_code=404,detail="Note not found!")
     note.is_pinned = not note.is_pinned
     db.add(note)
-    db.commit()
+    await db.commit()
     return {
         "title":note.title,
         "content":note.content,
@@ -482,8 +845,8 @@ async def add_pin_to_selected_note(note_id:int,dependency:user_dependency,db:Ses
     }
 
 @router.get("/notes/get-pinned-notes")
-async def get_pinned_notes_from_database(dependency:user_dependency,db:Session=Depends(get_db)):
-    pinned_notes = db.query(Notes).filter(Notes.is_pinned.__eq__(True),Notes.user_id.__eq__(dependency.get("id"))).all()
+async def get_pinned_notes_from_database(dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    pinned_notes = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.is_pinned.__eq__(True),Notes.user_id.__eq__(dependency.get("id"))))).scalars().all()
     if not pinned_notes:
         raise HTTPException(status_code=404,detail="No pinned note here!")
     notes_list = []
@@ -501,26 +864,33 @@ async def get_pinned_notes_from_database(dependency:user_dependency,db:Session=D
     return notes_list
 
 @router.get("/notes/stats")
-async def get_not_stats_from_database(dependency:user_dependency,db:Session=Depends(get_db)):
-    all_notes = db.query(Notes).filter(Notes.user_id.__eq__(dependency.get("id"))).all()
-    pinned_notes = db.query(Notes).filter(Notes.is_pinned.__eq__(True),Notes.user_id.__eq__(dependency.get("id"))).all()
-    archived_notes = db.query(Notes).filter(Notes.is_archived.__eq__(True),Notes.user_id.__eq__(dependency.get("id"))).all()
-    active_notes = db.query(Notes).filter(Notes.is_active.__eq__(True),Notes.user_id.__eq__(dependency.get("id"))).all()
+async def get_not_stats_from_database(dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    # Notlar yüklenmeden tek sorguda sayılır
+    all_notes, pinned_notes, archived_notes, active_notes = (await db.execute(
+        select(
+            func.count(Notes.id),
+            func.count(Notes.id).filter(Notes.is_pinned.__eq__(True)),
+            func.count(Notes.id).filter(Notes.is_archived.__eq__(True)),
+            func.count(Notes.id).filter(Notes.is_active.__eq__(True))
+        ).where(Notes.user_id.__eq__(dependency.get("id")))
+    )).one()
     if not all_notes:
         raise HTTPException(status_code=404,detail="Note not found")
 
     return {
         "Stats":"Note Stats",
-        "all_notes":len(all_notes),
-        "pinned_notes":len(pinned_notes),
-        "archived_notes":len(archived_notes),
-        "active_notes":len(active_notes),
+        "all_notes":all_notes,
+        "pinned_notes":pinned_notes,
+        "archived_notes":archived_notes,
+        "active_notes":active_notes,
         "email":dependency.get("email")
     }
 
 @router.get("/notes/get-note-by-tag-name/{tag_name}")
-async def get_note_by_tag_name_from_database(tag_name:str,dependency:user_dependency,db:Session=Depends(get_db)):
-    note_by_tag_name = db.query(Notes).join(Notes.tags).filter(Tag.name.__eq__(tag_name),Notes.user_id.__eq__(dependency.get("id"))).all()
+async def get_note_by_tag_name_from_database(tag_name:str,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    note_by_tag_name = (await db.execute(
+        select(Notes).join(Notes.tags).options(selectinload(Notes.tags)).where(Tag.name.__eq__(tag_name),Notes.user_id.__eq__(dependency.get("id")))
+    )).scalars().all()
     if not note_by_tag_name:
         raise HTTPException(status_code=404,detail="Notes not found here.")
     note_list = []
@@ -538,8 +908,8 @@ async def get_note_by_tag_name_from_database(tag_name:str,dependency:user_depend
     return note_list
 
 @router.get("/notes/get-all-feature-notes/")
-async def get_all_feature_notes(dependency:user_dependency,db:Session=Depends(get_db)):
-    feature_notes = db.query(Notes).filter(Notes.user_id.__eq__(dependency.get("id")),Notes.is_feature_note.__eq__(True)).all()
+async def get_all_feature_notes(dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    feature_notes = (await db.execute(select(Notes).options(selectinload(Notes.tags)).where(Notes.user_id.__eq__(dependency.get("id")),Notes.is_feature_note.__eq__(True)))).scalars().all()
     if not feature_notes:
         return {
             "notes" : []
@@ -561,32 +931,118 @@ async def get_all_feature_notes(dependency:user_dependency,db:Session=Depends(ge
 
     return notes_list
 
+def _owned_note(db: Session, note_id: int, user_id: int):
+    return db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(user_id)).first()
+
 @router.post("/notes/ai-summary/{note_id}" ,response_model=SummaryResponse)
 async def get_ai_summary(note_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
+    # Sync session'a dokunan kısımlar threadpool'da çalışır; event loop sadece LLM'i bekler
     try:
-        note_fields = db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))).first()
+        note_fields = await run_in_threadpool(_owned_note, db, note_id, dependency.get("id"))
 
         if not note_fields:
             raise HTTPException(status_code=404,detail="Note not found.")
 
-        tags = [t.name for t in note_fields.tags]
-
-        summary = generate_summary(
-            title=note_fields.title,
-            content=note_fields.content,
-            tags=tags
-        )
+        # Not, prompt ve model değişmediyse önbellekteki özet LLM'e gidilmeden döner
+        summary, _ = await ai_cache.get_summary(db, note_fields)
 
         return {"summary":summary}
 
+    except HTTPException:
+        raise
+    except LLMUnavailable as err:
+        raise HTTPException(status_code=503,detail=str(err),headers={"Retry-After":str(int(err.retry_after))})
     except Exception as err:
         raise HTTPException(status_code=500,detail=str(err))
     
+def _sse(payload: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+
+def _summary_inputs(db: Session, note_id: int, user_id: int):
+    # (başlık, içerik, tag'ler, hash, önbellekteki özet); not yoksa None
+    note = _owned_note(db, note_id, user_id)
+    if not note:
+        return None
+    tags = [t.name for t in note.tags]
+    text_hash = ai_cache.input_hash(note.title, note.content, tags)
+    return note.title, note.content, tags, text_hash, ai_cache.lookup(db, note_id, ai_cache.SUMMARY, text_hash)
+
+
+def _store_summary(note_id: int, user_id: int, text_hash: str, summary: str):
+    # İstek oturumu stream sırasında kapanmış olabilir; sonuç ayrı oturumla saklanır
+    db = SessionLocal()
+    try:
+        ai_cache.store(db, note_id, user_id, ai_cache.SUMMARY, text_hash, summary)
+    finally:
+        db.close()
+
+
+@router.post("/notes/ai-summary/{note_id}/stream")
+async def stream_ai_summary(note_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
+    # Özet parçaları Server-Sent Events olarak geldikçe gönderilir; istemci ayrılınca
+    # generator kapanır ve LLM bağlantısı ile slot serbest kalır
+    user_id = dependency.get("id")
+    inputs = await run_in_threadpool(_summary_inputs, db, note_id, user_id)
+    if inputs is None:
+        raise HTTPException(status_code=404,detail="Note not found.")
+
+    title, content, tags, text_hash, cached = inputs
+    if cached is not None:
+        async def cached_events():
+            yield _sse({"delta": cached})
+            yield _sse({"summary": cached, "cached": True}, event="done")
+
+        return StreamingResponse(
+            cached_events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    deltas = stream_summary(
+        title=title,
+        content=content,
+        tags=tags
+    )
+    # İlk parça beklenir; kuyruk ya da devre reddi stream açılmadan 503 olarak döner
+    try:
+        first = await anext(deltas)
+    except StopAsyncIteration:
+        first = ""
+    except LLMUnavailable as err:
+        raise HTTPException(status_code=503,detail=str(err),headers={"Retry-After":str(int(err.retry_after))})
+    except Exception as err:
+        raise HTTPException(status_code=500,detail=str(err))
+
+    async def events():
+        parts = [first]
+        try:
+            yield _sse({"delta": first})
+            async for delta in deltas:
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except LLMUnavailable as err:
+            yield _sse({"detail": str(err)}, event="error")
+            return
+        finally:
+            await deltas.aclose()
+        summary = "".join(parts).strip()
+        await run_in_threadpool(_store_summary, note_id, user_id, text_hash, summary)
+        yield _sse({"summary": summary}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/notes/versions/{note_id}")
-async def get_all_versions(note_id: int,dependency:user_dependency, db: Session = Depends(get_db)):
-    versions = db.query(NoteVersions).filter(
+async def get_all_versions(note_id: int,dependency:user_dependency, db: AsyncSession = Depends(get_async_db)):
+    versions = (await db.execute(select(NoteVersions).where(
         NoteVersions.note_id.__eq__(note_id),NoteVersions.updated_by.__eq__(dependency.get("id"))
-    ).order_by(NoteVersions.version.asc()).all()
+    ).order_by(NoteVersions.version.asc()))).scalars().all()
 
     if not versions:
         return {"data": []}
@@ -604,8 +1060,8 @@ async def get_all_versions(note_id: int,dependency:user_dependency, db: Session
     }
 
 @router.get("/notes/{note_id}/version/{version_id}")
-async def get_version_by_note_id_dependency_with_user_request(note_id:int,version_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
-    version = db.query(NoteVersions).filter(NoteVersions.note_id.__eq__(note_id),NoteVersions.id.__eq__(version_id),NoteVersions.updated_by.__eq__(dependency.get("id"))).first()
+async def get_version_by_note_id_dependency_with_user_request(note_id:int,version_id:int,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    version = (await db.execute(select(NoteVersions).where(NoteVersions.note_id.__eq__(note_id),NoteVersions.id.__eq__(version_id),NoteVersions.updated_by.__eq__(dependency.get("id"))))).scalars().first()
     if not version:
         raise HTTPException(status_code=404,detail="Version not found!")
     return {
@@ -617,7 +1073,7 @@ async def get_version_by_note_id_dependency_with_user_request(note_id:int,versio
     }
 
 @router.post("/notes/{note_id}/restore-version/{version_id}")
-async def restore_version_by_note_id_with_user_dependency(note_id:int,version_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
+def restore_version_by_note_id_with_user_dependency(note_id:int,version_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
     try:
         version = db.query(NoteVersions).filter(NoteVersions.note_id.__eq__(note_id),NoteVersions.id.__eq__(version_id),NoteVersions.updated_by.__eq__(dependency.get("id"))).first()
         note = db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(dependency.get("id"))).first()
@@ -626,8 +1082,15 @@ async def restore_version_by_note_id_with_user_dependency(note_id:int,version_id
         note.title = version.title
         note.content = version.content
         note.created_at = version.created_at
+        fulltext.assign_search_vector(note)
+        needs_embedding = embedding_queue.schedule(db, note)
+        dedup.index_note(db, note)
         db.add(note)
         db.commit()
+        if needs_embedding:
+            embedding_queue.enqueue([note.id])
+        else:
+            vector_indexes.upsert(note.user_id, note.id, note.embedding, note.embedding_model)
         return {
             "message":"Note version restored.",
             "title":note.title,
@@ -639,7 +1102,7 @@ async def restore_version_by_note_id_with_user_dependency(note_id:int,version_id
         raise HTTPException(status_code=400,detail="Someone wrong:"+str(err))
 
 @router.get("/notes/export/{note_id}")
-async def export_note(note_id: int,dependency: user_dependency, format: str = Query("md", regex="^(md|pdf)$", description="Export format: md or pdf"), db: Session = Depends(get_db)):
+def export_note(note_id: int,dependency: user_dependency, format: str = Query("md", regex="^(md|pdf)$", description="Export format: md or pdf"), db: Session = Depends(get_db)):
     note = db.query(Notes).filter(Notes.id.__eq__(note_id), Notes.user_id.__eq__(dependency.get("id"))).first()
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
@@ -691,8 +1154,8 @@ async def export_note(note_id: int,dependency: user_dependency, format: str = Qu
 
 
 @router.post("/notes/import/")
-async def import_note(dependency: user_dependency,file: UploadFile = File(...), db: Session = Depends(get_db)):
-    content_bytes = await file.read()
+def import_note(dependency: user_dependency,file: UploadFile = File(...), db: Session = Depends(get_db)):
+    content_bytes = file.file.read()
     filename = file.filename or "imported_note"
     lower_name = filename.lower()
 
@@ -718,6 +1181,14 @@ async def import_note(dependency: user_dependency,file: UploadFile = File(...),
             content = text
             tags = []
 
+        signature = dedup.signature(content)
+        duplicates = dedup.find_duplicates(db, dependency.get("id"), signature)
+        if duplicates and DUPLICATE_DETECTION == "reject":
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "A near-duplicate note already exists.", "duplicates": [note_id for note_id, _ in duplicates]}
+            )
+
         # create tags if needed
         note_tags = []
         for tag_name in tags:
@@ -729,19 +1200,24 @@ async def import_note(dependency: user_dependency,file: UploadFile = File(...),
                 db.refresh(tag)
             note_tags.append(tag)
 
-        embedding_byte = get_embedding(content)
-
         db_note = Notes(
             title=title,
             content=content,
             tags=note_tags,
-            embedding=embedding_byte,
             user_id=dependency.get("id")
         )
+        fulltext.assign_search_vector(db_note)
+        needs_embedding = embedding_queue.schedule(db, db_note)
 
         db.add(db_note)
+        db.flush()
+        dedup.index_note(db, db_note, signature)
         db.commit()
         db.refresh(db_note)
+        if needs_embedding:
+            embedding_queue.enqueue([db_note.id])
+        else:
+            vector_indexes.upsert(db_note.user_id, db_note.id, db_note.embedding, db_note.embedding_model)
 
         return {
             "id": db_note.id,
@@ -750,9 +1226,13 @@ async def import_note(dependency: user_dependency,file: UploadFile = File(...),
             "tags": [{"id": tag.id, "name": tag.name} for tag in db_note.tags],
             "created_at": db_note.created_at,
             "updated_at": db_note.updated_at,
-            "is_active": db_note.is_active
+            "is_active": db_note.is_active,
+            "embedding_status": db_note.embedding_status,
+            "duplicates": [{"id": note_id, "similarity": sim} for note_id, sim in duplicates]
         }
 
+    except HTTPException:
+        raise
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON file")
     except Exception as err:
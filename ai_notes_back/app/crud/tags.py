@@ -1,15 +1,22 @@
 from typing import Annotated
 
-from fastapi import APIRouter,Depends,HTTPException
+from fastapi import APIRouter,Depends,HTTPException,Body
+from starlette.concurrency import run_in_threadpool
 
+from sqlalchemy import select, func, and_
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from.users import get_current_user
 
-from app.api.ai_tags import generate_tags
+from app.api.llm_client import LLMUnavailable
 
-from app.core.schemes import TagCreateRequest
-from app.core.database import get_db
-from app.core.model import Tag,Notes
+from app.core.schemes import TagCreateRequest, AutoTagRequest
+from app.core.database import get_db, get_async_db
+from app.core.model import Tag,Notes,AutoTagJobs,note_tags
+from app.core.vector_index import forget_notes
+from app.core.tag_suggest import suggest_tags
+from app.core import ai_cache
+from app.core.auto_tag import create_job, job_status
 
 
 router = APIRouter(
@@ -19,9 +26,18 @@ router = APIRouter(
 
 user_dependency = Annotated[dict,Depends(get_current_user)]
 
+
+def _tag_usage_query(user_id: int):
+    # Kullanıcının tag'leri ve her birine bağlı kendi not sayısı; tek sorguda sayılır
+    return select(Tag.id, Tag.name, func.count(Notes.id)).outerjoin(
+        note_tags, note_tags.c.tag_id.__eq__(Tag.id)
+    ).outerjoin(
+        Notes, and_(Notes.id.__eq__(note_tags.c.note_id), Notes.user_id.__eq__(user_id))
+    ).where(Tag.user_id.__eq__(user_id)).group_by(Tag.id, Tag.name).order_by(Tag.id)
+
 @router.post("/tag/create")
-async def create_tag_for_notes_by_user(tag:TagCreateRequest,dependency:user_dependency,db:Session=Depends(get_db)):
-    existing_tag = db.query(Tag).filter(Tag.name.__eq__(tag.name),Tag.user_id.__eq__(dependency.get("id"))).first()
+async def create_tag_for_notes_by_user(tag:TagCreateRequest,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    existing_tag = (await db.execute(select(Tag.id).where(Tag.name.__eq__(tag.name),Tag.user_id.__eq__(dependency.get("id"))))).first()
     if existing_tag:
         raise HTTPException(status_code=400,detail="This tag already exists!")
     tag = Tag(
@@ -29,8 +45,8 @@ async def create_tag_for_notes_by_user(tag:TagCreateRequest,dependency:user_depe
         user_id=dependency.get("id")
     )
     db.add(tag)
-    db.commit()
-    db.refresh(tag)
+    await db.commit()
+    await db.refresh(tag)
     return {
         "message" : "Tag addition create successfully!",
         "id" : tag.id,
@@ -39,7 +55,8 @@ async def create_tag_for_notes_by_user(tag:TagCreateRequest,dependency:user_depe
     }
 
 @router.delete("/tag/delete/{tag_id}")
-async def delete_tag_by_user_request(tag_id: int, dependency: user_dependency, db: Session = Depends(get_db)):
+def delete_tag_by_user_request(tag_id: int, dependency: user_dependency, db: Session = Depends(get_db)):
+    # tag.notes / note.tags lazy yüklenir; sync oturumla threadpool'da çalışır
     tag = db.query(Tag).filter(
         Tag.id.__eq__(tag_id),
         Tag.user_id.__eq__(dependency.get("id"))
@@ -65,6 +82,7 @@ async def delete_tag_by_user_request(tag_id: int, dependency: user_dependency, d
     db.delete(tag)
 
     db.commit()
+    forget_notes(dependency.get("id"), [note.id for note in notes_to_delete])
 
     return {
         "message": "Tag and related notes deleted successfully!",
@@ -78,39 +96,33 @@ async def delete_tag_by_user_request(tag_id: int, dependency: user_dependency, d
     }
 
 @router.get("/tag/get-all-tags")
-async def get_all_tags_by_user(dependency:user_dependency,db:Session=Depends(get_db)):
-    db_tags = db.query(Tag).filter(Tag.user_id.__eq__(dependency.get("id"))).all()
+async def get_all_tags_by_user(dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    db_tags = (await db.execute(_tag_usage_query(dependency.get("id")))).all()
     if not db_tags:
         return {
             "tags": []
         }
 
-    result = []
-    for tag in db_tags:
-        count = sum(1 for note in tag.notes if note.user_id == dependency.get("id"))
-        result.append({
-            "id": tag.id,
-            "name": tag.name,
-            "usage_count": count
-        })
-
-    return result
+    return [
+        {"id": tag_id, "name": name, "usage_count": count}
+        for tag_id, name, count in db_tags
+    ]
 
 @router.get("/tag/get-tag-by-id/{tag_id}")
-async def get_tag_by_id(tag_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
-    db_tag = db.query(Tag).filter(Tag.id.__eq__(tag_id),Tag.user_id.__eq__(dependency.get("id"))).first()
+async def get_tag_by_id(tag_id:int,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    db_tag = (await db.execute(select(Tag).where(Tag.id.__eq__(tag_id),Tag.user_id.__eq__(dependency.get("id"))))).scalars().first()
     if not db_tag:
         raise HTTPException(status_code=404,detail="Tag not found into database.")
     return db_tag
 
 @router.put("/tag/update-tag/{tag_id}")
-async def update_tag_by_id(tag_id:int,request:TagCreateRequest,dependency:user_dependency,db:Session=Depends(get_db)):
-    db_tag = db.query(Tag).filter(Tag.id.__eq__(tag_id),Tag.user_id.__eq__(dependency.get("id"))).first()
+async def update_tag_by_id(tag_id:int,request:TagCreateRequest,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    db_tag = (await db.execute(select(Tag).where(Tag.id.__eq__(tag_id),Tag.user_id.__eq__(dependency.get("id"))))).scalars().first()
     if not db_tag:
         raise HTTPException(status_code=404,detail="Tag not found from database.")
     db_tag.name = request.name
     db.add(db_tag)
-    db.commit()
+    await db.commit()
     return {
         "message" : "Updated successfully!",
         "id" : db_tag.id,
@@ -119,65 +131,93 @@ async def update_tag_by_id(tag_id:int,request:TagCreateRequest,dependency:user_d
     }
 
 @router.post("/tag/add-global-tag")
-async def add_global_tag_into_table(request:TagCreateRequest,db:Session=Depends(get_db)):
+async def add_global_tag_into_table(request:TagCreateRequest,db:AsyncSession=Depends(get_async_db)):
     tag = Tag(
         name=request.name,
         is_global = True
     )
     db.add(tag)
-    db.commit()
-    db.refresh(tag)
+    await db.commit()
+    await db.refresh(tag)
     return {
         "name":tag.name,
         "is_global":tag.is_global,
         "created_at":tag.created_at
     }
 
+def _local_tag_suggestions(db: Session, note_id: int, user_id: int):
+    # Önce komşu notların tag'leri denenir; index kurulumu gerekebileceği için threadpool'da çalışır
+    note = db.query(Notes).filter(Notes.id.__eq__(note_id),Notes.user_id.__eq__(user_id)).first()
+    if not note:
+        return None, [], False
+    suggestions, confident = suggest_tags(db, note)
+    return note, suggestions, confident
+
 @router.post("/tags/generate-ai-tag/{note_id}")
 async def get_ai_tags(note_id:int,dependency:user_dependency,db:Session=Depends(get_db)):
     try:
-        request = db.query(Notes).filter(Notes.id.__eq__(note_id),Tag.user_id.__eq__(dependency.get("id"))).first()
+        request, suggestions, confident = await run_in_threadpool(_local_tag_suggestions, db, note_id, dependency.get("id"))
         if not request:
             raise HTTPException(status_code=404,detail="Note not found.")
-        tags = [t.name for t in request.tags]
-
-        generate_ai_tags = generate_tags(
-            title=request.title,
-            content=request.content,
-            tags=tags
-        )
-        return generate_ai_tags
+
+        # Güven düşükse LLM çağrılır; event loop sadece bu çağrıyı bekler
+        if confident:
+            return {
+                "tags": [name for name, _ in suggestions],
+                "scores": {name: round(score, 3) for name, score in suggestions},
+                "source": "local"
+            }
+
+        tags, cached = await ai_cache.get_tags(db, request)
+        return {"tags": tags, "source": "cache" if cached else "llm"}
+    except HTTPException:
+        raise
+    except LLMUnavailable as e:
+        raise HTTPException(status_code=503,detail=str(e),headers={"Retry-After":str(int(e.retry_after))})
     except Exception as e:
         raise HTTPException(status_code=500,detail=str(e))
 
+@router.post("/tags/auto-tag", status_code=202)
+async def start_auto_tag_job(dependency:user_dependency,request:AutoTagRequest=Body(default=AutoTagRequest()),db:Session=Depends(get_db)):
+    # Tag'i olmayan notlar arka planda toplu olarak etiketlenir; ilerleme durum endpoint'inden izlenir
+    job = await run_in_threadpool(create_job, db, dependency.get("id"), request.max_requests)
+    return job_status(job)
+
+@router.get("/tags/auto-tag/{job_id}")
+async def get_auto_tag_job(job_id:int,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    job = (await db.execute(select(AutoTagJobs).where(AutoTagJobs.id.__eq__(job_id),AutoTagJobs.user_id.__eq__(dependency.get("id"))))).scalars().first()
+    if not job:
+        raise HTTPException(status_code=404,detail="Job not found.")
+    return job_status(job)
+
 @router.get("/tag/search")
-async def search_tags(query: str,dependency:user_dependency,db: Session = Depends(get_db)):
-    return db.query(Tag).filter(Tag.name.ilike(f"%{query}%"),Tag.user_id.__eq__(dependency.get("id"))).all()
+async def search_tags(query: str,dependency:user_dependency,db: AsyncSession = Depends(get_async_db)):
+    return (await db.execute(select(Tag).where(Tag.name.ilike(f"%{query}%"),Tag.user_id.__eq__(dependency.get("id"))))).scalars().all()
 
 @router.get("/tag/{tag_id}/stats")
 async def get_tag_stats(
     tag_id: int,
     dependency: user_dependency,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    tag = db.query(Tag).filter(
+    tag = (await db.execute(select(Tag).where(
         Tag.id.__eq__(tag_id),
         Tag.user_id.__eq__(dependency.get("id"))
-    ).first()
+    ))).scalars().first()
 
     if not tag:
         raise HTTPException(status_code=404, detail="Tag not found")
 
-    notes = [note for note in tag.notes if note.user_id == dependency.get("id")]
-
-    last_used_at = (
-        max((note.updated_at for note in notes), default=None)
-    )
+    notes_count, last_used_at = (await db.execute(
+        select(func.count(Notes.id), func.max(Notes.updated_at))
+        .join(note_tags, note_tags.c.note_id.__eq__(Notes.id))
+        .where(note_tags.c.tag_id.__eq__(tag.id), Notes.user_id.__eq__(dependency.get("id")))
+    )).one()
 
     return {
         "tag_id": tag.id,
         "name": tag.name,
-        "notes_count": len(notes),
+        "notes_count": notes_count,
         "last_used_at": last_used_at,
         "created_at": tag.created_at
     }
@@ -185,26 +225,14 @@ async def get_tag_stats(
 @router.get("/tags/most-used")
 async def most_used_tags(
     dependency: user_dependency,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    tags = db.query(Tag).filter(
-        Tag.user_id.__eq__(dependency.get("id"))
-    ).all()
-
-    result = []
-
-    for tag in tags:
-        count = sum(
-            1 for note in tag.notes
-            if note.user_id == dependency.get("id")
-        )
-
-        if count > 0:
-            result.append({
-                "id": tag.id,
-                "name": tag.name,
-                "usage_count": count
-            })
+    tags = (await db.execute(_tag_usage_query(dependency.get("id")))).all()
+
+    result = [
+        {"id": tag_id, "name": name, "usage_count": count}
+        for tag_id, name, count in tags if count > 0
+    ]
 
     result.sort(key=lambda x: x["usage_count"], reverse=True)
 
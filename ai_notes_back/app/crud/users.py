@@ -1,6 +1,8 @@
 import uuid
 from fastapi import APIRouter,HTTPException,Depends,Body,Response,Cookie
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm,OAuth2PasswordBearer
 from app.core.schemes import UserRequest,Token, UpdateUserRequest,RequestPasswordResetSchema,ResetPasswordSchema, \
     ResetPasswordRequestProfile
@@ -10,7 +12,7 @@ from typing import Annotated
 import datetime
 from datetime import timezone,timedelta,datetime
 from jose import jwt,JWTError
-from app.core.database import get_db
+from app.core.database import get_async_db
 from fastapi.responses import JSONResponse
 import random
 
@@ -57,14 +59,14 @@ def create_refresh_token(email:str,user_id:int,role:str):
     encode.update({"exp":expire})
     return jwt.encode(encode,REFRESH_TOKEN_SECRET_KEY,algorithm=ALGORITHM)
 
-async def get_current_user( token : Annotated[str,Depends(oauth2_bearer)],db:Session=Depends(get_db)):
+async def get_current_user( token : Annotated[str,Depends(oauth2_bearer)],db:AsyncSession=Depends(get_async_db)):
     try:
         payload = jwt.decode(token,ACCESS_TOKEN_SECRET_KEY,algorithms=ALGORITHM)
         email : str = payload.get("sub")
         user_id :int = payload.get('id')
         if email is None or user_id is None:
             raise HTTPException(status_code=401,detail="Could not validate user.")
-        blacklisted = db.query(TokenBlacklist).filter_by(token=token).first()
+        blacklisted = (await db.execute(select(TokenBlacklist.id).filter_by(token=token))).first()
         if blacklisted:
             raise HTTPException(status_code=401, detail="Token has been revoked")
         return {'email':email,"id":user_id}
@@ -74,13 +76,13 @@ async def get_current_user( token : Annotated[str,Depends(oauth2_bearer)],db:Ses
 user_dependency = Annotated[dict,Depends(get_current_user)]
 
 @router.post("/user/register/")
-async def register(request:UserRequest,db:Session=Depends(get_db)):
+async def register(request:UserRequest,db:AsyncSession=Depends(get_async_db)):
     # Check for existing email or username
-    existing_email = db.query(Users).filter(Users.email.__eq__(request.email)).first()
+    existing_email = (await db.execute(select(Users.id).where(Users.email.__eq__(request.email)))).first()
     if existing_email:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    existing_username = db.query(Users).filter(Users.username.__eq__(request.username)).first()
+    existing_username = (await db.execute(select(Users.id).where(Users.username.__eq__(request.username)))).first()
     if existing_username:
         raise HTTPException(status_code=400, detail="Username already taken")
 
@@ -89,14 +91,15 @@ async def register(request:UserRequest,db:Session=Depends(get_db)):
         surname = request.surname,
         username = request.username,
         email = request.email,
-        password_hash = bcrypt_context.hash(request.password_hash),
+        # bcrypt CPU'ya bağlı ve yavaş; event loop'u bloklamaması için thread'de çalışır
+        password_hash = await run_in_threadpool(bcrypt_context.hash, request.password_hash),
         role = request.role,
         phone_number = request.phone_number
 
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return {
         "id": user.id,
         "name": user.name,
@@ -112,13 +115,13 @@ async def register(request:UserRequest,db:Session=Depends(get_db)):
 async def reset_password_to_profile(
         reset_request: ResetPasswordRequestProfile,
         dependency: user_dependency,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(Users).filter(Users.id.__eq__(dependency.get("id"))).first()
+    user = (await db.execute(select(Users).where(Users.id.__eq__(dependency.get("id"))))).scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not bcrypt_context.verify(reset_request.old_password, user.password_hash):
+    if not await run_in_threadpool(bcrypt_context.verify, reset_request.old_password, user.password_hash):
         raise HTTPException(status_code=400, detail="Old password is not correct")
 
     if reset_request.new_password != reset_request.confirm_password:
@@ -127,18 +130,17 @@ async def reset_password_to_profile(
     if reset_request.old_password == reset_request.new_password:
         raise HTTPException(status_code=400, detail="New password must differ from old password")
 
-    user.password_hash = bcrypt_context.hash(reset_request.new_password)
+    user.password_hash = await run_in_threadpool(bcrypt_context.hash, reset_request.new_password)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
 
     return JSONResponse(status_code=200, content={"detail": "Password updated successfully"})
 
 @router.post("/user/login/")
-async def login(form_data: OAuth2PasswordRequestForm = Depends(),db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(),db: AsyncSession = Depends(get_async_db)):
 
-    user = db.query(Users).filter(Users.email.__eq__(form_data.username)).first()
-    if not user or not bcrypt_context.verify(form_data.password, user.password_hash):
+    user = (await db.execute(select(Users).where(Users.email.__eq__(form_data.username)))).scalars().first()
+    if not user or not await run_in_threadpool(bcrypt_context.verify, form_data.password, user.password_hash):
         raise HTTPException(status_code=401, detail="User or password is incorrect")
 
     token = create_access_token(user.email, user.id, user.role,timedelta(minutes=1440))
@@ -157,7 +159,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(),db: Session = D
     )
 
     db.add(refresh_token_type)
-    db.commit()
+    await db.commit()
 
     return {
         "access_token": token,
@@ -174,16 +176,16 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(),db: Session = D
 
 
 @router.post("/refresh-token/")
-async def refresh_token_endpoint(refresh_token: str = Body(..., embed=True), db: Session = Depends(get_db)):
+async def refresh_token_endpoint(refresh_token: str = Body(..., embed=True), db: AsyncSession = Depends(get_async_db)):
     try:
         payload = jwt.decode(refresh_token, REFRESH_TOKEN_SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         raise HTTPException(401, detail="Invalid refresh token")
     
-    if db.query(TokenBlacklist).filter_by(jti=payload['jti']).first():
+    if (await db.execute(select(TokenBlacklist.id).filter_by(jti=payload['jti']))).first():
         raise HTTPException(401, detail="Token revoked")
     
-    user = db.query(Users).filter_by(id=payload['id']).first()
+    user = (await db.execute(select(Users).filter_by(id=payload['id']))).scalars().first()
     if not user:
         raise HTTPException(404, detail="User not found")
     
@@ -199,8 +201,8 @@ async def refresh_token_endpoint(refresh_token: str = Body(..., embed=True), db:
 
 
 @router.patch("/users/update-user/")
-async def update_user_for_profile_page(profile_request:UpdateUserRequest,dependency:user_dependency,db:Session=Depends(get_db)):
-    user = db.query(Users).filter_by(id=dependency.get("id")).first()
+async def update_user_for_profile_page(profile_request:UpdateUserRequest,dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    user = (await db.execute(select(Users).filter_by(id=dependency.get("id")))).scalars().first()
     if not user:
         raise HTTPException(status_code=400,detail="User Not Found!")
 
@@ -211,7 +213,7 @@ async def update_user_for_profile_page(profile_request:UpdateUserRequest,depende
     user.username = profile_request.username
     if email_changed:
         user.email = profile_request.email
-        active_refresh = db.query(Token).filter_by(user_id=user.id, token_type="refresh_token").first()
+        active_refresh = (await db.execute(select(Token).filter_by(user_id=user.id, token_type="refresh_token"))).scalars().first()
         if active_refresh:
             blacklisted_token = TokenBlacklist(
                 jti=active_refresh.jti,
@@ -234,7 +236,7 @@ async def update_user_for_profile_page(profile_request:UpdateUserRequest,depende
 
 
     db.add(user)
-    db.commit()
+    await db.commit()
     response = {
         "name":user.name,
         "surname":user.surname,
@@ -251,8 +253,8 @@ async def update_user_for_profile_page(profile_request:UpdateUserRequest,depende
     return response
 
 @router.post("/users/request-password-reset/")
-async def request_password_reset(payload: RequestPasswordResetSchema, response: Response, db: Session = Depends(get_db)):
-    user = db.query(Users).filter_by(email=payload.email).first()
+async def request_password_reset(payload: RequestPasswordResetSchema, response: Response, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(Users).filter_by(email=payload.email))).scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -286,7 +288,7 @@ async def reset_password(
     payload: ResetPasswordSchema,
     reset_otp: str = Cookie(None),
     reset_email: str = Cookie(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not reset_email or not reset_otp:
         raise HTTPException(status_code=400, detail="OTP cookie missing")
@@ -308,16 +310,16 @@ async def reset_password(
     if len(payload.new_password) < 8:
         raise HTTPException(status_code=400, detail="Password too short (min 8 chars)")
 
-    user = db.query(Users).filter_by(email=reset_email).first()
+    user = (await db.execute(select(Users).filter_by(email=reset_email))).scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if bcrypt_context.verify(payload.new_password, user.password_hash):
+    if await run_in_threadpool(bcrypt_context.verify, payload.new_password, user.password_hash):
         raise HTTPException(status_code=400, detail="New password must not equal old password")
 
     # Şifreyi güncelle
-    user.password_hash = bcrypt_context.hash(payload.new_password)
+    user.password_hash = await run_in_threadpool(bcrypt_context.hash, payload.new_password)
     db.add(user)
-    db.commit()
+    await db.commit()
 
     # OTP bir kere kullanıldı
     del otp_store[reset_email]
@@ -325,23 +327,23 @@ async def reset_password(
     return {"detail": "Password reset successful"}
 
 @router.post("/users/logout/")
-async def user_logout_with_refresh_token(dependency:user_dependency,db:Session=Depends(get_db)):
+async def user_logout_with_refresh_token(dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
 
     user_id = dependency.get("id")
-    refresh_token_for_user = db.query(Token).filter_by(user_id=user_id,token_type="refresh_token").all()
+    refresh_token_for_user = (await db.execute(select(Token).filter_by(user_id=user_id,token_type="refresh_token"))).scalars().all()
     for rt in refresh_token_for_user:
         black = TokenBlacklist(jti=rt.jti, token=rt.token)
         db.add(black)
-        db.delete(rt)
-    db.commit()
+        await db.delete(rt)
+    await db.commit()
     return {
         "detail": "Successfully logged out from devices",
         "email": dependency.get("email")
     }
 
 @router.get("/users/me")
-async def get_my_user_profile(dependency:user_dependency,db:Session=Depends(get_db)):
-    user = db.query(Users).filter(Users.id.__eq__(dependency.get("id"))).first()
+async def get_my_user_profile(dependency:user_dependency,db:AsyncSession=Depends(get_async_db)):
+    user = (await db.execute(select(Users).where(Users.id.__eq__(dependency.get("id"))))).scalars().first()
     if not user:
         raise HTTPException(status_code=400,detail="User can't get into database.")
 
@@ -1,14 +1,25 @@
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse
 import time
 from app.crud import users
 from app.crud import notes
 from app.core.model import Base
 from app.crud import tags
-from app.core.database import engine
+from app.core.database import engine, async_engine, VECTOR_BACKEND, DB_POOL_TIMEOUT
+from app.core.db_pool import pool_snapshot
 from app.crud.notes import delete_old_soft_deleted_notes
+from app.api.embedding import embedding_cache
+from app.api.llm_client import llm_client
+from app.core.embedding_queue import embedding_queue
+from app.core.embedding_migration import embedding_migrator
+from app.core import related, dedup, topics
+from app.core.ai_cache import summary_precomputer
+from app.core.auto_tag import auto_tagger
 from apscheduler.schedulers.background import BackgroundScheduler
 from fastapi.middleware.cors import CORSMiddleware
 import os
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
 from starlette.datastructures import State
 
@@ -41,8 +52,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if VECTOR_BACKEND == "pgvector":
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+
 Base.metadata.create_all(bind=engine)
 
+@app.exception_handler(PoolTimeoutError)
+async def db_pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # Havuzda boş bağlantı yok; istek kuyrukta beklemek yerine hemen reddedilir
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database is busy, no connection available. Please retry."},
+        headers={"Retry-After": str(max(1, int(DB_POOL_TIMEOUT)))}
+    )
+
 @app.get("/check/heathy/")
 async def healthy():
     return {"status":"healthy"}
@@ -81,8 +105,29 @@ app.include_router(tags.router)
 
 scheduler = BackgroundScheduler()
 scheduler.add_job(delete_old_soft_deleted_notes, 'interval', days=1)
+scheduler.add_job(embedding_queue.enqueue_pending, 'interval', minutes=10)
+scheduler.add_job(related.rebuild_all, 'interval', days=1)
+scheduler.add_job(dedup.rebuild_all, 'interval', days=1)
+scheduler.add_job(topics.rebuild_all, 'interval', days=1)
 scheduler.start()
 
+embedding_migrator.prepare()
+embedding_queue.enqueue_pending()
+embedding_queue.start()
+embedding_migrator.start()
+
+
+@app.on_event("startup")
+async def start_summary_precompute():
+    # LLM istemcisiyle aynı event loop'ta çalışması için uygulama başlarken kurulur
+    summary_precomputer.start()
+    auto_tagger.start()
+
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
+
 
 @app.get('/system/health/detailed')
 async def system_health_detailed():
@@ -139,5 +184,14 @@ async def system_metrics():
         'average_response_time': avg_time,
         'error_count': m.get('errors', 0),
         'most_used_endpoint': most_used,
-        'paths': by_path_summary
+        'paths': by_path_summary,
+        'embedding_cache': embedding_cache.snapshot(),
+        'embedding_queue': embedding_queue.snapshot(),
+        'embedding_migration': embedding_migrator.snapshot(),
+        'llm': llm_client.snapshot(),
+        'summary_precompute': summary_precomputer.snapshot(),
+        'db_pool': {
+            'sync': pool_snapshot(engine.pool),
+            'async': pool_snapshot(async_engine.sync_engine.pool)
+        }
     }
@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+# Çalışan bir API'ye eşzamanlı okuma istekleri gönderip throughput ve gecikmeyi ölçer.
+# Aynı sırada health endpoint'ine atılan yoklamalar, DB beklerken event loop'un ne kadar
+# bloklandığını gösterir.
+#   uvicorn app.main:app --port 8000
+#   python benchmarks/db_concurrency.py --url http://127.0.0.1:8000 --seed 200
+
+ENDPOINTS = [
+    "/notes/notes/get-all-notes/",
+    "/notes/notes/stats",
+    "/notes/notes/get-pinned-notes",
+    "/tags/tag/get-all-tags",
+    "/tags/tags/most-used",
+    "/auth/users/me",
+]
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    response = await client.post("/auth/user/login/", data={"username": email, "password": password})
+    if response.status_code == 401:
+        await client.post("/auth/user/register/", json={
+            "name": "Bench",
+            "surname": "Mark",
+            "username": email.split("@")[0],
+            "email": email,
+            "password_hash": password
+        })
+        response = await client.post("/auth/user/login/", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def seed(client: httpx.AsyncClient, count: int):
+    existing = (await client.get("/notes/notes/get-all-notes/")).json()
+    have = len(existing) if isinstance(existing, list) else 0
+    for i in range(have, count):
+        note = (await client.post("/notes/notes/create-note/", json={
+            "title": f"Bench note {i}",
+            "content": f"benchmark note number {i} about topic {i % 17}",
+            "tags": [f"bench-{i % 10}"]
+        })).json()
+        if i % 5 == 0:
+            await client.patch(f"/notes/notes/toggle-pin/{note['id']}")
+
+
+async def worker(client: httpx.AsyncClient, deadline: float, index: int, latencies: list, errors: list):
+    i = index
+    while time.perf_counter() < deadline:
+        path = ENDPOINTS[i % len(ENDPOINTS)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as err:
+            errors.append(type(err).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def probe(client: httpx.AsyncClient, deadline: float, samples: list, errors: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            await client.get("/check/heathy/")
+        except httpx.HTTPError as err:
+            errors.append(type(err).__name__)
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+
+
+def _ms(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 2, max_keepalive_connections=args.concurrency + 2)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        token = await login(client, args.email, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+        if args.seed:
+            await seed(client, args.seed)
+
+        # Isınma: bağlantılar ve sorgu planları hazırlanır
+        for path in ENDPOINTS:
+            await client.get(path)
+
+        latencies, errors, probes, probe_errors = [], [], [], []
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        await asyncio.gather(
+            probe(client, deadline, probes, probe_errors),
+            *(worker(client, deadline, i, latencies, errors) for i in range(args.concurrency))
+        )
+        elapsed = time.perf_counter() - started
+
+    print(f"concurrency={args.concurrency} duration={elapsed:.1f}s requests={len(latencies)} errors={len(errors)}")
+    print(f"throughput={len(latencies) / elapsed:.1f} req/s")
+    print(f"latency ms: p50={_ms(latencies, 0.5)} p95={_ms(latencies, 0.95)} p99={_ms(latencies, 0.99)} "
+          f"mean={round(statistics.fmean(latencies) * 1000, 1) if latencies else 0}")
+    print(f"health ms under load: p50={_ms(probes, 0.5)} p95={_ms(probes, 0.95)} max={_ms(probes, 1.0)} errors={len(probe_errors)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent read throughput of the notes API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", default="bench@example.com")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0, help="Kullanıcının en az bu kadar notu olacak şekilde not oluşturur")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+# Uygulama modülleri import edilmeden önce geçici bir SQLite veritabanı ve ağ gerektirmeyen provider seçilir
+_db_dir = tempfile.mkdtemp()
+os.environ["POSTGRES_SQL_DB_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["EMBEDDING_PROVIDER"] = "hashing"
+os.environ["VECTOR_BACKEND"] = "memory"
+
+import pytest
+
+from app.core.database import Base, engine, SessionLocal
+from app.core.model import Users
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def user(db):
+    user = Users(name="Test", surname="User", username="test", email="test@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
@@ -0,0 +1,53 @@
+import numpy as np
+
+from app.core.vector_index import ChunkIndex, VECTOR_RESCORE_FACTOR, search_chunks, search_chunks_many
+
+DIM = 16
+
+
+def _index_with_dominant_note(chunks_per_note: int) -> tuple[ChunkIndex, np.ndarray]:
+    rng = np.random.default_rng(0)
+    query = rng.normal(size=DIM).astype(np.float32)
+    index = ChunkIndex(DIM, "test")
+    chunk_id = 0
+    # Not 1'in bütün parçaları sorguya diğer notlardan daha yakın
+    chunks = []
+    for _ in range(chunks_per_note):
+        chunk_id += 1
+        chunks.append((chunk_id, query + rng.normal(scale=0.01, size=DIM).astype(np.float32)))
+    index.replace_note(1, chunks)
+    for note_id in range(2, 12):
+        chunk_id += 1
+        index.replace_note(note_id, [(chunk_id, rng.normal(size=DIM).astype(np.float32))])
+    return index, query
+
+
+def test_search_chunks_returns_k_notes_when_one_note_has_many_chunks():
+    k = 5
+    index, query = _index_with_dominant_note(chunks_per_note=k * VECTOR_RESCORE_FACTOR * 3)
+
+    hits = search_chunks(index, query, k=k, exact=True)
+
+    assert len(hits) == k
+    assert hits[0][0] == 1
+    assert len({note_id for note_id, _ in hits}) == k
+
+
+def test_search_chunks_offset_and_exhausted_index():
+    index, query = _index_with_dominant_note(chunks_per_note=100)
+
+    page = search_chunks(index, query, k=4, offset=4, exact=True)
+    assert len(page) == 4
+    # Index'teki not sayısından fazlası istenirse olan notların hepsi döner
+    assert len(search_chunks(index, query, k=50, exact=True)) == 11
+
+
+def test_search_chunks_many_widens_per_query():
+    k = 5
+    index, query = _index_with_dominant_note(chunks_per_note=k * VECTOR_RESCORE_FACTOR * 3)
+    other = np.random.default_rng(1).normal(size=DIM).astype(np.float32)
+
+    results = search_chunks_many(index, np.stack([query, other]), k=k, exact=True)
+
+    assert [len(hits) for hits in results] == [k, k]
+    assert all(len({note_id for note_id, _ in hits}) == k for hits in results)
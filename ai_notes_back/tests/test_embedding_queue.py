@@ -0,0 +1,81 @@
+from app.api.embedding import content_hash
+from app.core import embedding_queue as queue_module
+from app.core.database import SessionLocal
+from app.core.embedding_queue import EmbeddingQueue
+from app.core.model import Notes
+from app.core.schemes import EmbeddingStatusEnum
+
+
+def _pending_note(db, user, content: str) -> Notes:
+    note = Notes(user_id=user.id, title="note", content=content,
+                 embedding_status=EmbeddingStatusEnum.PENDING.value)
+    db.add(note)
+    db.commit()
+    return note
+
+
+def _edit(note_id: int, content: str):
+    # Kullanıcının update endpoint'i: içerik değişir, not tekrar pending olur
+    db = SessionLocal()
+    try:
+        note = db.get(Notes, note_id)
+        note.content = content
+        note.embedding_status = EmbeddingStatusEnum.PENDING.value
+        db.commit()
+    finally:
+        db.close()
+
+
+def _reload(note_id: int) -> Notes:
+    db = SessionLocal()
+    try:
+        note = db.get(Notes, note_id)
+        _ = note.embedding
+        db.expunge(note)
+        return note
+    finally:
+        db.close()
+
+
+def test_edit_during_inflight_batch_is_not_overwritten(db, user, monkeypatch):
+    note = _pending_note(db, user, "first version")
+    real_get_embeddings = queue_module.get_embeddings
+
+    def slow_get_embeddings(texts, provider=None):
+        embeddings = real_get_embeddings(texts, provider=provider)
+        # Provider cevap verirken not düzenlenir
+        _edit(note.id, "second version")
+        return embeddings
+
+    monkeypatch.setattr(queue_module, "NOTE_CHUNKING", False)
+    monkeypatch.setattr(queue_module, "get_embeddings", slow_get_embeddings)
+    worker = EmbeddingQueue()
+    worker.process([note.id])
+
+    stale = _reload(note.id)
+    assert stale.embedding_status == EmbeddingStatusEnum.PENDING.value
+    assert stale.embedding is None
+    assert stale.content == "second version"
+    # Not güncel içerikle tekrar işlenmek üzere kuyruğa alınır
+    assert worker._queue.get_nowait() == note.id
+
+    monkeypatch.setattr(queue_module, "get_embeddings", real_get_embeddings)
+    worker.process([note.id])
+
+    fresh = _reload(note.id)
+    assert fresh.embedding_status == EmbeddingStatusEnum.READY.value
+    assert fresh.embedding_hash == content_hash("second version")
+    assert fresh.embedding is not None
+
+
+def test_embedding_write_keeps_updated_at(db, user, monkeypatch):
+    note = _pending_note(db, user, "some content")
+    before = _reload(note.id).updated_at
+
+    monkeypatch.setattr(queue_module, "NOTE_CHUNKING", False)
+    EmbeddingQueue().process([note.id])
+
+    after = _reload(note.id)
+    assert after.embedding_status == EmbeddingStatusEnum.READY.value
+    assert after.embedding_updated_at is not None
+    assert after.updated_at == before